@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from . import presence
+        request_finished.connect(presence.flush_if_due, dispatch_uid='accounts.presence.flush_if_due')
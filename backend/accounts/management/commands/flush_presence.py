@@ -0,0 +1,13 @@
+"""
+Management command для записи накопленной активности пользователей в БД.
+"""
+from django.core.management.base import BaseCommand
+from accounts import presence
+
+
+class Command(BaseCommand):
+    help = 'Записывает накопленные отметки присутствия в User.last_activity'
+
+    def handle(self, *args, **options):
+        count = presence.flush()
+        self.stdout.write(self.style.SUCCESS(f'Обновлена активность {count} пользователей'))
@@ -1,17 +1,16 @@
-from django.utils import timezone
+from . import presence
 
 
 class LastActivityMiddleware:
-    """Update last_activity for authenticated users once per request."""
+    """Отмечает активность авторизованных пользователей в кэше присутствия.
+
+    В БД время активности попадает пакетно, см. accounts.presence.
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            # Lightweight update; DB write each request is acceptable for prototype
-            request.user.last_activity = timezone.now()
-            request.user.save(update_fields=['last_activity'])
+            presence.record_activity(request.user.pk)
         return self.get_response(request)
-
-
@@ -55,13 +55,18 @@ class User(AbstractUser):
         verbose_name="Отчество"
     )
     last_activity = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+    # Меняется при сохранении профиля (не при отметках присутствия): входит в
+    # ETag ответов API, которые выводят данные врача
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
 
     def get_presence_status(self):
         """Возвращает ('online'|'recent'|'offline', emoji)."""
         from django.utils import timezone
-        if not self.last_activity:
+        from .presence import last_seen
+        last_activity = last_seen(self)
+        if not last_activity:
             return ('offline', '⚫')
-        delta = timezone.now() - self.last_activity
+        delta = timezone.now() - last_activity
         if delta.total_seconds() <= 5 * 60:
             return ('online', '🔵')
         if delta.total_seconds() <= 60 * 60:
@@ -0,0 +1,87 @@
+"""
+Учет присутствия пользователей без записи в БД на каждый запрос.
+
+Время последней активности хранится в кэше Django (общем для всех процессов,
+если настроен Redis/Memcached; локальным в памяти по умолчанию). Процесс
+копит изменения и сбрасывает их в User.last_activity одним запросом не чаще
+раза в PRESENCE_FLUSH_INTERVAL секунд.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+CACHE_KEY = 'presence:{}'
+
+# Дольше часа статус все равно 'offline', дальше достаточно значения из БД
+CACHE_TIMEOUT = 60 * 60
+
+# Повторные запросы одного пользователя чаще этого интервала не обновляют кэш
+RESOLUTION_SECONDS = 30
+
+_lock = threading.Lock()
+_pending = {}
+# Время последней отметки пользователя (для RESOLUTION_SECONDS); чистится в flush
+_recorded = {}
+_last_flush = time.monotonic()
+
+
+def flush_interval():
+    return getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 60)
+
+
+def record_activity(user_id, now=None):
+    """Отметить активность пользователя. В БД не пишет."""
+    now = now or timezone.now()
+    with _lock:
+        previous = _recorded.get(user_id)
+        if previous is not None and (now - previous).total_seconds() < RESOLUTION_SECONDS:
+            return
+        _recorded[user_id] = now
+        _pending[user_id] = now
+    cache.set(CACHE_KEY.format(user_id), now, CACHE_TIMEOUT)
+
+
+def flush_due():
+    """Пора ли сбрасывать накопленные отметки в БД."""
+    return bool(_pending) and time.monotonic() - _last_flush >= flush_interval()
+
+
+def flush():
+    """Записать накопленные отметки в User.last_activity. Возвращает число пользователей."""
+    global _last_flush
+    from .models import User
+
+    threshold = timezone.now() - timedelta(seconds=RESOLUTION_SECONDS)
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+        # Старые отметки уже не ограничивают запись, иначе словарь растет со всеми пользователями процесса
+        for user_id in [user_id for user_id, recorded in _recorded.items() if recorded <= threshold]:
+            del _recorded[user_id]
+    if not pending:
+        return 0
+    User.objects.bulk_update(
+        [User(pk=user_id, last_activity=last_activity) for user_id, last_activity in pending.items()],
+        ['last_activity'],
+        batch_size=500,
+    )
+    return len(pending)
+
+
+def last_seen(user):
+    """Время последней активности: из кэша, иначе из БД."""
+    value = cache.get(CACHE_KEY.format(user.pk))
+    if value is None or (user.last_activity and user.last_activity > value):
+        return user.last_activity
+    return value
+
+
+def flush_if_due(**kwargs):
+    """Обработчик request_finished: сброс выполняется после отправки ответа клиенту."""
+    if flush_due():
+        flush()
@@ -1,3 +1,146 @@
-from django.test import TestCase
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from hospitals.models import Hospital
+from patients.benchmark import QueryBudgetMixin
+from patients.models import Case, CaseMessage, MessageReaction, Patient, PatientDoctorRelation
+from . import presence
+from .models import User
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Бюджет SQL-запросов главной страницы, страниц кабинета и API аккаунтов (не зависит от объема данных)."""
+
+    budgets = {
+        'home': 1,
+        'cabinet': 10,
+        'cabinet_admin': 8,
+        'cases': 4,
+        'case_detail': 8,
+        'case_messages': 5,
+        'create_case': 4,
+        'my_patients': 6,
+        'patient_detail': 7,
+        'patient_detail_anonymous': 6,
+        'knowledge_base': 6,
+        'knowledge_base_search': 7,
+        'registration_keys': 6,
+        'api_me': 3,
+    }
+
+
+class ClearMyPatientsTests(TestCase):
+    """Статистика кабинета после отвязки пациентов (update() без сигналов)."""
+
+    def test_cabinet_count_after_clear(self):
+        doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        patient = Patient.objects.create(first_name='Иван', last_name='Иванов', date_of_birth=date(1980, 1, 1), gender='M')
+        PatientDoctorRelation.objects.create(patient=patient, doctor=doctor, is_active=True)
+        self.client.force_login(doctor)
+        self.assertEqual(self.client.get(reverse('accounts:cabinet')).context['total_patients'], 1)
+
+        self.client.post(reverse('accounts:clear_my_patients'))
+
+        self.assertEqual(self.client.get(reverse('accounts:cabinet')).context['total_patients'], 0)
+
+
+class ImportPatientsViewTests(TestCase):
+    """Импорт пациентов администратором больницы."""
+
+    def upload(self, user):
+        self.client.force_login(user)
+        upload = SimpleUploadedFile('patients.csv', 'first_name,last_name,date_of_birth,gender\nИван,Иванов,1980-01-01,M\n'.encode())
+        return self.client.post(reverse('accounts:import_patients'), {'file': upload})
+
+    def test_hospital_admin_imports_into_own_hospital(self):
+        hospital = Hospital.objects.create(name='Городская больница')
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='hospital_admin', hospital=hospital
+        )
+        self.upload(admin)
+        self.assertEqual(Patient.objects.get().hospital, hospital)
+
+    def test_hospital_admin_without_hospital_rejected(self):
+        admin = User.objects.create_user(username='admin', email='admin@example.com', password='x', role='hospital_admin')
+        response = self.upload(admin)
+        self.assertRedirects(response, reverse('accounts:cabinet'), fetch_redirect_response=False)
+        self.assertFalse(Patient.objects.exists())
+
+
+class ToggleReactionViewTests(TestCase):
+    """Ответ переключения реакции - только изменившийся счетчик."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        other = User.objects.create_user(username='other', email='other@example.com', password='x', role='doctor')
+        patient = Patient.objects.create(first_name='Иван', last_name='Иванов', date_of_birth=date(1980, 1, 1), gender='M')
+        case = Case.objects.create(
+            patient=patient, created_by=self.doctor, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        case.doctors.add(self.doctor, other)
+        self.message = CaseMessage.objects.create(case=case, author=other, content='Привет')
+        MessageReaction.objects.create(message=self.message, user=other, reaction='👍')
+        self.client.force_login(self.doctor)
+
+    def toggle(self, reaction):
+        return self.client.post(reverse('accounts:toggle_reaction', args=[self.message.pk]), {'reaction': reaction})
+
+    def test_toggle(self):
+        self.assertEqual(
+            self.toggle('👍').json(), {'success': True, 'action': 'added', 'reaction': '👍', 'count': 2, 'active': True}
+        )
+        self.assertEqual(
+            self.toggle('👎').json(), {'success': True, 'action': 'added', 'reaction': '👎', 'count': 1, 'active': True}
+        )
+        self.assertEqual(
+            self.toggle('👍').json(),
+            {'success': True, 'action': 'removed', 'reaction': '👍', 'count': 1, 'active': False},
+        )
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.likes_count, self.message.dislikes_count), (1, 1))
+
+    def test_invalid_reaction(self):
+        self.assertEqual(self.toggle('❤').status_code, 400)
+
+
+@override_settings(PRESENCE_FLUSH_INTERVAL=0)
+class PresenceTests(TestCase):
+    """Отметки присутствия: ограничение частоты и сброс в БД после запроса."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        cache.clear()
+        presence.flush()
+        presence._recorded.clear()
+
+    def test_throttle(self):
+        now = timezone.now()
+        presence.record_activity(self.doctor.pk, now)
+        presence.record_activity(self.doctor.pk, now + timedelta(seconds=presence.RESOLUTION_SECONDS - 1))
+        self.assertEqual(presence.last_seen(self.doctor), now)
+
+        later = now + timedelta(seconds=presence.RESOLUTION_SECONDS)
+        presence.record_activity(self.doctor.pk, later)
+        self.assertEqual(presence.last_seen(self.doctor), later)
+
+    def test_request_finished_flushes_last_seen(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('accounts:cabinet'))
+
+        self.doctor.refresh_from_db()
+        self.assertIsNotNone(self.doctor.last_activity)
+        self.assertEqual(presence.last_seen(self.doctor), self.doctor.last_activity)
+
+    def test_flush_prunes_recorded(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x', role='doctor')
+        presence.record_activity(self.doctor.pk, timezone.now() - timedelta(seconds=presence.RESOLUTION_SECONDS + 1))
+        presence.record_activity(other.pk)
+        self.assertEqual(presence.flush(), 2)
+        # Отметка старше RESOLUTION_SECONDS больше ничего не ограничивает
+        self.assertEqual(set(presence._recorded), {other.pk})
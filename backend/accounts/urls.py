@@ -5,12 +5,14 @@ from .views import (
     register_view,
     cases_view,
     case_detail_view,
+    case_messages_view,
     toggle_reaction_view,
     create_case_view,
     manage_patient_doctors_view,
     delete_all_cases_view,
     delete_my_cases_view,
     generate_patients_view,
+    import_patients_view,
     clear_my_patients_view,
     generate_doctors_view,
     delete_hospital_cases_view,
@@ -34,6 +36,7 @@ urlpatterns = [
     path('cases/', cases_view, name='cases'),
     path('cases/create/', create_case_view, name='create_case'),
     path('cases/<int:case_id>/', case_detail_view, name='case_detail'),
+    path('cases/<int:case_id>/messages/', case_messages_view, name='case_messages'),
     path('cases/<int:case_id>/complete/', complete_case_view, name='complete_case'),
     path('messages/<int:message_id>/reaction/', toggle_reaction_view, name='toggle_reaction'),
     path('patients/<int:patient_id>/doctors/', manage_patient_doctors_view, name='manage_patient_doctors'),
@@ -41,6 +44,7 @@ urlpatterns = [
     path('tools/delete_all_cases/', delete_all_cases_view, name='delete_all_cases'),
     path('tools/delete_my_cases/', delete_my_cases_view, name='delete_my_cases'),
     path('tools/generate_patients/', generate_patients_view, name='generate_patients'),
+    path('tools/import_patients/', import_patients_view, name='import_patients'),
     path('tools/clear_my_patients/', clear_my_patients_view, name='clear_my_patients'),
     path('tools/generate_doctors/', generate_doctors_view, name='generate_doctors'),
     path('tools/delete_hospital_cases/', delete_hospital_cases_view, name='delete_hospital_cases'),
@@ -7,40 +7,68 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import logout as auth_logout, login as auth_login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case as CaseWhen, Exists, OuterRef, Prefetch, Q, When
 from .models import User, RegistrationKey
 from .serializers import UserSerializer, UserRegistrationSerializer, LoginSerializer
-from patients.models import Patient, MedicalRecord, PatientDoctorRelation, Case, CaseMessage, MessageReaction
+from patients.models import (
+    Patient, MedicalRecord, PatientDoctorRelation, Case, CaseMessage, CaseReadCursor, KnowledgeBaseEntry, MessageReaction
+)
+from patients import access, dashboard, reference_data, search
+from patients.pagination import paginate
+from patients.realtime import message_payload
 from django.http import JsonResponse
 from hospitals.models import Hospital
 from django.core.management import call_command
 from django.utils import timezone
-import json
-from pathlib import Path
+from django.utils.functional import SimpleLazyObject
 from datetime import date
+import csv
 
 
-def get_patient_queryset(user):
-    """Получить queryset пациентов в зависимости от роли пользователя."""
-    if user.role == 'superadmin':
-        return Patient.objects.all()
-    elif user.role == 'hospital_admin':
-        return Patient.objects.filter(hospital=user.hospital)
-    else:  # doctor
-        return Patient.objects.filter(
-            treating_doctors__doctor=user,
-            treating_doctors__is_active=True
-        ).distinct()
+PATIENT_ORDERING = ('last_name', 'first_name', 'id')
+PATIENTS_PAGE_SIZE = 50
 
 
-def get_medical_record_queryset(user):
-    """Получить queryset медицинских карточек в зависимости от роли пользователя."""
-    if user.role == 'superadmin':
-        return MedicalRecord.objects.all()
-    elif user.role == 'hospital_admin':
-        return MedicalRecord.objects.filter(patient__hospital=user.hospital)
-    else:  # doctor
-        return MedicalRecord.objects.filter(doctor=user)
+def paginate_patients(request, queryset):
+    """Страница пациентов по курсору из GET-параметра cursor (некорректный курсор - первая страница)."""
+    try:
+        return paginate(queryset, PATIENT_ORDERING, request.GET.get('cursor'), PATIENTS_PAGE_SIZE)
+    except ValueError:
+        return paginate(queryset, PATIENT_ORDERING, None, PATIENTS_PAGE_SIZE)
+
+
+# Чат консилиума: страница открывается с последними сообщениями, более ранние подгружаются по курсору
+MESSAGE_ORDERING = ('-created_at', '-id')
+CASE_MESSAGES_PAGE_SIZE = 50
+
+
+def case_messages_page(case, user, cursor=None):
+    """Страница сообщений консилиума от новых к старым, начиная с курсора.
+
+    Возвращает KeysetPage, элементы которой уже в хронологическом порядке:
+    {'message', 'is_own', 'reactions', 'user_reactions'}. next_cursor указывает
+    на более ранние сообщения. Поднимает ValueError для некорректного курсора.
+    """
+    page = paginate(
+        case.messages.select_related('author'), MESSAGE_ORDERING, cursor, CASE_MESSAGES_PAGE_SIZE
+    )
+    # Счетчики реакций хранятся в сообщениях; загружаем только реакции текущего пользователя на странице
+    user_reactions = {}
+    for message_id, reaction in MessageReaction.objects.filter(
+        message_id__in=[msg.id for msg in page], user=user
+    ).values_list('message_id', 'reaction'):
+        user_reactions.setdefault(message_id, []).append(reaction)
+    page.items = [
+        {
+            'message': msg,
+            'is_own': msg.author_id == user.id,
+            'reactions': msg.reaction_counts(),
+            'user_reactions': user_reactions.get(msg.id, []),
+        }
+        for msg in reversed(page.items)
+    ]
+    return page
 
 
 @login_required
@@ -48,46 +76,35 @@ def cabinet_view(request):
     """Личный кабинет врача - HTML страница."""
     user = request.user
     
-    patients_queryset = get_patient_queryset(user)
-    records_queryset = get_medical_record_queryset(user)
+    patients_queryset = access.patients_for(user)
+    records_queryset = access.records_for(user)
     
     # Консилиумы врача
     cases_queryset = Case.objects.filter(doctors=user).select_related('patient', 'created_by').prefetch_related('doctors')
     
-    # Статистика
-    total_patients = patients_queryset.count()
-    total_records = records_queryset.count()
-    total_cases = cases_queryset.count()
-    active_cases = cases_queryset.filter(status__in=['urgent', 'monitoring']).count()
-    
-    # Общее количество непрочитанных сообщений
-    total_unread = 0
-    for case in cases_queryset:
-        total_unread += case.get_unread_count(user)
+    # Статистика из снимка в кэше (пересчитывается агрегирующими запросами после изменений)
+    statistics = dashboard.statistics(user)
     
     # Последние 5 консилиумов
     recent_cases = []
-    for case in cases_queryset[:5]:
+    for case in cases_queryset.annotate(unread_count=CaseReadCursor.unread_subquery(user))[:5]:
         recent_cases.append({
             'case': case,
-            'unread_count': case.get_unread_count(user),
+            'unread_count': case.unread_count,
         })
     
-    # Все пациенты
-    all_patients = list(patients_queryset.select_related('hospital'))
+    # Пациенты постранично (keyset по ФИО)
+    patients_page = paginate_patients(request, patients_queryset.select_related('hospital'))
     
     # Последние 5 карточек
     recent_records = list(records_queryset.select_related('patient', 'doctor')[:5])
     
     context = {
         'user': user,
-        'total_patients': total_patients,
-        'total_records': total_records,
-        'total_cases': total_cases,
-        'active_cases': active_cases,
-        'total_unread': total_unread,
+        **statistics,
         'recent_cases': recent_cases,
-        'all_patients': all_patients,
+        'all_patients': patients_page.items,
+        'patients_page': patients_page,
         'recent_records': recent_records,
     }
     
@@ -109,44 +126,33 @@ def cases_view(request):
     
     # Подготовка данных для шаблона
     cases_data = []
-    for case in cases_queryset:
+    for case in cases_queryset.annotate(unread_count=CaseReadCursor.unread_subquery(user)):
         cases_data.append({
             'case': case,
-            'unread_count': case.get_unread_count(user),
-            'doctors': case.doctors.all()[:3],  # Первые 3 врача для аватаров
+            'unread_count': case.unread_count,
+            'doctors': list(case.doctors.all())[:3],  # Первые 3 врача для аватаров (из prefetch)
         })
     
     context = {
         'user': user,
         'cases': cases_data,
         'status_filter': status_filter,
-        'total_cases': cases_queryset.count(),
+        'total_cases': len(cases_data),
     }
     
     return render(request, 'accounts/cases.html', context)
 
 
-def load_consilium_templates():
-    """Загрузить шаблоны консилиумов из JSON файла."""
-    templates_path = Path(__file__).parent.parent / 'patients' / 'consilium_templates.json'
-    try:
-        with open(templates_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        return []
-
-
 @login_required
 def create_case_view(request):
     """Создание нового консилиума."""
     user = request.user
     
-    # Загружаем шаблоны
-    templates = load_consilium_templates()
+    # Шаблоны берем из кэша справочников (вместе с готовым JSON)
+    templates = reference_data.consilium_templates()
     
     # Получаем список пациентов врача
-    patients_queryset = get_patient_queryset(user)
-    patients_list = list(patients_queryset)
+    patients_list = list(access.patients_for(user))
     
     # Получаем список всех врачей для выбора участников
     all_doctors = User.objects.filter(role__in=['doctor', 'hospital_admin', 'superadmin']).exclude(id=user.id)
@@ -170,7 +176,7 @@ def create_case_view(request):
             try:
                 patient = Patient.objects.get(id=patient_id)
                 # Проверяем доступ к пациенту
-                if user.role == 'doctor' and patient not in patients_queryset:
+                if user.role == 'doctor' and not access.for_request(request).can_view_patient(patient.id):
                     errors['patient'] = 'У вас нет доступа к этому пациенту'
             except Patient.DoesNotExist:
                 errors['patient'] = 'Пациент не найден'
@@ -188,10 +194,9 @@ def create_case_view(request):
             errors['doctors'] = 'Необходимо выбрать хотя бы одного врача'
         
         if errors:
-            import json as json_module
             context = {
-                'templates': json_module.dumps(templates, ensure_ascii=False),
-                'templates_list': templates,
+                'templates': templates.json,
+                'templates_list': templates.items,
                 'patients': patients_list,
                 'all_doctors': all_doctors,
                 'errors': errors,
@@ -226,10 +231,9 @@ def create_case_view(request):
             
         except Exception as e:
             messages.error(request, f'Ошибка при создании консилиума: {str(e)}')
-            import json as json_module
             context = {
-                'templates': json_module.dumps(templates, ensure_ascii=False),
-                'templates_list': templates,
+                'templates': templates.json,
+                'templates_list': templates.items,
                 'patients': patients_list,
                 'all_doctors': all_doctors,
                 'errors': {'general': 'Ошибка при создании консилиума'},
@@ -238,10 +242,9 @@ def create_case_view(request):
             return render(request, 'accounts/create_case.html', context)
     
     # GET запрос - показываем форму
-    import json as json_module
     context = {
-        'templates': json_module.dumps(templates, ensure_ascii=False),
-        'templates_list': templates,  # Для отображения в шаблоне
+        'templates': templates.json,
+        'templates_list': templates.items,  # Для отображения в шаблоне
         'patients': patients_list,
         'all_doctors': all_doctors,
     }
@@ -254,33 +257,16 @@ def case_detail_view(request, case_id):
     user = request.user
     
     try:
-        case = Case.objects.prefetch_related('doctors', 'messages__author').get(id=case_id)
+        case = Case.objects.select_related('patient', 'created_by').prefetch_related('doctors').get(id=case_id)
     except Case.DoesNotExist:
         messages.error(request, 'Консилиум не найден.')
         return redirect('accounts:cases')
     
-    # Проверка доступа: завершенные консилиумы доступны всем врачам, активные - только участникам
-    if case.status != 'stable':
-        # Для активных консилиумов проверяем участие
-        has_access = False
-        
-        if user.role == 'superadmin':
-            has_access = True
-        elif user.role == 'hospital_admin' and user.hospital:
-            # Администратор больницы может видеть консилиумы врачей своей больницы
-            if case.patient and case.patient.hospital == user.hospital:
-                has_access = True
-            elif case.doctors.filter(hospital=user.hospital).exists():
-                has_access = True
-            elif case.created_by and case.created_by.hospital == user.hospital:
-                has_access = True
-        elif user in case.doctors.all() or case.created_by == user:
-            # Участник или создатель
-            has_access = True
-        
-        if not has_access:
-            messages.error(request, 'У вас нет доступа к этому консилиуму.')
-            return redirect('accounts:cases')
+    # Права на консилиум вычисляются одним запросом (см. patients.access)
+    permissions = access.for_request(request).case_permissions(case.id)
+    if not permissions.can_view:
+        messages.error(request, 'У вас нет доступа к этому консилиуму.')
+        return redirect('accounts:cases')
     
     # Гарантируем, что создатель присутствует среди участников
     try:
@@ -292,76 +278,70 @@ def case_detail_view(request, case_id):
     # Обработка отправки сообщения
     if request.method == 'POST':
         content = request.POST.get('content', '').strip()
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
         if content:
-            CaseMessage.objects.create(
+            msg = CaseMessage.objects.create(
                 case=case,
                 author=user,
-                content=content,
-                is_read=False
+                content=content
             )
+            if is_ajax:
+                # Остальные участники получат сообщение через WebSocket
+                return JsonResponse({'success': True, 'message': message_payload(msg, case.status)})
             messages.success(request, 'Сообщение отправлено.')
             return redirect('accounts:case_detail', case_id=case_id)
         else:
+            if is_ajax:
+                return JsonResponse({'error': 'Сообщение не может быть пустым.'}, status=400)
             messages.error(request, 'Сообщение не может быть пустым.')
     
-    # Получаем все сообщения с реакциями
-    messages_list = case.messages.all().select_related('author').prefetch_related('reactions__user')
+    # Рендерим только последние сообщения: стоимость страницы не растет с возрастом консилиума.
+    # Выборка ленивая: при попадании в кэш фрагмента чата (ключ - версия консилиума) запросов нет
+    page = SimpleLazyObject(lambda: case_messages_page(case, user))
     
-    # Помечаем сообщения как прочитанные (кроме своих)
-    for msg in messages_list:
-        if msg.author != user and not msg.is_read:
-            msg.is_read = True
-            msg.save()
-    
-    # Подготовка данных для шаблона
-    messages_data = []
-    for msg in messages_list:
-        # Группируем реакции по типу
-        reactions_by_type = {}
-        user_reactions = []
-        for reaction in msg.reactions.all():
-            if reaction.reaction not in reactions_by_type:
-                reactions_by_type[reaction.reaction] = []
-            reactions_by_type[reaction.reaction].append(reaction.user.email)
-            if reaction.user == user:
-                user_reactions.append(reaction.reaction)
-        
-        messages_data.append({
-            'message': msg,
-            'is_own': msg.author == user,
-            'reactions': reactions_by_type,
-            'user_reactions': user_reactions,
-        })
-    
-    # Проверяем, может ли пользователь завершить консилиум
-    can_complete = False
-    if case.status != 'stable':
-        if user.role == 'superadmin':
-            can_complete = True
-        elif user.role == 'hospital_admin' and user.hospital:
-            # Администратор больницы может завершить консилиумы врачей своей больницы
-            if case.patient and case.patient.hospital == user.hospital:
-                can_complete = True
-            elif case.doctors.filter(hospital=user.hospital).exists():
-                can_complete = True
-            elif case.created_by and case.created_by.hospital == user.hospital:
-                can_complete = True
-        elif user in case.doctors.all() or case.created_by == user:
-            # Участник или создатель
-            can_complete = True
+    # Сдвигаем курсор чтения пользователя (одна запись вместо сохранения каждого сообщения)
+    case.mark_read(user)
     
     context = {
         'user': user,
         'case': case,
-        'messages': messages_data,
-        'doctors': list(case.doctors.all().order_by('email')),
-        'unread_count': case.get_unread_count(user),
-        'can_complete': can_complete,
+        'messages_page': page,
+        'doctors': sorted(case.doctors.all(), key=lambda doctor: doctor.email),
+        'permissions': permissions,
+        'can_complete': permissions.can_complete,
     }
     
     return render(request, 'accounts/case_detail.html', context)
 
 
+@login_required
+def case_messages_view(request, case_id):
+    """Более ранние сообщения консилиума (AJAX): страница до курсора cursor."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    permissions = access.for_request(request).case_permissions(case_id)
+    if not permissions.exists:
+        return JsonResponse({'error': 'Case not found'}, status=404)
+    if not permissions.can_view:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    # Права уже загрузили статус, сам консилиум не нужен
+    case = Case(id=case_id, status=permissions.status)
+    try:
+        page = case_messages_page(case, request.user, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    messages_data = []
+    for item in page:
+        payload = message_payload(item['message'], case.status)
+        payload['reactions'] = item['reactions']
+        payload['user_reactions'] = item['user_reactions']
+        messages_data.append(payload)
+    return JsonResponse({'messages': messages_data, 'next': page.next_cursor})
+
+
 @login_required
 def manage_patient_doctors_view(request, patient_id):
     """Управление связями пациент-врач."""
@@ -469,54 +449,38 @@ def toggle_reaction_view(request, message_id):
     try:
         message = CaseMessage.objects.get(id=message_id)
         # Проверяем, что пользователь имеет доступ к консилиуму
-        if request.user not in message.case.doctors.all():
+        if not access.for_request(request).case_permissions(message.case_id).can_react:
             return JsonResponse({'error': 'Access denied'}, status=403)
         
         reaction_type = request.POST.get('reaction', '').strip()
         
-        if reaction_type not in ['👍', '👎']:
+        if reaction_type not in CaseMessage.REACTION_COUNTERS:
             return JsonResponse({'error': 'Invalid reaction'}, status=400)
         
-        # Проверяем, есть ли уже такая реакция от этого пользователя
-        existing_reaction = MessageReaction.objects.filter(
-            message=message,
-            user=request.user,
-            reaction=reaction_type
-        ).first()
-        
-        if existing_reaction:
-            # Удаляем реакцию
-            existing_reaction.delete()
-            action = 'removed'
-        else:
-            # Добавляем реакцию
-            MessageReaction.objects.create(
+        # Повторное нажатие снимает реакцию; счетчик сообщения обновляют сигналы
+        with transaction.atomic():
+            existing_reaction = MessageReaction.objects.select_for_update().filter(
                 message=message,
                 user=request.user,
                 reaction=reaction_type
-            )
-            action = 'added'
-        
-        # Получаем обновленные реакции
-        reactions_by_type = {}
-        user_reactions = []
-        for reaction in message.reactions.all():
-            if reaction.reaction not in reactions_by_type:
-                reactions_by_type[reaction.reaction] = []
-            reactions_by_type[reaction.reaction].append(reaction.user.email)
-            if reaction.user == request.user:
-                user_reactions.append(reaction.reaction)
-        
-        # Преобразуем в формат для JSON (список email'ов)
-        reactions_json = {}
-        for reaction_type, users in reactions_by_type.items():
-            reactions_json[reaction_type] = users
+            ).first()
+            if existing_reaction:
+                existing_reaction.delete()
+                action = 'removed'
+            else:
+                MessageReaction.objects.get_or_create(message=message, user=request.user, reaction=reaction_type)
+                action = 'added'
+            count = CaseMessage.objects.filter(pk=message.pk).values_list(
+                CaseMessage.REACTION_COUNTERS[reaction_type], flat=True
+            ).get()
         
+        # Только изменение: какая реакция, новое значение счетчика и состояние кнопки
         return JsonResponse({
             'success': True,
             'action': action,
-            'reactions': reactions_json,
-            'user_reactions': user_reactions,
+            'reaction': reaction_type,
+            'count': count,
+            'active': action == 'added',
         })
         
     except CaseMessage.DoesNotExist:
@@ -605,6 +569,56 @@ def generate_patients_view(request):
     return redirect('accounts:cabinet')
 
 
+@login_required
+def import_patients_view(request):
+    """Импорт пациентов и медицинских карточек из CSV/JSONL файла.
+    
+    Права:
+    - superadmin: любые больницы
+    - hospital_admin: пациенты привязываются к его больнице
+    - doctor: недоступно
+    """
+    user = request.user
+    if user.role not in ['superadmin', 'hospital_admin']:
+        messages.error(request, 'Недостаточно прав для импорта пациентов.')
+        return redirect('accounts:cabinet')
+    
+    if user.role == 'hospital_admin' and user.hospital_id is None:
+        # Без больницы импорт не был бы ограничен ничем
+        messages.error(request, 'Администратор не привязан к больнице.')
+        return redirect('accounts:cabinet')
+    
+    if request.method != 'POST':
+        messages.error(request, 'Метод не поддерживается.')
+        return redirect('accounts:cabinet')
+    
+    upload = request.FILES.get('file')
+    if not upload:
+        messages.error(request, 'Выберите файл для импорта.')
+        return redirect('accounts:cabinet')
+    
+    import io
+    from patients import importer
+    
+    fmt = 'jsonl' if upload.name.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    # Файл читается построчно из временного файла загрузки
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        stats = importer.import_patients(
+            stream,
+            fmt,
+            hospital=user.hospital if user.role == 'hospital_admin' else None,
+        )
+    except (UnicodeDecodeError, csv.Error) as e:
+        messages.error(request, f'Не удалось прочитать файл: {e}')
+        return redirect('accounts:cabinet')
+    
+    messages.success(request, f'Импорт завершен. {stats.summary()}')
+    for line, error in stats.rejects[:5]:
+        messages.warning(request, f'Строка {line}: {error}')
+    return redirect('accounts:cabinet')
+
+
 @login_required
 def clear_my_patients_view(request):
     """Очистить всех пациентов у текущего врача (деактивировать связи)."""
@@ -615,6 +629,8 @@ def clear_my_patients_view(request):
     
     if request.method == 'POST':
         PatientDoctorRelation.objects.filter(doctor=user, is_active=True).update(is_active=False)
+        # update() не вызывает сигналы, сбрасывающие статистику кабинета
+        dashboard.invalidate([user.pk])
         messages.success(request, 'Все текущие пациенты отвязаны от вас.')
         return redirect('accounts:cabinet')
     
@@ -624,72 +640,26 @@ def clear_my_patients_view(request):
 
 @login_required
 def import_emias_patients_view(request):
-    """Выгрузить пациентов из ЕМИАС (генерирует 3 пациента и привязывает к текущему врачу)."""
+    """Запустить фоновую синхронизацию пациентов врача с ЕМИАС."""
     user = request.user
     if user.role != 'doctor':
         messages.error(request, 'Доступно только для врачей.')
         return redirect('accounts:my_patients')
     
     if request.method == 'POST':
-        from datetime import date, timedelta
-        import random
-        
-        # Русские имена и фамилии
-        first_names_male = ['Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей']
-        first_names_female = ['Анна', 'Мария', 'Елена', 'Наталья', 'Ольга']
-        last_names = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов']
-        middle_names_male = ['Александрович', 'Дмитриевич', 'Максимович', 'Сергеевич', 'Андреевич']
-        middle_names_female = ['Александровна', 'Дмитриевна', 'Максимовна', 'Сергеевна', 'Андреевна']
+        from django.conf import settings
+        from patients import emias
         
-        created_count = 0
-        base_num = Patient.objects.count() + 1
-        
-        for i in range(3):
-            # Случайный пол
-            gender = random.choice(['M', 'F'])
-            
-            if gender == 'M':
-                first_name = random.choice(first_names_male)
-                middle_name = random.choice(middle_names_male)
-            else:
-                first_name = random.choice(first_names_female)
-                middle_name = random.choice(middle_names_female)
-            
-            last_name = random.choice(last_names)
-            
-            # Дата рождения (от 25 до 75 лет назад)
-            years_ago = random.randint(25, 75)
-            birth_date = date.today() - timedelta(days=years_ago * 365 + random.randint(0, 365))
-            
-            # Телефон
-            phone = f"+7{random.randint(900, 999)}{random.randint(1000000, 9999999)}"
-            
-            # Email
-            email = f"{first_name.lower()}.{last_name.lower()}{base_num + i}@example.com"
-            
-            # Создаем пациента
-            patient = Patient.objects.create(
-                first_name=first_name,
-                last_name=last_name,
-                middle_name=middle_name,
-                date_of_birth=birth_date,
-                gender=gender,
-                phone=phone,
-                email=email,
-                hospital=user.hospital if hasattr(user, 'hospital') and user.hospital else None,
-                emias_last_synced=timezone.now(),  # Устанавливаем время синхронизации
-            )
-            
-            # Привязываем пациента к врачу
-            PatientDoctorRelation.objects.get_or_create(
-                patient=patient,
-                doctor=user,
-                defaults={'is_active': True}
-            )
-            
-            created_count += 1
+        if not settings.EMIAS_API_URL:
+            messages.error(request, 'Интеграция с ЕМИАС не настроена.')
+            return redirect('accounts:my_patients')
         
-        messages.success(request, f'Выгружено {created_count} пациентов из ЕМИАС.')
+        patient_ids = list(access.for_request(request).treated_patient_ids())
+        # Запросы к ЕМИАС выполняются в фоне, страница не ждет их завершения
+        if emias.schedule_sync(patient_ids, key=('doctor', user.id)) is None:
+            messages.info(request, 'Синхронизация с ЕМИАС уже выполняется.')
+        else:
+            messages.success(request, f'Запущена синхронизация {len(patient_ids)} пациентов с ЕМИАС.')
         return redirect('accounts:my_patients')
     
     messages.error(request, 'Метод не поддерживается.')
@@ -704,7 +674,7 @@ def my_patients_view(request):
         messages.error(request, 'Доступно только для врачей.')
         return redirect('accounts:cabinet')
     
-    patients_qs = get_patient_queryset(user)
+    patients_qs = access.patients_for(user)
     
     # Поиск по ФИО или номеру карты
     q = request.GET.get('q', '').strip()
@@ -723,7 +693,7 @@ def my_patients_view(request):
             )
     
     # Подсчет статистики (до применения поиска)
-    base_patients_qs = get_patient_queryset(user)
+    base_patients_qs = access.patients_for(user)
     total_count = base_patients_qs.count()
     
     # Подсчет активных и критичных пациентов
@@ -742,10 +712,12 @@ def my_patients_view(request):
     active_count = base_patients_qs.filter(Exists(active_cases)).count()
     critical_count = base_patients_qs.filter(Exists(critical_cases)).count()
     
-    patients = list(patients_qs.select_related('hospital').prefetch_related('cases__doctors'))
+    # Диагноз и флаг консилиума хранятся в строке пациента - список рендерится одним запросом
+    patients_page = paginate_patients(request, patients_qs.select_related('hospital'))
     
     context = {
-        'patients': patients,
+        'patients': patients_page.items,
+        'patients_page': patients_page,
         'query': q,
         'total_count': total_count,
         'active_count': active_count,
@@ -761,7 +733,9 @@ def patient_detail_anonymous_view(request, case_id, patient_id):
     
     try:
         case = Case.objects.get(id=case_id, status='stable')
-        patient = Patient.objects.prefetch_related('medical_records', 'cases__doctors').get(id=patient_id)
+        patient = Patient.objects.prefetch_related(
+            Prefetch('medical_records', queryset=MedicalRecord.objects.order_by('-visit_date'))
+        ).get(id=patient_id)
     except Case.DoesNotExist:
         messages.error(request, 'Консилиум не найден.')
         return redirect('accounts:knowledge_base')
@@ -774,11 +748,11 @@ def patient_detail_anonymous_view(request, case_id, patient_id):
         messages.error(request, 'Неверная связь консилиума и пациента.')
         return redirect('accounts:case_detail', case_id=case_id)
     
-    # Получаем данные из последней медицинской карты
-    last_record = patient.medical_records.order_by('-visit_date').first()
+    # Получаем данные из последней медицинской карты (карточки уже загружены по убыванию даты)
+    last_record = next(iter(patient.medical_records.all()), None)
     
     # Аллергии
-    allergies = patient.get_allergies_list()
+    allergies = patient.get_allergies_list(last_record)
     
     # Лабораторные результаты
     lab_results = patient.get_last_lab_results()
@@ -816,14 +790,16 @@ def patient_detail_view(request, patient_id):
     user = request.user
     
     try:
-        patient = Patient.objects.prefetch_related('medical_records', 'cases__doctors').get(id=patient_id)
+        patient = Patient.objects.prefetch_related(
+            Prefetch('medical_records', queryset=MedicalRecord.objects.order_by('-visit_date'))
+        ).get(id=patient_id)
     except Patient.DoesNotExist:
         messages.error(request, 'Пациент не найден.')
         return redirect('accounts:my_patients')
     
     # Проверка доступа (только если врач имеет доступ к пациенту)
     if user.role == 'doctor':
-        if not patient.treating_doctors.filter(doctor=user, is_active=True).exists():
+        if not access.for_request(request).can_view_patient(patient.id):
             messages.error(request, 'У вас нет доступа к этому пациенту.')
             return redirect('accounts:my_patients')
     elif user.role == 'hospital_admin':
@@ -831,11 +807,11 @@ def patient_detail_view(request, patient_id):
             messages.error(request, 'У вас нет доступа к этому пациенту.')
             return redirect('accounts:cabinet')
     
-    # Получаем данные из последней медицинской карты
-    last_record = patient.medical_records.order_by('-visit_date').first()
+    # Получаем данные из последней медицинской карты (карточки уже загружены по убыванию даты)
+    last_record = next(iter(patient.medical_records.all()), None)
     
     # Аллергии
-    allergies = patient.get_allergies_list()
+    allergies = patient.get_allergies_list(last_record)
     
     # Лабораторные результаты
     lab_results = patient.get_last_lab_results()
@@ -880,28 +856,9 @@ def complete_case_view(request, case_id):
         messages.error(request, 'Консилиум не найден.')
         return redirect('accounts:cases')
     
-    # Проверка доступа:
-    # - Участники консилиума или создатель могут завершить
-    # - Администратор больницы может завершить консилиумы врачей своей больницы
-    # - Суперадмин может завершить любой консилиум
-    has_access = False
-    
-    if user.role == 'superadmin':
-        has_access = True
-    elif user.role == 'hospital_admin' and user.hospital:
-        # Администратор больницы может завершить консилиумы врачей своей больницы
-        if case.patient and case.patient.hospital == user.hospital:
-            has_access = True
-        # Также если хотя бы один врач-участник из его больницы
-        elif case.doctors.filter(hospital=user.hospital).exists():
-            has_access = True
-        elif case.created_by and case.created_by.hospital == user.hospital:
-            has_access = True
-    elif user in case.doctors.all() or case.created_by == user:
-        # Участник или создатель
-        has_access = True
-    
-    if not has_access:
+    # Завершить могут участники и создатель, администратор больницы (консилиумы
+    # врачей и пациентов своей больницы) и суперадмин - см. patients.access
+    if not access.for_request(request).case_permissions(case.id).can_manage:
         messages.error(request, 'У вас нет прав для завершения этого консилиума.')
         return redirect('accounts:case_detail', case_id=case_id)
     
@@ -931,81 +888,56 @@ def complete_case_view(request, case_id):
     return render(request, 'accounts/complete_case.html', context)
 
 
+# Сколько самых релевантных кейсов берем из полнотекстового индекса
+KNOWLEDGE_BASE_SEARCH_LIMIT = 500
+
+
 @login_required
 def knowledge_base_view(request):
     """База знаний - поиск по завершенным консилиумам."""
-    from django.db.models import Count, Q
-    
-    # Получаем завершенные кейсы (статус 'stable')
-    completed_cases = Case.objects.filter(status='stable').select_related('patient', 'created_by').prefetch_related('doctors', 'messages')
+    # Записи базы знаний вычисляются при завершении консилиума
+    entries = KnowledgeBaseEntry.objects.select_related('case__patient')
     
     # Поиск по запросу
     query = request.GET.get('q', '').strip()
     specialty_filter = request.GET.get('specialty', '').strip()
     
     if query:
-        # Поиск по диагнозу, МКБ-коду, описанию
-        completed_cases = completed_cases.filter(
-            Q(diagnosis__icontains=query) |
-            Q(description__icontains=query) |
-            Q(patient__first_name__icontains=query) |
-            Q(patient__last_name__icontains=query)
-        )
+        # Полнотекстовый поиск по диагнозу, МКБ-коду, описанию и ФИО пациента
+        ranked_ids = search.search_cases(query, status='stable', limit=KNOWLEDGE_BASE_SEARCH_LIMIT)
+        if ranked_ids is None:
+            # СУБД без полнотекстового индекса
+            entries = entries.filter(
+                Q(case__diagnosis__icontains=query) |
+                Q(case__description__icontains=query) |
+                Q(case__patient__first_name__icontains=query) |
+                Q(case__patient__last_name__icontains=query)
+            )
+        elif not ranked_ids:
+            entries = entries.none()
+        else:
+            # Сохраняем порядок релевантности
+            entries = entries.filter(case_id__in=ranked_ids).order_by(
+                CaseWhen(*[When(case_id=case_id, then=position) for position, case_id in enumerate(ranked_ids)])
+            )
     
     # Фильтр по специальности (только если выбран, не "Все")
     if specialty_filter and specialty_filter != 'all':
-        completed_cases = completed_cases.filter(doctors__specialty=specialty_filter).distinct()
+        entries = entries.filter(Exists(Case.doctors.through.objects.filter(
+            case_id=OuterRef('case_id'),
+            user__specialty=specialty_filter,
+        )))
     
     # Подсчет статистики
     total_cases = Case.objects.filter(status='stable').count()
     total_doctors = User.objects.filter(cases__status='stable').distinct().count()
-    total_specialties = User.objects.filter(
-        cases__status='stable',
-        specialty__isnull=False
-    ).values('specialty').distinct().count()
-    
-    # Получаем список специальностей для фильтров
-    specialties = User.objects.filter(
-        cases__status='stable',
-        specialty__isnull=False
-    ).values_list('specialty', flat=True).distinct().order_by('specialty')
-    
-    # Формируем результаты
-    results = []
-    for case in completed_cases[:50]:  # Ограничиваем до 50 результатов
-        
-        # Вычисляем длительность консилиума
-        duration_minutes = 0
-        if case.messages.exists():
-            first_message = case.messages.order_by('created_at').first()
-            last_message = case.messages.order_by('-created_at').first()
-            if first_message and last_message:
-                delta = last_message.created_at - first_message.created_at
-                duration_minutes = int(delta.total_seconds() / 60)
-        
-        # Получаем итоговое решение (последнее сообщение или заглушка)
-        decision = "Решение принято"
-        last_message = case.messages.order_by('-created_at').first()
-        if last_message:
-            decision_text = last_message.content[:100]
-            if len(last_message.content) > 100:
-                decision_text += "..."
-            decision = decision_text
-        
-        # Получаем коморбидности из медицинских карт
-        comorbidities = []
-        last_record = case.patient.medical_records.order_by('-visit_date').first()
-        if last_record and last_record.chronic_diseases:
-            comorbidities = [d.strip() for d in last_record.chronic_diseases.split(',') if d.strip()][:3]
-        
-        results.append({
-            'case': case,
-            'duration_minutes': duration_minutes,
-            'decision': decision,
-            'comorbidities': comorbidities,
-            'doctors_count': case.doctors.count(),
-            'messages_count': case.messages.count(),
-        })
+    
+    # Список специальностей для фильтров берем из кэша справочников
+    specialties = reference_data.stable_case_specialties().items
+    total_specialties = len(specialties)
+    
+    # Ограничиваем до 50 результатов
+    results = list(entries[:50])
     
     context = {
         'query': query,
@@ -1125,12 +1057,17 @@ def generate_stable_cases_view(request):
                 msg = CaseMessage.objects.create(
                     case=case,
                     author=author,
-                    content=content,
-                    is_read=True  # Все сообщения прочитаны в завершенных консилиумах
+                    content=content
                 )
                 # Обновляем время создания сообщения
                 CaseMessage.objects.filter(id=msg.id).update(created_at=message_time)
             
+            # Все сообщения прочитаны в завершенных консилиумах
+            case.read_cursors.update(unread_count=0, last_read_at=timezone.now())
+            dashboard.invalidate_case(case.pk)
+            # Время сообщений изменено задним числом - пересчитываем запись базы знаний
+            KnowledgeBaseEntry.build(case)
+            
             created_count += 1
         
         messages.success(request, f'Сгенерировано {created_count} завершенных консилиумов для базы знаний.')
@@ -1361,11 +1298,10 @@ def register_view(request):
             errors['password_confirm'] = 'Пароли не совпадают'
         
         if errors:
-            hospitals = Hospital.objects.all()
             context = {
                 'errors': errors,
                 'form_data': request.POST,
-                'hospitals': hospitals,
+                'hospitals': reference_data.hospitals().items,
             }
             return render(request, 'accounts/register.html', context)
         
@@ -1394,18 +1330,16 @@ def register_view(request):
             return redirect('accounts:cabinet')
         except Exception as e:
             messages.error(request, f'Ошибка при регистрации: {str(e)}')
-            hospitals = Hospital.objects.all()
             context = {
                 'errors': {'general': 'Ошибка при регистрации. Попробуйте еще раз.'},
                 'form_data': request.POST,
-                'hospitals': hospitals,
+                'hospitals': reference_data.hospitals().items,
             }
             return render(request, 'accounts/register.html', context)
     
     # GET запрос - показываем форму
-    hospitals = Hospital.objects.all()
     context = {
-        'hospitals': hospitals,
+        'hospitals': reference_data.hospitals().items,
     }
     return render(request, 'accounts/register.html', context)
 
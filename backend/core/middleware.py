@@ -0,0 +1,164 @@
+"""
+Профилирование запросов: SQL, шаблоны и время Python.
+
+ProfilingMiddleware подключается только при PROFILING_ENABLED (см. settings),
+поэтому в обычном режиме не добавляет накладных расходов. Для каждого запроса
+считаются число и время SQL-запросов, самые медленные из них и время
+рендеринга шаблонов. Результат отдается в заголовке Server-Timing (виден во
+вкладке Network браузера), а запросы дольше PROFILING_SLOW_REQUEST_MS пишутся
+в лог core.middleware одной JSON-строкой.
+
+JSONGZipMiddleware сжимает JSON-ответы API длиннее API_GZIP_MIN_LENGTH.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('profile', default=None)
+
+
+class RequestProfile:
+    """Метрики одного запроса."""
+
+    def __init__(self, slowest_limit):
+        self.slowest_limit = slowest_limit
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest = []
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += elapsed
+            if len(self.slowest) < self.slowest_limit or elapsed > self.slowest[-1][0]:
+                self.slowest.append((elapsed, sql))
+                self.slowest.sort(key=lambda item: item[0], reverse=True)
+                del self.slowest[self.slowest_limit:]
+
+
+def _profiled_render(render):
+    def wrapper(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        # Вложенный рендеринг (render_to_string внутри тега) уже учтен внешним
+        profile.template_depth += 1
+        started = time.perf_counter()
+        db_started = profile.db_seconds
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                # SQL из шаблона (ленивые queryset) относится к db, а не к tpl
+                elapsed = time.perf_counter() - started
+                profile.template_seconds += elapsed - (profile.db_seconds - db_started)
+
+    wrapper.profiled = True
+    wrapper.__wrapped__ = render
+    return wrapper
+
+
+def install_template_timer():
+    """Обернуть Template.render бэкенда Django один раз на процесс.
+
+    Обертка общая для всех потоков, но вне профилируемого запроса (нет
+    RequestProfile в контексте) сразу вызывает исходный render.
+    """
+    template_class = django_backend.Template
+    if not getattr(template_class.render, 'profiled', False):
+        template_class.render = _profiled_render(template_class.render)
+
+
+def uninstall_template_timer():
+    """Вернуть исходный Template.render."""
+    template_class = django_backend.Template
+    if getattr(template_class.render, 'profiled', False):
+        template_class.render = template_class.render.__wrapped__
+
+
+class ProfilingMiddleware:
+    """Замеряет SQL, рендеринг шаблонов и время Python каждого запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request_ms = settings.PROFILING_SLOW_REQUEST_MS
+        self.slowest_limit = settings.PROFILING_SLOWEST_QUERIES
+        install_template_timer()
+
+    def __call__(self, request):
+        profile = RequestProfile(self.slowest_limit)
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        db_ms = profile.db_seconds * 1000
+        template_ms = profile.template_seconds * 1000
+        # Время Python без SQL и шаблонов
+        app_ms = max(total_ms - db_ms - template_ms, 0.0)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="SQL: {profile.queries}"',
+            # Значения заголовка - только ASCII
+            f'tpl;dur={template_ms:.1f};desc="Templates"',
+            f'app;dur={app_ms:.1f};desc="Python"',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        if total_ms >= self.slow_request_ms:
+            user = getattr(request, 'user', None)
+            logger.warning('Медленный запрос: %s', json.dumps({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'user_id': user.pk if user is not None and user.is_authenticated else None,
+                'total_ms': round(total_ms, 1),
+                'db_ms': round(db_ms, 1),
+                'queries': profile.queries,
+                'template_ms': round(template_ms, 1),
+                'app_ms': round(app_ms, 1),
+                'slowest_queries': [
+                    {'ms': round(seconds * 1000, 1), 'sql': sql[:1000]} for seconds, sql in profile.slowest
+                ],
+            }, ensure_ascii=False))
+        return response
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware только для JSON-ответов не короче API_GZIP_MIN_LENGTH байт.
+
+    HTML не сжимается (страницы небольшие и содержат CSRF-токен), короткие
+    ответы тоже: на них сжатие тратит больше времени, чем экономит трафика.
+    Сильный ETag сжатого ответа становится слабым, If-None-Match работает и с ним.
+    """
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or not response.get('Content-Type', '').startswith('application/json')
+            or len(response.content) < settings.API_GZIP_MIN_LENGTH
+        ):
+            return response
+        return super().process_response(request, response)
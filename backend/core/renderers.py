@@ -0,0 +1,64 @@
+"""
+Быстрые JSON renderer и parser для REST API.
+
+Если установлен orjson, ответы сериализуются и запросы разбираются им, иначе -
+стандартными JSONRenderer/JSONParser DRF. Результат побайтно совпадает с
+JSONRenderer: компактный UTF-8, время - через кодировщик DRF (суффикс Z,
+миллисекунды), U+2028/U+2029 экранируются. Запрос с отступами (indent в
+Accept, browsable API), а также настройки UNICODE_JSON=False и
+COMPACT_JSON=False обслуживает стандартный JSONRenderer.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson не обязателен
+    orjson = None
+
+if orjson is not None:
+    # Время отдаем кодировщику DRF, чтобы формат не отличался от JSONRenderer
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson (без orjson - стандартный)."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # orjson пишет только компактный UTF-8: ensure_ascii (UNICODE_JSON=False),
+        # COMPACT_JSON=False и отступы отдаем стандартному JSONRenderer
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type or '', renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        # Как JSONRenderer: валидный JavaScript, а не только JSON
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson (без orjson - стандартный)."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, UnicodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -85,6 +85,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.JSONGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -136,6 +137,61 @@ else:
     }
 
 
+# Кэш: локальная память процесса по умолчанию, общий Redis при наличии REDIS_URL
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'hippo',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Снимки статистики кабинета: поколения в кэше памяти процесса не видны другим
+# воркерам, поэтому без общего кэша снимок живет недолго
+DASHBOARD_SNAPSHOT_TIMEOUT = int(os.environ.get('DASHBOARD_SNAPSHOT_TIMEOUT', 3600 if os.environ.get('REDIS_URL') else 60))
+
+# События консилиумов в реальном времени: через Redis при нескольких воркерах
+REDIS_URL = os.environ.get('REDIS_URL', '')
+REALTIME_BROKER = os.environ.get(
+    'REALTIME_BROKER',
+    'patients.realtime.RedisBroker' if REDIS_URL else 'patients.realtime.InMemoryBroker',
+)
+
+# Интеграция с ЕМИАС (для разработки: python manage.py emias_stub_server)
+EMIAS_API_URL = os.environ.get('EMIAS_API_URL', 'http://127.0.0.1:8765' if DEBUG else '')
+EMIAS_CLIENT = os.environ.get('EMIAS_CLIENT', 'patients.emias.HttpEmiasClient')
+EMIAS_TIMEOUT = float(os.environ.get('EMIAS_TIMEOUT', '10'))
+EMIAS_SYNC_CONCURRENCY = int(os.environ.get('EMIAS_SYNC_CONCURRENCY', '10'))
+EMIAS_SYNC_BATCH_SIZE = int(os.environ.get('EMIAS_SYNC_BATCH_SIZE', '200'))
+# Через сколько секунд данные пациента считаются устаревшими
+EMIAS_SYNC_STALE_AFTER = int(os.environ.get('EMIAS_SYNC_STALE_AFTER', str(6 * 60 * 60)))
+
+# Как часто (в секундах) накопленная активность пользователей записывается в БД
+PRESENCE_FLUSH_INTERVAL = int(os.environ.get('PRESENCE_FLUSH_INTERVAL', '60'))
+
+# Сколько секунд браузеры и прокси могут хранить главную страницу для анонимных пользователей
+HOME_PAGE_CACHE_SECONDS = int(os.environ.get('HOME_PAGE_CACHE_SECONDS', '300'))
+
+# JSON-ответы API не короче этого числа байт сжимаются gzip (см. core.middleware.JSONGZipMiddleware)
+API_GZIP_MIN_LENGTH = int(os.environ.get('API_GZIP_MIN_LENGTH', '4096'))
+
+# Профилирование запросов: заголовок Server-Timing и лог медленных запросов (см. core.middleware)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SLOW_REQUEST_MS = float(os.environ.get('PROFILING_SLOW_REQUEST_MS', '500'))
+PROFILING_SLOWEST_QUERIES = int(os.environ.get('PROFILING_SLOWEST_QUERIES', '3'))
+if PROFILING_ENABLED:
+    # Первым, чтобы в замер попали все остальные middleware
+    MIDDLEWARE.insert(0, 'core.middleware.ProfilingMiddleware')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -195,6 +251,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson, если установлен (см. core.renderers)
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -0,0 +1,171 @@
+import gzip
+import json
+import uuid
+from datetime import date, datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.template import engines
+from django.template.backends import django as django_backend
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .middleware import JSONGZipMiddleware, ProfilingMiddleware, uninstall_template_timer
+from .renderers import FastJSONParser, FastJSONRenderer
+
+DATA = {
+    'created_at': datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+    'naive': datetime(2025, 1, 2, 3, 4, 5),
+    'date': date(2025, 1, 2),
+    'time': time(3, 4, 5, 678901),
+    'amount': Decimal('12.50'),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'name': 'Пневмония «тяжелая»',
+    'separators': 'a b c',
+    'nested': [1, 2.5, None, True, {'key': 'значение'}],
+    1: 'числовой ключ',
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Ответ orjson побайтно совпадает с JSONRenderer DRF."""
+
+    def test_parity(self):
+        self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_fallback_without_orjson(self):
+        with mock.patch('core.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+
+    def test_ensure_ascii(self):
+        # UNICODE_JSON=False: не-ASCII символы экранируются, как у JSONRenderer
+        class AsciiFast(FastJSONRenderer):
+            ensure_ascii = True
+
+        class AsciiStandard(JSONRenderer):
+            ensure_ascii = True
+
+        rendered = AsciiFast().render(DATA)
+        self.assertEqual(rendered, AsciiStandard().render(DATA))
+        self.assertTrue(rendered.isascii())
+
+    def test_indent(self):
+        self.assertEqual(
+            FastJSONRenderer().render(DATA, 'application/json; indent=2'),
+            JSONRenderer().render(DATA, 'application/json; indent=2'),
+        )
+
+    def test_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """Разбор запроса orjson совпадает с JSONParser DRF."""
+
+    def parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(BytesIO(body), parser_context={'encoding': encoding})
+
+    def test_parity(self):
+        body = '{"name": "Иванов", "values": [1, 2.5, null, true], "nested": {"a": "\\u2028"}}'.encode()
+        self.assertEqual(self.parse(FastJSONParser(), body), self.parse(JSONParser(), body))
+
+    def test_other_encoding(self):
+        body = '{"name": "Иванов"}'.encode('cp1251')
+        self.assertEqual(self.parse(FastJSONParser(), body, 'cp1251'), {'name': 'Иванов'})
+
+    def test_invalid(self):
+        with self.assertRaises(ParseError):
+            self.parse(FastJSONParser(), b'{oops')
+
+
+@override_settings(API_GZIP_MIN_LENGTH=1000)
+class JSONGZipMiddlewareTests(SimpleTestCase):
+    """Сжатие только JSON-ответов не короче API_GZIP_MIN_LENGTH и только по Accept-Encoding."""
+
+    def respond(self, content, content_type='application/json', accept_encoding='gzip, deflate'):
+        request = RequestFactory().get('/api/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        middleware = JSONGZipMiddleware(lambda request: HttpResponse(content, content_type=content_type))
+        return middleware(request)
+
+    def test_long_json_compressed(self):
+        content = b'[' + b','.join([b'"value"'] * 200) + b']'
+        response = self.respond(content)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    def test_without_accept_encoding(self):
+        response = self.respond(b'"' + b'x' * 2000 + b'"', accept_encoding='')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_threshold(self):
+        # 999 байт - короче порога, 1000 байт - уже сжимается
+        self.assertFalse(self.respond(b'"' + b'x' * 997 + b'"').has_header('Content-Encoding'))
+        self.assertEqual(self.respond(b'"' + b'x' * 998 + b'"')['Content-Encoding'], 'gzip')
+
+    def test_html_not_compressed(self):
+        response = self.respond(b'<p>' + b'x' * 2000 + b'</p>', content_type='text/html')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+def profiled_view(request):
+    """Один SQL-запрос и вложенный рендеринг шаблона."""
+    count = get_user_model().objects.count()
+    inner = engines['django'].from_string('{{ value }}')
+    outer = engines['django'].from_string('{{ inner }}:{{ count }}')
+    return HttpResponse(outer.render({'inner': inner.render({'value': 'x'}), 'count': count}))
+
+
+@override_settings(PROFILING_SLOW_REQUEST_MS=10 ** 6, PROFILING_SLOWEST_QUERIES=3)
+class ProfilingMiddlewareTests(TestCase):
+    """Server-Timing, лог медленных запросов и обертка рендеринга шаблонов."""
+
+    def setUp(self):
+        self.original_render = django_backend.Template.render
+        self.addCleanup(uninstall_template_timer)
+
+    def request(self):
+        return ProfilingMiddleware(profiled_view)(RequestFactory().get('/cabinet/?page=2'))
+
+    def test_template_timer_installed_once_and_restored(self):
+        ProfilingMiddleware(profiled_view)
+        wrapped = django_backend.Template.render
+        ProfilingMiddleware(profiled_view)
+        self.assertIs(django_backend.Template.render, wrapped)
+        self.assertIs(wrapped.__wrapped__, self.original_render)
+
+        uninstall_template_timer()
+        self.assertIs(django_backend.Template.render, self.original_render)
+
+    def test_render_outside_request_unchanged(self):
+        ProfilingMiddleware(profiled_view)
+        self.assertEqual(engines['django'].from_string('{{ value }}').render({'value': 'x'}), 'x')
+
+    def test_server_timing(self):
+        response = self.request()
+        self.assertEqual(response.content, b'x:0')
+        metrics = [part.strip().split(';')[0] for part in response['Server-Timing'].split(',')]
+        self.assertEqual(metrics, ['db', 'tpl', 'app', 'total'])
+        self.assertIn('desc="SQL: 1"', response['Server-Timing'])
+        self.assertTrue(response['Server-Timing'].isascii())
+
+    def test_fast_request_not_logged(self):
+        with self.assertNoLogs('core.middleware'):
+            self.request()
+
+    @override_settings(PROFILING_SLOW_REQUEST_MS=0)
+    def test_slow_request_logged(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.request()
+        record = json.loads(logs.records[0].getMessage().split(': ', 1)[1])
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['path'], '/cabinet/?page=2')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], 1)
+        self.assertEqual(len(record['slowest_queries']), 1)
+        self.assertIn('accounts_user', record['slowest_queries'][0]['sql'])
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.shortcuts import render
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_http_methods
-from patients.models import Patient
-from hospitals.models import Hospital
+from patients import counters
 
 
 @require_http_methods(["GET"])
@@ -12,12 +13,19 @@ def home_view(request):
         'user': request.user,
     }
     
-    # Статистика для неавторизованных пользователей
+    # Статистика для неавторизованных пользователей (счетчики вместо COUNT по таблицам)
     if not request.user.is_authenticated:
+        totals = counters.totals('hospitals', 'patients')
         context.update({
-            'total_hospitals': Hospital.objects.count(),
-            'total_patients': Patient.objects.count(),
+            'total_hospitals': totals['hospitals'],
+            'total_patients': totals['patients'],
         })
     
-    return render(request, 'core/home.html', context)
-
+    response = render(request, 'core/home.html', context)
+    if request.user.is_authenticated:
+        # Страница с данными пользователя не должна попасть в общий кэш
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        # Анонимная страница одинакова для всех; Vary: Cookie (от сессии) отделяет вошедших
+        patch_cache_control(response, public=True, max_age=settings.HOME_PAGE_CACHE_SECONDS)
+    return response
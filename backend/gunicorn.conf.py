@@ -0,0 +1,16 @@
+"""
+Настройки gunicorn: ASGI-приложение (HTTP и WebSocket) под воркером uvicorn.
+
+Без Redis события консилиумов доставляются брокером в памяти процесса, поэтому
+воркер может быть только один; с REDIS_URL число воркеров задает WEB_CONCURRENCY.
+"""
+import os
+
+wsgi_app = 'core.asgi:application'
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if os.environ.get('REDIS_URL'):
+    workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+else:
+    workers = 1
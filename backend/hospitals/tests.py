@@ -1,3 +1,11 @@
 from django.test import TestCase
 
-# Create your tests here.
+from patients.benchmark import QueryBudgetMixin
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Бюджет SQL-запросов API больниц (не зависит от объема данных)."""
+
+    budgets = {
+        'api_hospitals': 4,
+    }
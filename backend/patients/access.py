@@ -0,0 +1,151 @@
+"""
+Области доступа пользователей к пациентам, карточкам и консилиумам.
+
+Врач видит пациентов, которых лечит (активная PatientDoctorRelation),
+администратор больницы - пациентов своей больницы, суперадмин - всех.
+Фильтр врача - Exists-подзапрос по индексу patients_rel_doctor_active, без
+JOIN и DISTINCT, поэтому queryset можно дальше фильтровать, сортировать и
+использовать как подзапрос.
+
+Права на консилиум (просмотр, сообщения, реакции, завершение) вычисляются
+одним запросом в case_permissions.
+
+Повторные проверки в пределах одного HTTP-запроса не обращаются к БД:
+AccessScope (см. for_request) один раз загружает id пациентов врача, а
+остальные проверки, включая права на консилиумы, запоминает.
+"""
+from django.db.models import Exists, OuterRef
+
+from .models import Case, MedicalRecord, Patient, PatientDoctorRelation
+
+
+def treated_by(doctor):
+    """Условие для Patient: пациент лечится у врача (активная связь)."""
+    return Exists(PatientDoctorRelation.objects.filter(patient=OuterRef('pk'), doctor=doctor, is_active=True))
+
+
+def patients_for(user):
+    """Пациенты, доступные пользователю."""
+    if user.role == 'superadmin':
+        return Patient.objects.all()
+    if user.role == 'hospital_admin':
+        return Patient.objects.filter(hospital=user.hospital)
+    return Patient.objects.filter(treated_by(user))
+
+
+def records_for(user):
+    """Медицинские карточки, доступные пользователю."""
+    if user.role == 'superadmin':
+        return MedicalRecord.objects.all()
+    if user.role == 'hospital_admin':
+        return MedicalRecord.objects.filter(patient__hospital=user.hospital)
+    return MedicalRecord.objects.filter(doctor=user)
+
+
+class CasePermissions:
+    """Права пользователя на консилиум.
+
+    can_view - просмотр и чат (завершенные консилиумы видны всем, активные -
+    участникам, создателю, администратору больницы и суперадмину); can_post
+    совпадает с can_view; can_react - только участникам; can_manage -
+    участникам, создателю, администратору больницы и суперадмину.
+    """
+
+    def __init__(self, exists=False, status=None, is_participant=False, can_view=False, can_manage=False):
+        self.exists = exists
+        self.status = status
+        self.is_participant = is_participant
+        self.can_view = can_view
+        self.can_post = can_view
+        self.can_react = is_participant
+        self.can_manage = can_manage
+
+    @property
+    def can_complete(self):
+        return self.can_manage and self.status != 'stable'
+
+
+def case_permissions(user, case_id):
+    """Права пользователя на консилиум case_id одним запросом."""
+    participants = Case.doctors.through.objects.filter(case_id=OuterRef('pk'))
+    queryset = Case.objects.filter(pk=case_id).annotate(
+        is_participant=Exists(participants.filter(user_id=user.pk))
+    )
+    fields = ['status', 'created_by_id', 'patient__hospital_id', 'created_by__hospital_id', 'is_participant']
+    admin_hospital_id = user.hospital_id if user.role == 'hospital_admin' else None
+    if admin_hospital_id:
+        # Администратор больницы управляет консилиумами с врачами своей больницы
+        queryset = queryset.annotate(has_hospital_doctor=Exists(participants.filter(user__hospital_id=admin_hospital_id)))
+        fields.append('has_hospital_doctor')
+    row = queryset.values(*fields).first()
+    if row is None:
+        return CasePermissions()
+
+    if user.role == 'superadmin':
+        can_manage = True
+    elif admin_hospital_id:
+        can_manage = (
+            row['patient__hospital_id'] == admin_hospital_id
+            or row['has_hospital_doctor']
+            or row['created_by__hospital_id'] == admin_hospital_id
+        )
+    else:
+        can_manage = row['is_participant'] or row['created_by_id'] == user.pk
+    return CasePermissions(
+        exists=True,
+        status=row['status'],
+        is_participant=row['is_participant'],
+        can_view=row['status'] == 'stable' or can_manage,
+        can_manage=can_manage,
+    )
+
+
+class AccessScope:
+    """Права пользователя с кэшем на время одного HTTP-запроса."""
+
+    def __init__(self, user):
+        self.user = user
+        self._patient_ids = None
+        self._checked_patients = {}
+        self._case_permissions = {}
+
+    def patients(self):
+        return patients_for(self.user)
+
+    def records(self):
+        return records_for(self.user)
+
+    def treated_patient_ids(self):
+        """id пациентов, которых лечит врач (загружаются один раз, только по индексу связей)."""
+        if self._patient_ids is None:
+            self._patient_ids = frozenset(
+                PatientDoctorRelation.objects.filter(doctor=self.user, is_active=True).values_list('patient_id', flat=True)
+            )
+        return self._patient_ids
+
+    def can_view_patient(self, patient_id):
+        """Доступен ли пациент (несуществующий пациент недоступен)."""
+        patient_id = int(patient_id)
+        if self.user.role == 'doctor':
+            return patient_id in self.treated_patient_ids()
+        if patient_id not in self._checked_patients:
+            self._checked_patients[patient_id] = self.patients().filter(pk=patient_id).exists()
+        return self._checked_patients[patient_id]
+
+    def case_permissions(self, case_id):
+        """Права на консилиум (см. case_permissions), один запрос на консилиум за HTTP-запрос."""
+        case_id = int(case_id)
+        if case_id not in self._case_permissions:
+            self._case_permissions[case_id] = case_permissions(self.user, case_id)
+        return self._case_permissions[case_id]
+
+
+def for_request(request):
+    """AccessScope текущего пользователя, общий для всех проверок одного запроса."""
+    # У DRF Request кэш хранится на исходном HttpRequest
+    request = getattr(request, '_request', request)
+    scope = getattr(request, '_access_scope', None)
+    if scope is None or scope.user.pk != request.user.pk:
+        scope = AccessScope(request.user)
+        request._access_scope = scope
+    return scope
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Patient, MedicalRecord, PatientDoctorRelation, Case, CaseMessage, MessageReaction
+from .models import (
+    Patient, MedicalRecord, PatientDoctorRelation, Case, CaseMessage, CaseReadCursor, KnowledgeBaseEntry, LabResult,
+    MessageReaction,
+)
 
 
 @admin.register(Patient)
@@ -18,6 +21,15 @@ class MedicalRecordAdmin(admin.ModelAdmin):
     date_hierarchy = 'visit_date'
 
 
+@admin.register(LabResult)
+class LabResultAdmin(admin.ModelAdmin):
+    list_display = ['patient', 'analyte', 'display_value', 'unit', 'taken_at']
+    search_fields = ['patient__first_name', 'patient__last_name', 'analyte']
+    list_filter = ['analyte']
+    date_hierarchy = 'taken_at'
+    raw_id_fields = ['patient']
+
+
 @admin.register(Case)
 class CaseAdmin(admin.ModelAdmin):
     list_display = ['patient', 'diagnosis', 'status', 'admission_date', 'created_by', 'created_at']
@@ -29,11 +41,25 @@ class CaseAdmin(admin.ModelAdmin):
 
 @admin.register(CaseMessage)
 class CaseMessageAdmin(admin.ModelAdmin):
-    list_display = ['case', 'author', 'created_at', 'is_read']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['case', 'author', 'created_at']
+    list_filter = ['created_at']
     search_fields = ['content', 'author__email']
 
 
+@admin.register(KnowledgeBaseEntry)
+class KnowledgeBaseEntryAdmin(admin.ModelAdmin):
+    list_display = ['case', 'admission_date', 'completed_at', 'doctors_count', 'messages_count']
+    list_filter = ['admission_date', 'completed_at']
+    raw_id_fields = ['case']
+
+
+@admin.register(CaseReadCursor)
+class CaseReadCursorAdmin(admin.ModelAdmin):
+    list_display = ['case', 'user', 'unread_count', 'last_read_at']
+    search_fields = ['user__email']
+    raw_id_fields = ['case', 'user']
+
+
 @admin.register(PatientDoctorRelation)
 class PatientDoctorRelationAdmin(admin.ModelAdmin):
     list_display = ['patient', 'doctor', 'assigned_date', 'is_active']
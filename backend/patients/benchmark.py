@@ -0,0 +1,250 @@
+"""
+Замер производительности страниц и API на синтетических данных.
+
+Наборы данных фиксированного размера создаются командой seed_dataset, затем
+каждый сценарий (GET-запрос от имени врача, суперадмина или анонимного
+пользователя) выполняется через тестовый клиент Django. Для каждого сценария
+собираются перцентили времени ответа, число и время SQL-запросов и пиковое
+потребление памяти (tracemalloc).
+
+Используется командой benchmark_views и тестами бюджета запросов
+(QueryBudgetMixin).
+"""
+import io
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import User
+from . import reference_data
+from .models import Case, MedicalRecord, PatientDoctorRelation
+
+DATASETS = {
+    'tiny': {'patients': 40, 'cases': 10, 'messages': 200, 'doctors': 10, 'hospitals': 2},
+    'small': {'patients': 200, 'cases': 100, 'messages': 2000, 'doctors': 20, 'hospitals': 3},
+    'medium': {'patients': 2000, 'cases': 1000, 'messages': 20000, 'doctors': 100, 'hospitals': 10},
+    'large': {'patients': 20000, 'cases': 10000, 'messages': 200000, 'doctors': 500, 'hospitals': 30},
+}
+
+BENCHMARK_ADMIN = 'benchmark_admin'
+
+Scenario = namedtuple('Scenario', ['name', 'role', 'url'])
+
+SCENARIOS = [
+    # HTML
+    Scenario('home', 'anonymous', lambda f: reverse('home')),
+    Scenario('cabinet', 'doctor', lambda f: reverse('accounts:cabinet')),
+    Scenario('cabinet_admin', 'superadmin', lambda f: reverse('accounts:cabinet')),
+    Scenario('cases', 'doctor', lambda f: reverse('accounts:cases')),
+    Scenario('case_detail', 'doctor', lambda f: reverse('accounts:case_detail', args=[f['case'].pk])),
+    Scenario('case_messages', 'doctor', lambda f: reverse('accounts:case_messages', args=[f['case'].pk])),
+    Scenario('create_case', 'doctor', lambda f: reverse('accounts:create_case')),
+    Scenario('my_patients', 'doctor', lambda f: reverse('accounts:my_patients')),
+    Scenario('patient_detail', 'doctor', lambda f: reverse('accounts:patient_detail', args=[f['patient'].pk])),
+    Scenario(
+        'patient_detail_anonymous',
+        'doctor',
+        lambda f: reverse('accounts:patient_detail_anonymous', args=[f['stable_case'].pk, f['stable_case'].patient_id]),
+    ),
+    Scenario('knowledge_base', 'doctor', lambda f: reverse('accounts:knowledge_base')),
+    Scenario('knowledge_base_search', 'doctor', lambda f: reverse('accounts:knowledge_base') + '?q=инфаркт'),
+    Scenario('registration_keys', 'superadmin', lambda f: reverse('accounts:registration_keys')),
+    # API
+    Scenario('api_me', 'doctor', lambda f: reverse('accounts-api:me')),
+    Scenario('api_hospitals', 'doctor', lambda f: reverse('hospitals:list-create')),
+    Scenario('api_cabinet', 'doctor', lambda f: reverse('patients:cabinet')),
+    Scenario('api_patients', 'doctor', lambda f: reverse('patients:patient-list-create')),
+    Scenario('api_patients_admin', 'superadmin', lambda f: reverse('patients:patient-list-create')),
+    Scenario('api_patient_detail', 'doctor', lambda f: reverse('patients:patient-detail', args=[f['patient'].pk])),
+    Scenario('api_patient_labs', 'doctor', lambda f: reverse('patients:patient-lab-trend', args=[f['patient'].pk])),
+    Scenario('api_records', 'doctor', lambda f: reverse('patients:record-list-create')),
+    Scenario('api_record_detail', 'doctor', lambda f: reverse('patients:record-detail', args=[f['record'].pk])),
+]
+
+
+def seed(name, seed=1, anchor=None):
+    """Очистить БД и заполнить ее набором данных name (см. DATASETS)."""
+    call_command('flush', interactive=False, verbosity=0)
+    cache.clear()
+    reference_data.invalidate()
+    options = {f'--{key}': value for key, value in DATASETS[name].items()}
+    args = ['--seed', str(seed)] + [str(item) for pair in options.items() for item in pair]
+    if anchor:
+        args += ['--anchor', anchor]
+    call_command('seed_dataset', *args, stdout=io.StringIO())
+
+
+def load_fixtures():
+    """Объекты для сценариев: самый загруженный врач, его консилиум с наибольшим числом сообщений и т.д."""
+    doctor = (
+        User.objects.filter(role='doctor')
+        .annotate(cases_count=Count('cases'))
+        .order_by('-cases_count', 'id')
+        .first()
+    )
+    admin = User.objects.filter(username=BENCHMARK_ADMIN).first()
+    if admin is None:
+        admin = User.objects.create_user(
+            username=BENCHMARK_ADMIN, email='benchmark-admin@example.com', password=None, role='superadmin'
+        )
+    doctor_cases = Case.objects.filter(doctors=doctor).annotate(messages_count=Count('messages'))
+    relations = PatientDoctorRelation.objects.filter(doctor=doctor, is_active=True).annotate(
+        cases_count=Count('patient__cases', filter=Q(patient__cases__doctors=doctor))
+    )
+    relation = relations.order_by('-cases_count', 'id').first()
+    return {
+        'doctor': doctor,
+        'superadmin': admin,
+        'case': doctor_cases.order_by('-messages_count', 'id').first(),
+        'stable_case': doctor_cases.filter(status='stable').order_by('-messages_count', 'id').first(),
+        'patient': relation.patient if relation else None,
+        'record': MedicalRecord.objects.filter(doctor=doctor).order_by('id').first(),
+    }
+
+
+class QueryTimer:
+    """Обертка выполнения SQL (connection.execute_wrapper): число запросов и суммарное время."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def percentile(values, p):
+    """Перцентиль p (0-100) методом ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def measure(client, url, iterations=20, warmup=2):
+    """Выполнить GET url iterations раз (после warmup прогревочных) и собрать метрики."""
+    for _ in range(warmup):
+        client.get(url)
+
+    latencies = []
+    sql_times = []
+    queries = []
+    status = None
+    for _ in range(iterations):
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+        status = response.status_code
+        queries.append(timer.count)
+        sql_times.append(timer.seconds * 1000)
+
+    # Отдельный запрос под tracemalloc, чтобы трассировка не искажала время
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'queries': max(queries),
+        'sql_ms': round(percentile(sql_times, 50), 2),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def clients(fixtures):
+    """Тестовые клиенты по ролям сценариев (для роли anonymous - без входа)."""
+    result = {}
+    for role in {scenario.role for scenario in SCENARIOS}:
+        client = Client()
+        if role != 'anonymous':
+            client.force_login(fixtures[role])
+        result[role] = client
+    return result
+
+
+def query_counts(dataset, views=None, seed_value=1):
+    """Заполнить БД набором dataset и посчитать SQL-запросы каждого сценария.
+
+    Возвращает {сценарий: (код ответа, число запросов)}. Кэши сбрасываются
+    перед каждым сценарием, чтобы считались запросы холодного запуска.
+    """
+    seed(dataset, seed_value)
+    fixtures = load_fixtures()
+    role_clients = clients(fixtures)
+    counts = {}
+    for scenario in SCENARIOS:
+        if views and scenario.name not in views:
+            continue
+        url = scenario.url(fixtures)
+        cache.clear()
+        reference_data.invalidate()
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            response = role_clients[scenario.role].get(url)
+        counts[scenario.name] = (response.status_code, timer.count)
+    return counts
+
+
+class QueryBudgetMixin:
+    """Тесты бюджета SQL-запросов для TestCase.
+
+    budgets - {сценарий: максимум запросов}. Каждый сценарий выполняется на
+    наборах данных datasets; число запросов не должно превышать бюджет и не
+    должно меняться с ростом объема данных (признак N+1).
+    """
+
+    budgets = {}
+    datasets = ('tiny', 'small')
+
+    def test_query_budgets(self):
+        counts = {dataset: query_counts(dataset, views=self.budgets) for dataset in self.datasets}
+        for view, budget in self.budgets.items():
+            with self.subTest(view=view):
+                per_dataset = {dataset: counts[dataset][view][1] for dataset in self.datasets}
+                for dataset in self.datasets:
+                    status, queries = counts[dataset][view]
+                    self.assertEqual(status, 200, f'{view} на наборе {dataset}')
+                    self.assertLessEqual(queries, budget, f'{view} на наборе {dataset}: {queries} > {budget}')
+                self.assertEqual(
+                    len(set(per_dataset.values())), 1, f'{view}: число запросов растет с объемом данных {per_dataset}'
+                )
+
+
+def run(dataset, iterations=20, warmup=2, views=None, seed_value=1, anchor=None, progress=None):
+    """Заполнить БД набором dataset и замерить сценарии. Возвращает список результатов."""
+    seed(dataset, seed_value, anchor)
+    fixtures = load_fixtures()
+    role_clients = clients(fixtures)
+    results = []
+    for scenario in SCENARIOS:
+        if views and scenario.name not in views:
+            continue
+        url = scenario.url(fixtures)
+        result = {'dataset': dataset, 'view': scenario.name, 'url': url}
+        result.update(measure(role_clients[scenario.role], url, iterations, warmup))
+        results.append(result)
+        if progress:
+            progress(result)
+    return results
@@ -0,0 +1,98 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для API пациентов и карточек.
+
+Валидаторы считаются одним агрегатным запросом по тем же строкам, что попадут
+в ответ: максимальные updated_at объекта и связанных объектов, которые
+выводит сериализатор, и число строк во вложенных коллекциях. Если клиент
+прислал совпадающий If-None-Match, отвечаем 304 без загрузки и сериализации
+данных.
+
+Параметры запроса (выборочные поля, сортировка, курсор, фильтры) меняют тело
+ответа при тех же строках, поэтому тоже входят в ETag - в нормализованном
+виде, чтобы одинаковые запросы с разным порядком полей совпадали.
+
+Удаление строки не меняет максимальную метку времени, поэтому там, где ответ
+включает коллекцию (conditional_counts), запрос проверяется только по ETag, а
+Last-Modified остается информационным.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import sparse
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для GET/HEAD generic-представлений DRF."""
+
+    # Метки времени (lookup'ы от модели queryset), от которых зависит ответ
+    conditional_timestamps = ('updated_at',)
+    # Коллекции, число строк в которых входит в ETag ('pk' - строки самого queryset)
+    conditional_counts = ()
+
+    def get_validators(self):
+        """(etag, last_modified) или None, если объект не найден."""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        detail = lookup_url_kwarg in self.kwargs
+        if detail:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+        aggregates = {f't{i}': Max(lookup) for i, lookup in enumerate(self.conditional_timestamps)}
+        aggregates.update(
+            (f'c{i}', Count(lookup, distinct=True)) for i, lookup in enumerate(self.conditional_counts)
+        )
+        row = queryset.order_by().aggregate(**aggregates)
+        if detail and row['t0'] is None:
+            return None
+
+        timestamps = [row[f't{i}'] for i in range(len(self.conditional_timestamps))]
+        counts = [row[f'c{i}'] for i in range(len(self.conditional_counts))]
+        # Разные представления одного URL (JSON, browsable API) - разные тела ответа
+        payload = json.dumps(
+            [self.request.accepted_renderer.format, self.get_representation_params(), timestamps, counts],
+            cls=DjangoJSONEncoder,
+            sort_keys=True,
+        )
+        etag = quote_etag(hashlib.md5(payload.encode('utf-8')).hexdigest())
+        present = [value for value in timestamps if value is not None]
+        last_modified = int(max(present).timestamp()) if present else None
+        return etag, last_modified
+
+    def get_representation_params(self):
+        """Параметры запроса, от которых зависит тело ответа, в нормализованном виде."""
+        params = {}
+        for name, values in self.request.query_params.lists():
+            if name in (sparse.FIELDS_PARAM, sparse.EXPAND_PARAM):
+                # Разбираются как в sparse: fields=b,a и fields=a,b - одно представление
+                tree = sparse.parse(self.request.query_params.get(name))
+                if tree:
+                    params[name] = tree
+            else:
+                params[name] = values
+        return params
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=None if self.conditional_counts else last_modified,
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+            # Медицинские данные: только кэш клиента и только с проверкой актуальности
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,56 @@
+"""
+Глобальные счетчики строк для публичной статистики (главная страница).
+
+Значения хранятся в GlobalCounter и меняются сигналами post_save/post_delete
+(см. patients.signals) одним UPDATE с F-выражением; удаление queryset'ом или
+каскадом меняет счетчик одним UPDATE на все строки после коммита. Массовые
+операции без сигналов (bulk_create) вызывают adjust или recount сами. Если строки
+счетчика нет, используется оценка планировщика PostgreSQL (pg_class.reltuples)
+вместо полного COUNT, на других СУБД - COUNT.
+"""
+from django.apps import apps
+from django.db import connection
+from django.db.models import F
+
+from .models import GlobalCounter
+
+# Счетчик -> модель, строки которой он считает
+COUNTED_MODELS = {
+    'hospitals': 'hospitals.Hospital',
+    'patients': 'patients.Patient',
+}
+
+
+def adjust(name, delta):
+    """Изменить счетчик на delta (атомарно)."""
+    if delta:
+        GlobalCounter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def recount(*names):
+    """Пересчитать счетчики точным COUNT (все, если имена не указаны)."""
+    for name in names or COUNTED_MODELS:
+        model = apps.get_model(COUNTED_MODELS[name])
+        GlobalCounter.objects.update_or_create(name=name, defaults={'value': model.objects.count()})
+
+
+def estimate(name):
+    """Оценка числа строк без полного просмотра таблицы (PostgreSQL), иначе COUNT."""
+    model = apps.get_model(COUNTED_MODELS[name])
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1: таблица еще ни разу не анализировалась
+        if row and row[0] >= 0:
+            return row[0]
+    return model.objects.count()
+
+
+def totals(*names):
+    """Значения счетчиков {имя: значение} одним запросом."""
+    values = dict(GlobalCounter.objects.filter(name__in=names).values_list('name', 'value'))
+    for name in names:
+        if name not in values:
+            values[name] = estimate(name)
+    return values
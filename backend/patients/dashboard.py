@@ -0,0 +1,121 @@
+"""
+Статистика кабинета: пациенты, карточки, консилиумы и непрочитанные сообщения.
+
+Каждая сущность считается одним запросом с условной агрегацией
+(Count/Sum с filter), результат хранится в общем кэше как снимок
+пользователя. Вместе со снимком записываются поколения, действовавшие до
+подсчета: сигналы (см. patients.signals) увеличивают поколение затронутых
+пользователей, а изменение пациентов и карточек больницы - еще и поколение
+ее администраторов и суперадминистраторов (их счетчики пациентов и карточек
+зависят от всей больницы или системы). Консилиумы и сообщения в статистике
+администратора учитываются только по его участию, поэтому поколение
+администраторов не трогают. Снимок с устаревшим поколением пересчитывается,
+поэтому изменение, пришедшее во время подсчета, не теряется. Повторная
+загрузка кабинета - одно чтение из кэша (get_many).
+
+Поколения должны быть общими для всех процессов: с кэшем в памяти процесса
+(без Redis) снимок живет недолго, см. DASHBOARD_SNAPSHOT_TIMEOUT.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q, Sum
+from django.db.models.functions import Coalesce
+
+from . import access
+from .models import Case
+
+SNAPSHOT_KEY = 'dashboard:{}'
+USER_GENERATION_KEY = 'dashboard:{}:generation'
+ADMIN_GENERATION_KEY = 'dashboard:admin:generation'
+HOSPITAL_GENERATION_KEY = 'dashboard:hospital:{}:generation'
+
+
+def compute(user):
+    """Статистика пользователя из БД (без кэша)."""
+    cases = (
+        Case.objects.filter(doctors=user)
+        .annotate(cursor=FilteredRelation('read_cursors', condition=Q(read_cursors__user=user)))
+        .aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(status__in=Case.ACTIVE_STATUSES)),
+            unread=Coalesce(Sum('cursor__unread_count'), 0),
+        )
+    )
+    return {
+        'total_patients': access.patients_for(user).count(),
+        'total_records': access.records_for(user).count(),
+        'total_cases': cases['total'],
+        'active_cases': cases['active'],
+        'total_unread': cases['unread'],
+    }
+
+
+def _generation_keys(user):
+    keys = [USER_GENERATION_KEY.format(user.pk)]
+    if user.role == 'superadmin':
+        keys.append(ADMIN_GENERATION_KEY)
+    elif user.role == 'hospital_admin':
+        keys.append(HOSPITAL_GENERATION_KEY.format(user.hospital_id))
+    return keys
+
+
+def statistics(user):
+    """Статистика пользователя из снимка в кэше (пересчитывается, если снимок устарел)."""
+    snapshot_key = SNAPSHOT_KEY.format(user.pk)
+    generation_keys = _generation_keys(user)
+    values = cache.get_many([snapshot_key] + generation_keys)
+    missing = [key for key in generation_keys if key not in values]
+    if missing:
+        # Начальное поколение уникально: снимок, записанный до вытеснения ключа, с ним не совпадет
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        values.update(cache.get_many(missing))
+    generation = [values.get(key, 0) for key in generation_keys]
+    snapshot = values.get(snapshot_key)
+    if snapshot is not None and snapshot['generation'] == generation:
+        return snapshot['stats']
+    stats = compute(user)
+    cache.set(snapshot_key, {'generation': generation, 'stats': stats}, settings.DASHBOARD_SNAPSHOT_TIMEOUT)
+    return stats
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключа нет: снимки с ним и так будут пересчитаны (см. statistics)
+        pass
+
+
+def invalidate(user_ids=(), hospital_ids=()):
+    """Устарели снимки пользователей user_ids и администраторов больниц hospital_ids.
+
+    Пациенты без больницы передаются как None: их видят только суперадминистраторы.
+    """
+    keys = [USER_GENERATION_KEY.format(user_id) for user_id in set(user_ids) if user_id is not None]
+    hospital_ids = set(hospital_ids)
+    if hospital_ids:
+        keys.append(ADMIN_GENERATION_KEY)
+        keys.extend(HOSPITAL_GENERATION_KEY.format(hospital_id) for hospital_id in hospital_ids)
+
+    def bump():
+        for key in keys:
+            _bump(key)
+
+    # Сразу - для чтения в том же запросе, и после коммита - иначе снимок,
+    # посчитанный параллельно по еще не закоммиченным данным, остался бы актуальным
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_case(case_id):
+    """Устарели снимки участников консилиума."""
+    invalidate_cases(Case.objects.filter(pk=case_id))
+
+
+def invalidate_cases(cases):
+    """Устарели снимки участников консилиумов cases (queryset)."""
+    invalidate(Case.doctors.through.objects.filter(case__in=cases).values_list('user_id', flat=True).distinct())
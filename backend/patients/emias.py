@@ -0,0 +1,208 @@
+"""
+Синхронизация пациентов с ЕМИАС.
+
+Данные запрашиваются асинхронно с ограничением числа одновременных запросов,
+а записываются в БД пачками через bulk_update. Синхронизация инкрементальная:
+берутся пациенты, не синхронизированные дольше EMIAS_SYNC_STALE_AFTER, и
+клиент передает серверу время прошлой синхронизации, чтобы тот вернул только
+изменения.
+
+Клиент подключаемый (настройка EMIAS_CLIENT). HTTP API ЕМИАС (по умолчанию
+локальная заглушка, см. patients.emias_stub):
+
+    GET {EMIAS_API_URL}/patients/<id>/?since=<ISO 8601>
+    200 {"lab_results": {...}, "last_hospitalization": "..."}
+    (формат lab_results см. patients.labs)
+    304 - изменений нет, 404 - пациент неизвестен ЕМИАС
+"""
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import labs
+from .models import Patient
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED = object()
+
+SYNC_FIELDS = ['last_hospitalization', 'emias_last_synced']
+
+
+class EmiasError(Exception):
+    """Ошибка обращения к ЕМИАС."""
+
+
+class HttpEmiasClient:
+    """Клиент HTTP API ЕМИАС на стандартной библиотеке (запросы выполняются в потоках)."""
+
+    def __init__(self, base_url=None, timeout=None):
+        self.base_url = (base_url or settings.EMIAS_API_URL).rstrip('/')
+        self.timeout = timeout or settings.EMIAS_TIMEOUT
+        if not self.base_url:
+            raise EmiasError('EMIAS_API_URL не задан')
+
+    def _get(self, patient_id, since):
+        url = f'{self.base_url}/patients/{patient_id}/'
+        if since:
+            url += '?' + urlencode({'since': since.isoformat()})
+        request = Request(url, headers={'Accept': 'application/json'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except HTTPError as e:
+            if e.code == 304:
+                return NOT_MODIFIED
+            if e.code == 404:
+                return None
+            raise EmiasError(f'ЕМИАС вернул {e.code} для пациента {patient_id}')
+        except (OSError, ValueError) as e:
+            raise EmiasError(f'Ошибка запроса пациента {patient_id}: {e}')
+
+    async def fetch_patient(self, patient_id, since=None):
+        """Данные пациента, NOT_MODIFIED или None, если пациент ЕМИАС неизвестен."""
+        return await asyncio.to_thread(self._get, patient_id, since)
+
+
+def get_client():
+    return import_string(settings.EMIAS_CLIENT)()
+
+
+class SyncStats:
+    def __init__(self):
+        self.updated = 0
+        self.unchanged = 0
+        self.missing = 0
+        self.failed = 0
+
+    @property
+    def total(self):
+        return self.updated + self.unchanged + self.missing + self.failed
+
+    def __str__(self):
+        return (
+            f'обновлено: {self.updated}, без изменений: {self.unchanged}, '
+            f'нет в ЕМИАС: {self.missing}, ошибок: {self.failed}'
+        )
+
+
+async def _fetch_batch(client, patients, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(patient_id, since):
+        async with semaphore:
+            try:
+                return await client.fetch_patient(patient_id, since)
+            except EmiasError as e:
+                return e
+
+    return await asyncio.gather(*(fetch(patient_id, since) for patient_id, since in patients))
+
+
+def stale_patients(queryset=None, stale_after=None):
+    """Пациенты, которых пора синхронизировать."""
+    queryset = Patient.objects.all() if queryset is None else queryset
+    if stale_after is None:
+        stale_after = timedelta(seconds=settings.EMIAS_SYNC_STALE_AFTER)
+    threshold = timezone.now() - stale_after
+    return queryset.filter(Q(emias_last_synced__isnull=True) | Q(emias_last_synced__lt=threshold))
+
+
+def sync_patients(queryset=None, client=None, concurrency=None, batch_size=None, stale_after=None):
+    """Синхронизировать пациентов с ЕМИАС. Возвращает SyncStats.
+
+    Запросы одной пачки выполняются параллельно (не больше concurrency
+    одновременно), затем пачка записывается одним bulk_update.
+    """
+    client = client or get_client()
+    concurrency = concurrency or settings.EMIAS_SYNC_CONCURRENCY
+    batch_size = batch_size or settings.EMIAS_SYNC_BATCH_SIZE
+    stats = SyncStats()
+
+    rows = stale_patients(queryset, stale_after).order_by('id').values_list('id', 'emias_last_synced')
+    last_id = 0
+    while True:
+        # Keyset по id: обновленные пачки не сдвигают следующие
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        results = asyncio.run(_fetch_batch(client, batch, concurrency))
+        synced_at = timezone.now()
+        updates = []
+        lab_results = []
+        for (patient_id, _), result in zip(batch, results):
+            if isinstance(result, EmiasError):
+                stats.failed += 1
+                continue
+            patient = Patient(pk=patient_id, emias_last_synced=synced_at)
+            fields = ['emias_last_synced']
+            if result is NOT_MODIFIED:
+                stats.unchanged += 1
+            elif result is None:
+                stats.missing += 1
+            else:
+                lab_results.extend(labs.results_from_json(patient_id, result.get('lab_results'), synced_at))
+                patient.last_hospitalization = result.get('last_hospitalization')
+                fields = SYNC_FIELDS
+                stats.updated += 1
+            updates.append((fields, patient))
+
+        with transaction.atomic():
+            labs.bulk_ingest(lab_results)
+            # Пациенты без изменений обновляют только время синхронизации
+            for fields in (SYNC_FIELDS, ['emias_last_synced']):
+                objs = [patient for patient_fields, patient in updates if patient_fields == fields]
+                if objs:
+                    Patient.objects.bulk_update(objs, fields)
+    return stats
+
+
+# --- Фоновый запуск из веб-процесса ---
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='emias-sync')
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+
+def _run_in_background(key, patient_ids):
+    close_old_connections()
+    try:
+        stats = sync_patients(Patient.objects.filter(id__in=patient_ids))
+        logger.info('Синхронизация с ЕМИАС: %s', stats)
+        return stats
+    except Exception:
+        logger.exception('Ошибка фоновой синхронизации с ЕМИАС')
+        raise
+    finally:
+        with _scheduled_lock:
+            _scheduled.discard(key)
+        connections.close_all()
+
+
+def schedule_sync(patient_ids, key=None):
+    """Запустить синхронизацию в фоновом потоке, не дожидаясь результата.
+
+    Повторный запуск с тем же key, пока предыдущий не завершился, игнорируется.
+    Возвращает Future или None, если синхронизация уже запланирована.
+    """
+    patient_ids = list(patient_ids)
+    key = key or tuple(patient_ids)
+    with _scheduled_lock:
+        if key in _scheduled:
+            return None
+        _scheduled.add(key)
+    return _executor.submit(_run_in_background, key, patient_ids)
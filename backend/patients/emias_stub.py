@@ -0,0 +1,113 @@
+"""
+Локальная заглушка HTTP API ЕМИАС для разработки и тестов.
+
+Данные пациента детерминированно выводятся из его id; результаты анализов
+«обновляются» раз в CHANGE_PERIOD, так что инкрементальный запрос с since
+возвращает 304, если с тех пор ничего не изменилось.
+"""
+import json
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PATIENT_PATH = re.compile(r'^/patients/(?P<patient_id>\d+)/?$')
+
+# Как часто у пациента появляются новые результаты
+CHANGE_PERIOD = timedelta(hours=6)
+
+ANALYTES = {
+    'Гемоглобин': ('г/л', '120-160', 100, 170),
+    'Лейкоциты': ('10^9/л', '4.0-9.0', 3.0, 14.0),
+    'Глюкоза': ('ммоль/л', '3.9-6.1', 3.5, 11.0),
+    'Креатинин': ('мкмоль/л', '62-115', 50, 180),
+    'Холестерин': ('ммоль/л', '< 5.2', 3.0, 8.5),
+}
+
+HOSPITALIZATIONS = [
+    None,
+    'Кардиологическое отделение, 7 дней',
+    'Терапевтическое отделение, 5 дней',
+    'Неврологическое отделение, 10 дней',
+]
+
+
+def last_change(patient_id, now=None):
+    """Время последнего изменения данных пациента."""
+    now = now or datetime.now(timezone.utc)
+    period = CHANGE_PERIOD.total_seconds()
+    # Пациенты обновляются в разное время внутри периода
+    offset = (patient_id * 7919) % int(period)
+    ts = (now.timestamp() - offset) // period * period + offset
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+def patient_payload(patient_id, changed_at):
+    rng = random.Random(f'{patient_id}:{changed_at.timestamp()}')
+    lab_results = {}
+    for name, (unit, reference, low, high) in ANALYTES.items():
+        lab_results[name] = {
+            'value': round(rng.uniform(low, high), 1),
+            'unit': unit,
+            'reference': reference,
+            'taken_at': changed_at.isoformat(),
+        }
+    return {
+        'patient_id': patient_id,
+        'updated_at': changed_at.isoformat(),
+        'lab_results': lab_results,
+        'last_hospitalization': rng.choice(HOSPITALIZATIONS),
+    }
+
+
+class EmiasStubHandler(BaseHTTPRequestHandler):
+    """GET /patients/<id>/?since=... (см. patients.emias)."""
+
+    latency = 0.0
+    missing_every = 0
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        match = PATIENT_PATH.match(url.path)
+        if match is None:
+            self.send_error(404)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+
+        patient_id = int(match.group('patient_id'))
+        if self.missing_every and patient_id % self.missing_every == 0:
+            self.send_error(404)
+            return
+
+        changed_at = last_change(patient_id)
+        since = parse_qs(url.query).get('since')
+        if since:
+            try:
+                if datetime.fromisoformat(since[0]) >= changed_at:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+            except ValueError:
+                self.send_error(400, 'Некорректный since')
+                return
+
+        body = json.dumps(patient_payload(patient_id, changed_at), ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=8765, latency=0.0, missing_every=0):
+    """HTTP-сервер заглушки; port=0 выбирает свободный порт (server.server_address)."""
+    handler = type('Handler', (EmiasStubHandler,), {'latency': latency, 'missing_every': missing_every})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,255 @@
+"""
+Потоковый импорт пациентов и медицинских карточек из CSV или JSONL.
+
+Файл читается построчно и не загружается в память целиком. Каждая строка
+описывает пациента и, при необходимости, его медицинские карточки и лечащего
+врача. Корректные строки копятся пачками и записываются через bulk_create,
+каждая пачка в своей транзакции; строки с ошибками пропускаются и попадают
+в отчет.
+
+CSV: колонки пациента (first_name, last_name, middle_name, date_of_birth,
+gender, phone, email, address, hospital_id), одна карточка в колонках с
+префиксом record_ (record_visit_date, record_chief_complaint, ...) и
+doctor_email для привязки к врачу.
+
+JSONL: те же ключи пациента, doctor_email и список карточек records
+(ключи без префикса).
+
+bulk_create не вызывает сигналы, поэтому денормализованные поля пациента
+(основной диагноз), счетчик пациентов и статистика кабинетов врачей
+обновляются здесь же. Требуется СУБД, возвращающая id
+из bulk_create (PostgreSQL, SQLite 3.35+).
+"""
+import csv
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import counters, dashboard
+from .models import MedicalRecord, Patient, PatientDoctorRelation
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Сколько отклоненных строк хранить в отчете (остальные только считаются)
+REJECTS_LIMIT = 100
+
+PATIENT_FIELDS = (
+    'first_name', 'last_name', 'middle_name', 'date_of_birth', 'gender',
+    'phone', 'email', 'address', 'hospital_id',
+)
+RECORD_FIELDS = (
+    'visit_date', 'chief_complaint', 'diagnosis', 'anamnesis', 'allergies',
+    'chronic_diseases', 'current_medications', 'notes',
+)
+RECORD_PREFIX = 'record_'
+
+
+class RowError(Exception):
+    """Строка файла не прошла проверку."""
+
+
+class ImportStats:
+    """Итоги импорта."""
+
+    def __init__(self):
+        self.rows = 0
+        self.patients = 0
+        self.records = 0
+        self.relations = 0
+        self.rejected = 0
+        self.rejects = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.rejects) < REJECTS_LIMIT:
+            self.rejects.append((line, error))
+
+    def summary(self):
+        return (
+            f'Строк: {self.rows}, пациентов: {self.patients}, карточек: {self.records}, '
+            f'связей с врачами: {self.relations}, отклонено: {self.rejected}, '
+            f'{self.elapsed:.1f} с ({self.rows_per_second:.0f} строк/с)'
+        )
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value == '' else value
+
+
+def read_rows(stream, fmt):
+    """Строки файла как пары (номер строки, словарь). Формат: 'csv' или 'jsonl'."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, RowError(f'Некорректный JSON: {e}')
+                continue
+            if not isinstance(row, dict):
+                yield line_num, RowError('Ожидается JSON-объект')
+                continue
+            yield line_num, row
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def _errors(exc):
+    return '; '.join(
+        f'{field}: {" ".join(messages)}' for field, messages in exc.message_dict.items()
+    )
+
+
+class PatientImporter:
+    """Проверка строк и пакетная запись.
+
+    hospital и doctor задают больницу и лечащего врача по умолчанию
+    (hospital также ограничивает импорт одной больницей, а doctor_email -
+    врачами этой больницы).
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, hospital=None, doctor=None, on_reject=None):
+        from django.contrib.auth import get_user_model
+        from hospitals.models import Hospital
+
+        self.batch_size = batch_size
+        self.hospital = hospital
+        self.doctor = doctor
+        self.on_reject = on_reject
+        self.stats = ImportStats()
+        self._batch = []
+        self._hospital_ids = set(Hospital.objects.values_list('id', flat=True))
+        self._user_model = get_user_model()
+        self._doctors = {}
+
+    def _doctor_id(self, email):
+        if email is None:
+            return self.doctor.pk if self.doctor else None
+        email = email.lower()
+        if email not in self._doctors:
+            doctors = self._user_model.objects.filter(email__iexact=email, role='doctor')
+            if self.hospital is not None:
+                doctors = doctors.filter(hospital=self.hospital)
+            self._doctors[email] = doctors.values_list('id', flat=True).first()
+        if self._doctors[email] is None:
+            raise RowError(f'doctor_email: врач {email} не найден')
+        return self._doctors[email]
+
+    def _records(self, row):
+        if 'records' in row:
+            records = row['records'] or []
+            if not isinstance(records, list):
+                raise RowError('records: ожидается список')
+            return records
+        record = {field: row.get(RECORD_PREFIX + field) for field in RECORD_FIELDS}
+        return [record] if any(_clean(value) is not None for value in record.values()) else []
+
+    def build(self, row):
+        """Проверить строку. Возвращает (пациент, карточки, id врача) или поднимает RowError."""
+        patient = Patient(**{field: _clean(row.get(field)) for field in PATIENT_FIELDS})
+        if self.hospital is not None:
+            if patient.hospital_id is not None and str(patient.hospital_id) != str(self.hospital.pk):
+                raise RowError('hospital_id: можно импортировать только пациентов своей больницы')
+            patient.hospital_id = self.hospital.pk
+        try:
+            # Внешние ключи проверяются по заранее загруженному списку, без запроса на строку
+            patient.full_clean(exclude=['hospital'], validate_unique=False)
+            if patient.hospital_id is not None:
+                patient.hospital_id = int(patient.hospital_id)
+        except ValidationError as e:
+            raise RowError(_errors(e))
+        except (TypeError, ValueError):
+            raise RowError('hospital_id: ожидается число')
+        if patient.hospital_id is not None and patient.hospital_id not in self._hospital_ids:
+            raise RowError(f'hospital_id: больница {patient.hospital_id} не найдена')
+
+        doctor_id = self._doctor_id(_clean(row.get('doctor_email')))
+        records = []
+        for data in self._records(row):
+            if not isinstance(data, dict):
+                raise RowError('records: ожидается список объектов')
+            record = MedicalRecord(doctor_id=doctor_id, **{field: _clean(data.get(field)) for field in RECORD_FIELDS})
+            try:
+                record.full_clean(exclude=['patient', 'doctor'], validate_unique=False)
+            except ValidationError as e:
+                raise RowError(f'Карточка: {_errors(e)}')
+            records.append(record)
+
+        # Основной диагноз - из последней карточки (как Patient.compute_summary без консилиумов)
+        latest = max(records, key=lambda r: r.visit_date, default=None)
+        patient.summary_diagnosis = Patient.shorten_diagnosis(latest.diagnosis if latest else None)
+        return patient, records, doctor_id
+
+    def feed(self, line, row):
+        self.stats.rows += 1
+        try:
+            if isinstance(row, RowError):
+                raise row
+            self._batch.append(self.build(row))
+        except RowError as e:
+            self.stats.reject(line, str(e))
+            if self.on_reject:
+                self.on_reject(line, str(e))
+            return
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    @transaction.atomic
+    def flush(self):
+        """Записать накопленную пачку одной транзакцией."""
+        if not self._batch:
+            return
+        patients = Patient.objects.bulk_create([patient for patient, _, _ in self._batch])
+
+        records = []
+        relations = []
+        for patient, (_, patient_records, doctor_id) in zip(patients, self._batch):
+            for record in patient_records:
+                record.patient_id = patient.pk
+                records.append(record)
+            if doctor_id is not None:
+                relations.append(PatientDoctorRelation(patient_id=patient.pk, doctor_id=doctor_id, is_active=True))
+        MedicalRecord.objects.bulk_create(records, batch_size=self.batch_size)
+        PatientDoctorRelation.objects.bulk_create(relations, batch_size=self.batch_size, ignore_conflicts=True)
+        counters.adjust('patients', len(patients))
+        # Новые пациенты и карточки врачей входят в статистику их кабинетов
+        dashboard.invalidate(
+            [record.doctor_id for record in records] + [relation.doctor_id for relation in relations],
+            hospital_ids={patient.hospital_id for patient in patients},
+        )
+
+        self.stats.patients += len(patients)
+        self.stats.records += len(records)
+        self.stats.relations += len(relations)
+        self._batch = []
+
+    def run(self, stream, fmt):
+        for line, row in read_rows(stream, fmt):
+            self.feed(line, row)
+        self.flush()
+        self.stats.finished = time.monotonic()
+        return self.stats
+
+
+def import_patients(stream, fmt='csv', **options):
+    """Импортировать пациентов из текстового потока. Возвращает ImportStats."""
+    return PatientImporter(**options).run(stream, fmt)
@@ -0,0 +1,113 @@
+"""
+Лабораторные результаты: загрузка из JSON (ЕМИАС) и запросы по временным рядам.
+
+Формат JSON: {показатель: {"value": ..., "unit": ..., "reference": ...,
+"taken_at": ISO 8601}}. Если taken_at не указан, используется время
+получения данных. Повторная загрузка того же результата (пациент, показатель,
+время) обновляет значение, а не дублирует строку.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import LabResult
+
+UPDATE_FIELDS = ['value', 'value_text', 'unit', 'reference']
+
+
+def _taken_at(value, default):
+    if isinstance(value, datetime):
+        taken_at = value
+    else:
+        taken_at = parse_datetime(value) if isinstance(value, str) else None
+    if taken_at is None:
+        return default
+    if timezone.is_naive(taken_at):
+        taken_at = timezone.make_aware(taken_at, dt_timezone.utc)
+    return taken_at
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+
+
+def results_from_json(patient_id, lab_results, default_taken_at):
+    """Строки LabResult из JSON-словаря результатов пациента."""
+    results = []
+    for analyte, data in (lab_results or {}).items():
+        if not isinstance(data, dict):
+            data = {'value': data}
+        raw = data.get('value')
+        value = _number(raw)
+        results.append(LabResult(
+            patient_id=patient_id,
+            analyte=str(analyte)[:100],
+            value=value,
+            value_text='' if value is not None or raw is None else str(raw)[:100],
+            unit=str(data.get('unit') or '')[:50],
+            reference=str(data.get('reference') or '')[:100],
+            taken_at=_taken_at(data.get('taken_at'), default_taken_at),
+        ))
+    return results
+
+
+def bulk_ingest(results, batch_size=1000):
+    """Записать результаты пачками; существующие (пациент, показатель, время) обновляются."""
+    results = list(results)
+    if results:
+        LabResult.objects.bulk_create(
+            results,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['patient', 'analyte', 'taken_at'],
+            update_fields=UPDATE_FIELDS,
+        )
+    return len(results)
+
+
+def trend(patient_id, analyte, since=None):
+    """Значения показателя пациента по времени: [(taken_at, value, value_text), ...]."""
+    queryset = LabResult.objects.filter(patient_id=patient_id, analyte=analyte)
+    if since is not None:
+        queryset = queryset.filter(taken_at__gte=since)
+    return list(queryset.order_by('taken_at').values_list('taken_at', 'value', 'value_text'))
+
+
+def analytes(patient_id):
+    """Показатели, по которым у пациента есть результаты."""
+    return list(
+        LabResult.objects.filter(patient_id=patient_id).values_list('analyte', flat=True).distinct().order_by('analyte')
+    )
+
+
+def rising(analyte, since=None, days=90, patients=None):
+    """Пациенты, у которых показатель вырос за период: первое значение периода меньше последнего.
+
+    Возвращает queryset словарей {patient, first_value, last_value, measurements}.
+    patients ограничивает выборку (например, пациентами врача).
+    """
+    if since is None:
+        since = timezone.now() - timedelta(days=days)
+    window = LabResult.objects.filter(analyte=analyte, taken_at__gte=since, value__isnull=False)
+    if patients is not None:
+        window = window.filter(patient__in=patients)
+    per_patient = window.filter(patient_id=OuterRef('patient_id'))
+    return (
+        window.values('patient')
+        .annotate(
+            measurements=Count('id'),
+            first_value=Subquery(per_patient.order_by('taken_at').values('value')[:1]),
+            last_value=Subquery(per_patient.order_by('-taken_at').values('value')[:1]),
+        )
+        .filter(measurements__gte=2, last_value__gt=F('first_value'))
+        .order_by('patient')
+    )
@@ -0,0 +1,160 @@
+import gzip
+import io
+import json
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User
+from core import renderers
+from hospitals.models import Hospital
+from patients.models import MedicalRecord, Patient
+from patients.serializers import MedicalRecordSerializer, PatientSerializer
+
+FIRST_NAMES = ['Александр', 'Мария', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Андрей', 'Ольга']
+LAST_NAMES = ['Иванов', 'Петрова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова', 'Лебедев', 'Козлова']
+DIAGNOSES = ['Гипертоническая болезнь II ст.', 'ОРВИ', 'Сахарный диабет 2 типа', 'ИБС, стенокардия', None]
+
+
+def build_patients(rows, rng):
+    """Пациенты в памяти (без БД) с заполненными полями."""
+    hospitals = [Hospital(id=i, name=f'Городская больница №{i}') for i in range(1, 11)]
+    stamp = datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+    return [
+        Patient(
+            id=i,
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            middle_name='Иванович',
+            date_of_birth=date(1940, 1, 1) + timedelta(days=rng.randrange(25000)),
+            gender=rng.choice('MF'),
+            phone=f'+7 900 {rng.randrange(10 ** 7):07d}',
+            email=f'patient{i}@example.com',
+            address='г. Москва, ул. Ленина, д. 1',
+            hospital=rng.choice(hospitals),
+            created_at=stamp,
+            updated_at=stamp + timedelta(seconds=i),
+        )
+        for i in range(1, rows + 1)
+    ]
+
+
+def build_records(rows, rng):
+    """Медицинские карточки в памяти (без БД) со связанными пациентами и врачами."""
+    patients = build_patients(max(rows // 5, 1), rng)
+    doctors = [User(id=i, email=f'doctor{i}@example.com') for i in range(1, 51)]
+    stamp = datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+    return [
+        MedicalRecord(
+            id=i,
+            patient=rng.choice(patients),
+            doctor=rng.choice(doctors),
+            chief_complaint='Головная боль, слабость, повышение давления до 160/100',
+            diagnosis=rng.choice(DIAGNOSES),
+            anamnesis='Болеет в течение 5 лет, ухудшение в последние 2 недели.',
+            allergies=None,
+            chronic_diseases='Гипертоническая болезнь',
+            current_medications='Лизиноприл 10 мг',
+            notes='',
+            visit_date=date(2025, 1, 1) + timedelta(days=rng.randrange(365)),
+            created_at=stamp,
+            updated_at=stamp + timedelta(seconds=i),
+        )
+        for i in range(1, rows + 1)
+    ]
+
+
+DATASETS = {
+    'patients': (build_patients, PatientSerializer),
+    'records': (build_records, MedicalRecordSerializer),
+}
+
+
+def best_of(repeat, func):
+    """Минимальное время (с) из repeat запусков и результат последнего."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость JSON-сериализации списков пациентов и карточек: стандартный '
+        'JSONRenderer/JSONParser и core.renderers (orjson), а также сжатие gzip'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            action='append',
+            help='Число строк (можно несколько, по умолчанию: 1000, 10000 и 100000)',
+        )
+        parser.add_argument(
+            '--dataset', action='append', choices=list(DATASETS), help='Набор (по умолчанию: все)'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов, берется лучший (по умолчанию: 3)')
+        parser.add_argument('--seed', type=int, default=1, help='Seed генератора данных (по умолчанию: 1)')
+        parser.add_argument('--output', help='Записать результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть не меньше 1')
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING('orjson не установлен: core.renderers совпадает со стандартным'))
+
+        self.stdout.write(
+            f'  {"набор":<9} {"строк":>7} {"сериализ. мс":>13} {"json мс":>8} {"orjson мс":>10} '
+            f'{"x":>5} {"разбор мс":>10} {"orjson мс":>10} {"x":>5} {"КБ":>8} {"gzip КБ":>8} {"gzip мс":>8}'
+        )
+        results = []
+        for dataset in options['dataset'] or list(DATASETS):
+            build, serializer_class = DATASETS[dataset]
+            for rows in options['rows'] or [1000, 10000, 100000]:
+                results.append(self.measure(dataset, rows, build, serializer_class, options))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'results': results}, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+    def measure(self, dataset, rows, build, serializer_class, options):
+        repeat = options['repeat']
+        instances = build(rows, random.Random(options['seed']))
+        serialize_s, data = best_of(repeat, lambda: serializer_class(instances, many=True).data)
+
+        render_s, body = best_of(repeat, lambda: JSONRenderer().render(data))
+        fast_render_s, fast_body = best_of(repeat, lambda: renderers.FastJSONRenderer().render(data))
+        if fast_body != body:
+            raise CommandError(f'{dataset}: ответы JSONRenderer и FastJSONRenderer различаются')
+        parse_s, _ = best_of(repeat, lambda: JSONParser().parse(io.BytesIO(body)))
+        fast_parse_s, _ = best_of(repeat, lambda: renderers.FastJSONParser().parse(io.BytesIO(body)))
+        gzip_s, compressed = best_of(repeat, lambda: gzip.compress(body, compresslevel=6))
+
+        result = {
+            'dataset': dataset,
+            'rows': rows,
+            'serialize_ms': round(serialize_s * 1000, 1),
+            'render_ms': round(render_s * 1000, 1),
+            'fast_render_ms': round(fast_render_s * 1000, 1),
+            'parse_ms': round(parse_s * 1000, 1),
+            'fast_parse_ms': round(fast_parse_s * 1000, 1),
+            'bytes': len(body),
+            'gzip_bytes': len(compressed),
+            'gzip_ms': round(gzip_s * 1000, 1),
+        }
+        self.stdout.write(
+            f'  {dataset:<9} {rows:>7} {result["serialize_ms"]:>13.1f} {result["render_ms"]:>8.1f} '
+            f'{result["fast_render_ms"]:>10.1f} {render_s / fast_render_s:>5.1f} {result["parse_ms"]:>10.1f} '
+            f'{result["fast_parse_ms"]:>10.1f} {parse_s / fast_parse_s:>5.1f} {len(body) / 1024:>8.0f} '
+            f'{len(compressed) / 1024:>8.0f} {result["gzip_ms"]:>8.1f}'
+        )
+        return result
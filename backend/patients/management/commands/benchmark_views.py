@@ -0,0 +1,102 @@
+import json
+import platform
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from patients import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа, SQL-запросы и память страниц и API на синтетических данных '
+        '(в отдельной тестовой БД)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            action='append',
+            choices=list(benchmark.DATASETS),
+            help='Размер набора данных (можно несколько, по умолчанию: small и medium)',
+        )
+        parser.add_argument('--view', action='append', help='Только указанные сценарии (можно несколько)')
+        parser.add_argument('--iterations', type=int, default=20, help='Запросов на сценарий (по умолчанию: 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов (по умолчанию: 2)')
+        parser.add_argument('--seed', type=int, default=1, help='Seed генератора данных (по умолчанию: 1)')
+        parser.add_argument(
+            '--anchor', default='2026-01-01', help='Дата «сейчас» для данных, ГГГГ-ММ-ДД (по умолчанию: 2026-01-01)'
+        )
+        parser.add_argument('--output', help='Записать результаты в JSON файл')
+        parser.add_argument('--compare', help='Сравнить с результатами из JSON файла предыдущего запуска')
+
+    def handle(self, *args, **options):
+        views = options['view']
+        if views:
+            unknown = set(views) - {scenario.name for scenario in benchmark.SCENARIOS}
+            if unknown:
+                raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = {(row['dataset'], row['view']): row for row in json.load(f)['results']}
+
+        runner = DiscoverRunner(interactive=False, verbosity=0)
+        setup_test_environment()
+        old_config = runner.setup_databases()
+        results = []
+        try:
+            for dataset in options['dataset'] or ['small', 'medium']:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'Набор данных {dataset}: {benchmark.DATASETS[dataset]}'))
+                self.stdout.write(
+                    f'  {"сценарий":<26} {"код":>4} {"p50":>8} {"p95":>8} {"p99":>8} '
+                    f'{"запросов":>9} {"SQL мс":>8} {"память КБ":>10}'
+                )
+                results += benchmark.run(
+                    dataset,
+                    iterations=options['iterations'],
+                    warmup=options['warmup'],
+                    views=views,
+                    seed_value=options['seed'],
+                    anchor=options['anchor'],
+                    progress=lambda result: self.report(result, baseline),
+                )
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        if options['output']:
+            payload = {
+                'meta': {
+                    'created_at': datetime.now(dt_timezone.utc).isoformat(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'iterations': options['iterations'],
+                    'seed': options['seed'],
+                    'anchor': options['anchor'],
+                    'datasets': {name: benchmark.DATASETS[name] for name in options['dataset'] or ['small', 'medium']},
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+    def report(self, result, baseline):
+        line = (
+            f'  {result["view"]:<26} {result["status"]:>4} {result["p50_ms"]:>8.1f} {result["p95_ms"]:>8.1f} '
+            f'{result["p99_ms"]:>8.1f} {result["queries"]:>9} {result["sql_ms"]:>8.1f} {result["peak_kb"]:>10.1f}'
+        )
+        previous = baseline and baseline.get((result['dataset'], result['view']))
+        if previous:
+            line += (
+                f'  (было p95 {previous["p95_ms"]:.1f}, запросов {previous["queries"]})'
+            )
+        if result['status'] != 200 or (previous and result['queries'] > previous['queries']):
+            self.stdout.write(self.style.WARNING(line))
+        else:
+            self.stdout.write(line)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from patients.emias_stub import make_server
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальную заглушку HTTP API ЕМИАС'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Адрес (по умолчанию: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Порт (по умолчанию: 8765)')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Задержка ответа в секундах для имитации сети (по умолчанию: 0)',
+        )
+        parser.add_argument(
+            '--missing-every',
+            type=int,
+            default=0,
+            help='Каждый N-й пациент (по id) неизвестен ЕМИАС (по умолчанию: нет)',
+        )
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'], options['latency'], options['missing_every'])
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f'Заглушка ЕМИАС: http://{host}:{port}/ (EMIAS_API_URL)'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from patients import emias
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = 'Синхронизирует пациентов с ЕМИАС (только устаревшие, если не указан --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Синхронизировать всех пациентов')
+        parser.add_argument('--patient', type=int, action='append', help='ID пациента (можно несколько)')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.EMIAS_SYNC_CONCURRENCY,
+            help=f'Одновременных запросов к ЕМИАС (по умолчанию: {settings.EMIAS_SYNC_CONCURRENCY})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.EMIAS_SYNC_BATCH_SIZE,
+            help=f'Пациентов в одной пачке записи (по умолчанию: {settings.EMIAS_SYNC_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Patient.objects.all()
+        if options['patient']:
+            queryset = queryset.filter(id__in=options['patient'])
+
+        started = time.monotonic()
+        stats = emias.sync_patients(
+            queryset,
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            stale_after=timedelta(0) if options['all'] else None,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Синхронизировано пациентов: {stats.total} за {elapsed:.1f} с ({stats})'
+        ))
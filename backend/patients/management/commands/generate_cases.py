@@ -99,8 +99,7 @@ class Command(BaseCommand):
                 CaseMessage.objects.create(
                     case=case,
                     author=author,
-                    content=content,
-                    is_read=random.choice([True, False])
+                    content=content
                 )
             
             created_count += 1
@@ -0,0 +1,75 @@
+import csv
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from hospitals.models import Hospital
+from patients import importer
+
+
+class Command(BaseCommand):
+    help = 'Импортирует пациентов и медицинские карточки из CSV или JSONL файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для чтения из stdin')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Формат файла (по умолчанию определяется по расширению)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=importer.DEFAULT_BATCH_SIZE,
+            help=f'Количество пациентов в одной транзакции (по умолчанию: {importer.DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument('--hospital', type=int, help='ID больницы для всех пациентов')
+        parser.add_argument('--doctor', help='Email лечащего врача для строк без doctor_email')
+        parser.add_argument('--rejects', help='Записать отклоненные строки в CSV файл')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path == '-':
+                raise CommandError('Для чтения из stdin укажите --format')
+            fmt = 'jsonl' if Path(path).suffix.lower() in ('.jsonl', '.ndjson') else 'csv'
+
+        hospital = None
+        if options['hospital']:
+            hospital = Hospital.objects.filter(id=options['hospital']).first()
+            if hospital is None:
+                raise CommandError(f'Больница {options["hospital"]} не найдена')
+        doctor = None
+        if options['doctor']:
+            doctor = User.objects.filter(email__iexact=options['doctor']).first()
+            if doctor is None:
+                raise CommandError(f'Врач {options["doctor"]} не найден')
+
+        rejects_file = open(options['rejects'], 'w', encoding='utf-8', newline='') if options['rejects'] else None
+        rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        if rejects_writer:
+            rejects_writer.writerow(['line', 'error'])
+
+        stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8-sig', newline='')
+        try:
+            stats = importer.import_patients(
+                stream,
+                fmt,
+                batch_size=options['batch_size'],
+                hospital=hospital,
+                doctor=doctor,
+                on_reject=(lambda line, error: rejects_writer.writerow([line, error])) if rejects_writer else None,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects_file:
+                rejects_file.close()
+
+        for line, error in stats.rejects[:20]:
+            self.stdout.write(self.style.WARNING(f'Строка {line}: {error}'))
+        if stats.rejected > 20:
+            self.stdout.write(self.style.WARNING(f'... и еще {stats.rejected - 20} отклоненных строк'))
+        self.stdout.write(self.style.SUCCESS(stats.summary()))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from patients import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс консилиумов для базы знаний'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество консилиумов в одной пачке (по умолчанию: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.ERROR(
+                f'Полнотекстовый поиск не поддерживается для СУБД {connection.vendor}.'
+            ))
+            return
+        
+        total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано консилиумов: {total}'))
@@ -0,0 +1,438 @@
+"""
+Management command для генерации воспроизводимого набора данных для нагрузочного тестирования.
+
+Все строки создаются через bulk_create пачками с явными временными метками
+(auto_now/auto_now_add на время генерации отключаются). Сигналы при этом не
+срабатывают, поэтому производные данные - курсоры чтения, счетчики реакций,
+записи базы знаний, основной диагноз пациента и поисковый индекс -
+заполняются командой, глобальные счетчики пересчитываются, а кэш
+справочников и статистики кабинета сбрасывается.
+
+Пример (объемы продакшена):
+    python manage.py seed_dataset --seed 42 --patients 100000 --cases 50000 --messages 2000000
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import User
+from hospitals.models import Hospital
+from patients import counters, dashboard, reference_data, search
+from patients.models import (
+    Case, CaseMessage, CaseReadCursor, KnowledgeBaseEntry, MedicalRecord, MessageReaction, Patient,
+    PatientDoctorRelation,
+)
+
+FIRST_NAMES = {
+    'M': ['Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Артем', 'Илья', 'Кирилл', 'Михаил'],
+    'F': ['Анна', 'Мария', 'Елена', 'Наталья', 'Ольга', 'Татьяна', 'Ирина', 'Екатерина', 'Светлана', 'Юлия'],
+}
+MIDDLE_NAMES = {
+    'M': ['Александрович', 'Дмитриевич', 'Максимович', 'Сергеевич', 'Андреевич', 'Михайлович'],
+    'F': ['Александровна', 'Дмитриевна', 'Максимовна', 'Сергеевна', 'Андреевна', 'Михайловна'],
+}
+LAST_NAMES = [
+    'Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов', 'Новиков',
+    'Морозов', 'Волков', 'Соловьев', 'Васильев', 'Зайцев', 'Павлов', 'Семенов', 'Голубев', 'Виноградов', 'Орлов',
+]
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань']
+DIAGNOSES = [
+    'I10 Эссенциальная (первичная) гипертензия',
+    'E11 Сахарный диабет 2 типа',
+    'J44 Другая хроническая обструктивная легочная болезнь',
+    'I25 Хроническая ишемическая болезнь сердца',
+    'I21.9 Острый инфаркт миокарда неуточненный',
+    'I63.9 Церебральный инфаркт неуточненный',
+    'G93.4 Энцефалопатия неуточненная',
+    'N18 Хроническая болезнь почек',
+    'I50 Сердечная недостаточность',
+    'J18 Пневмония неуточненного возбудителя',
+]
+DESCRIPTIONS = [
+    'Пациент поступил с жалобами на головную боль и повышение артериального давления.',
+    'Сложный случай, требующий мнения нескольких специалистов.',
+    'Пациент с множественными сопутствующими заболеваниями. Требуется комплексный подход к лечению.',
+    'Необходимо определить показания к инвазивным вмешательствам.',
+    'Требуется консилиум для определения тактики лечения и необходимости оперативного вмешательства.',
+]
+CHRONIC_DISEASES = ['Гипертония', 'Сахарный диабет 2 типа', 'ХОБЛ', 'ИБС', 'ХБП', 'Ожирение']
+MESSAGES = [
+    'Рекомендую провести дополнительное обследование.',
+    'Согласен с предложенной тактикой лечения.',
+    'Необходимо скорректировать дозировку препаратов.',
+    'Предлагаю назначить контрольные анализы через неделю.',
+    'Есть показания к госпитализации в профильное отделение.',
+    'Противопоказаний к оперативному вмешательству не вижу.',
+    'Рекомендую консультацию смежного специалиста.',
+    'Динамика положительная, продолжаем текущую терапию.',
+]
+STATUSES = [('stable', 0.5), ('monitoring', 0.35), ('urgent', 0.15)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Отключить auto_now/auto_now_add, чтобы bulk_create сохранил заданные временные метки."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Генерирует воспроизводимый набор данных для нагрузочного тестирования (bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Seed генератора (по умолчанию: 1)')
+        parser.add_argument('--patients', type=int, default=1000, help='Количество пациентов (по умолчанию: 1000)')
+        parser.add_argument('--cases', type=int, default=500, help='Количество консилиумов (по умолчанию: 500)')
+        parser.add_argument(
+            '--messages', type=int, default=10000, help='Количество сообщений всего (по умолчанию: 10000)'
+        )
+        parser.add_argument('--doctors', type=int, default=100, help='Количество врачей (по умолчанию: 100)')
+        parser.add_argument('--hospitals', type=int, default=10, help='Количество больниц (по умолчанию: 10)')
+        parser.add_argument(
+            '--records-per-patient',
+            type=int,
+            default=2,
+            help='Медицинских карточек на пациента (по умолчанию: 2)',
+        )
+        parser.add_argument(
+            '--reaction-rate',
+            type=float,
+            default=0.3,
+            help='Доля сообщений с реакциями (по умолчанию: 0.3)',
+        )
+        parser.add_argument(
+            '--anchor',
+            type=date.fromisoformat,
+            default=None,
+            help='Дата «сейчас» для временных меток, ГГГГ-ММ-ДД (по умолчанию: сегодня)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Строк в одном INSERT (по умолчанию: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['cases'] and not options['patients']:
+            raise CommandError('Для консилиумов нужны пациенты (--patients > 0)')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        anchor = options['anchor'] or date.today()
+        self.now = datetime.combine(anchor, dt_time(12, 0), tzinfo=dt_timezone.utc)
+        self.started = time.monotonic()
+        # Основной диагноз пациента: (время, диагноз) последнего активного и последнего любого консилиума
+        self.summary = {}
+
+        with explicit_timestamps(
+            Hospital, User, Patient, MedicalRecord, Case, CaseMessage, MessageReaction, KnowledgeBaseEntry
+        ):
+            hospital_ids = self.create_hospitals(options['seed'], options['hospitals'])
+            doctors = self.create_doctors(options['seed'], options['doctors'], hospital_ids)
+            patient_ids = self.create_patients(options['patients'], options['records_per_patient'], hospital_ids, doctors)
+            if options['cases']:
+                if not doctors:
+                    raise CommandError('Для консилиумов нужны врачи (--doctors > 0)')
+                self.create_cases(options['cases'], options['messages'], options['reaction_rate'], patient_ids, doctors)
+        self.update_patient_summaries()
+
+        self.log('Перестройка поискового индекса')
+        search.rebuild_index()
+        # bulk_create не вызывает сигналы, сбрасывающие кэш справочников и статистики кабинета
+        # и обновляющие глобальные счетчики
+        reference_data.invalidate('hospitals', 'stable_case_specialties')
+        dashboard.invalidate(User.objects.values_list('pk', flat=True))
+        counters.recount()
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.monotonic() - self.started:.1f} с'))
+
+    def log(self, message):
+        self.stdout.write(f'[{time.monotonic() - self.started:7.1f} с] {message}')
+
+    def moment(self, max_days):
+        """Случайный момент в прошлом, не дальше max_days дней от «сейчас»."""
+        return self.now - timedelta(seconds=self.rng.randint(0, max_days * 24 * 60 * 60))
+
+    # --- Справочники ---
+
+    def create_hospitals(self, seed, count):
+        prefix = f'Seed {seed} '
+        existing = list(Hospital.objects.filter(name__startswith=prefix).values_list('id', flat=True))
+        missing = count - len(existing)
+        if missing > 0:
+            hospitals = [
+                Hospital(
+                    name=f'{prefix}ГКБ №{len(existing) + i + 1}',
+                    city=self.rng.choice(CITIES),
+                    created_at=self.now,
+                    updated_at=self.now,
+                )
+                for i in range(missing)
+            ]
+            existing += [hospital.pk for hospital in Hospital.objects.bulk_create(hospitals)]
+        return existing[:count]
+
+    def create_doctors(self, seed, count, hospital_ids):
+        """Врачи с общим неиспользуемым паролем; повторный запуск с тем же seed переиспользует их."""
+        email = 'seed{}.doctor{}@example.com'
+        existing = {
+            user.email: user
+            for user in User.objects.filter(email__startswith=f'seed{seed}.doctor').only('id', 'email', 'specialty')
+        }
+        password = make_password(None)
+        specialties = [choice for choice, _ in User.SPECIALTY_CHOICES]
+        new = []
+        for i in range(count):
+            if email.format(seed, i) in existing:
+                continue
+            gender = self.rng.choice('MF')
+            user = User(
+                username=f'seed{seed}_doctor{i}',
+                email=email.format(seed, i),
+                password=password,
+                role='doctor',
+                first_name=self.rng.choice(FIRST_NAMES[gender]),
+                last_name=self.rng.choice(LAST_NAMES) + ('а' if gender == 'F' else ''),
+                specialty=self.rng.choice(specialties),
+                hospital_id=self.rng.choice(hospital_ids) if hospital_ids else None,
+                date_joined=self.moment(365),
+            )
+            user.updated_at = user.date_joined
+            new.append(user)
+        for user in User.objects.bulk_create(new, batch_size=self.batch_size):
+            existing[user.email] = user
+        doctors = [existing[email.format(seed, i)] for i in range(count)]
+        self.log(f'Врачей: {len(doctors)} (новых {len(new)})')
+        return doctors
+
+    # --- Пациенты и карточки ---
+
+    def create_patients(self, count, records_per_patient, hospital_ids, doctors):
+        patient_ids = []
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            patients = []
+            records = []
+            for _ in range(size):
+                gender = self.rng.choice('MF')
+                created_at = self.moment(3 * 365)
+                patient = Patient(
+                    first_name=self.rng.choice(FIRST_NAMES[gender]),
+                    last_name=self.rng.choice(LAST_NAMES) + ('а' if gender == 'F' else ''),
+                    middle_name=self.rng.choice(MIDDLE_NAMES[gender]),
+                    date_of_birth=(self.now - timedelta(days=self.rng.randint(18 * 365, 90 * 365))).date(),
+                    gender=gender,
+                    phone=f'+7{self.rng.randint(900, 999)}{self.rng.randint(1000000, 9999999)}',
+                    hospital_id=self.rng.choice(hospital_ids) if hospital_ids else None,
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+                patient_records = []
+                for _ in range(records_per_patient):
+                    visit = self.moment(3 * 365)
+                    patient_records.append(MedicalRecord(
+                        doctor_id=self.rng.choice(doctors).pk if doctors else None,
+                        chief_complaint='Плановый осмотр',
+                        diagnosis=self.rng.choice(DIAGNOSES),
+                        chronic_diseases=', '.join(self.rng.sample(CHRONIC_DISEASES, self.rng.randint(0, 3))),
+                        visit_date=visit.date(),
+                        created_at=visit,
+                        updated_at=visit,
+                    ))
+                latest = max(patient_records, key=lambda record: record.visit_date, default=None)
+                patient.summary_diagnosis = Patient.shorten_diagnosis(latest.diagnosis if latest else None)
+                patients.append(patient)
+                records.append(patient_records)
+
+            with transaction.atomic():
+                created = Patient.objects.bulk_create(patients)
+                flat_records = []
+                relations = []
+                for patient, patient_records in zip(created, records):
+                    patient_ids.append(patient.pk)
+                    for record in patient_records:
+                        record.patient_id = patient.pk
+                        flat_records.append(record)
+                    if doctors:
+                        relations.append(PatientDoctorRelation(
+                            patient_id=patient.pk, doctor_id=self.rng.choice(doctors).pk, is_active=True
+                        ))
+                MedicalRecord.objects.bulk_create(flat_records, batch_size=self.batch_size)
+                PatientDoctorRelation.objects.bulk_create(relations, batch_size=self.batch_size, ignore_conflicts=True)
+            self.log(f'Пациентов: {offset + size}/{count}')
+        return patient_ids
+
+    # --- Консилиумы ---
+
+    def pick_status(self):
+        roll = self.rng.random()
+        for status, weight in STATUSES:
+            if roll < weight:
+                return status
+            roll -= weight
+        return STATUSES[-1][0]
+
+    def create_cases(self, count, messages_total, reaction_rate, patient_ids, doctors):
+        # Сообщений на консилиум в среднем messages_total / count
+        mean = messages_total / count
+        chunk = max(1, min(self.batch_size, int(self.batch_size / max(mean, 1)) or 1))
+        created_messages = 0
+        for offset in range(0, count, chunk):
+            size = min(chunk, count - offset)
+            budget = messages_total - created_messages
+            remaining_cases = count - offset
+            created_messages += self.create_case_chunk(size, budget, remaining_cases, reaction_rate, patient_ids, doctors)
+            self.log(f'Консилиумов: {offset + size}/{count}, сообщений: {created_messages}')
+
+    def create_case_chunk(self, size, budget, remaining_cases, reaction_rate, patient_ids, doctors):
+        cases = []
+        participants = []
+        for _ in range(size):
+            created_at = self.moment(365)
+            case_doctors = self.rng.sample(doctors, min(len(doctors), self.rng.randint(2, 5)))
+            cases.append(Case(
+                patient_id=self.rng.choice(patient_ids),
+                created_by_id=case_doctors[0].pk,
+                diagnosis=self.rng.choice(DIAGNOSES),
+                description=self.rng.choice(DESCRIPTIONS),
+                status=self.pick_status(),
+                admission_date=created_at.date(),
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+            participants.append(case_doctors)
+
+        with transaction.atomic():
+            Case.objects.bulk_create(cases)
+            Case.doctors.through.objects.bulk_create(
+                [
+                    Case.doctors.through(case_id=case.pk, user_id=doctor.pk)
+                    for case, case_doctors in zip(cases, participants)
+                    for doctor in case_doctors
+                ],
+                batch_size=self.batch_size,
+            )
+
+            messages = []
+            per_case = []
+            for index, (case, case_doctors) in enumerate(zip(cases, participants)):
+                # Распределяем оставшийся бюджет сообщений равномерно со случайным разбросом
+                mean = (budget - len(messages)) / max(remaining_cases - index, 1)
+                n = max(0, min(budget - len(messages), self.rng.randint(0, max(0, int(2 * mean)))))
+                if index == len(cases) - 1 and remaining_cases == len(cases):
+                    n = max(0, budget - len(messages))
+                moment = case.created_at
+                case_messages = []
+                for _ in range(n):
+                    moment = min(moment + timedelta(minutes=self.rng.randint(1, 240)), self.now)
+                    message = CaseMessage(
+                        case_id=case.pk,
+                        author_id=self.rng.choice(case_doctors).pk,
+                        content=self.rng.choice(MESSAGES),
+                        created_at=moment,
+                        updated_at=moment,
+                    )
+                    case_messages.append(message)
+                messages.extend(case_messages)
+                per_case.append(case_messages)
+            # Реакции создаются до вставки сообщений, чтобы сразу заполнить счетчики в сообщениях
+            reactions = []
+            for case_messages, case_doctors in zip(per_case, participants):
+                for message in case_messages:
+                    if self.rng.random() >= reaction_rate:
+                        continue
+                    others = [doctor for doctor in case_doctors if doctor.pk != message.author_id]
+                    for doctor in self.rng.sample(others, min(len(others), self.rng.randint(1, 2))):
+                        reaction = self.rng.choice(['👍', '👍', '👎'])
+                        field = CaseMessage.REACTION_COUNTERS[reaction]
+                        setattr(message, field, getattr(message, field) + 1)
+                        reactions.append(MessageReaction(
+                            message=message,
+                            user_id=doctor.pk,
+                            reaction=reaction,
+                            created_at=message.created_at + timedelta(minutes=self.rng.randint(1, 60)),
+                        ))
+            CaseMessage.objects.bulk_create(messages, batch_size=self.batch_size)
+            MessageReaction.objects.bulk_create(reactions, batch_size=self.batch_size)
+
+            self.create_read_cursors(cases, participants, per_case)
+            self.create_knowledge_entries(cases, participants, per_case)
+        self.track_summary(cases)
+        return len(messages)
+
+    def create_read_cursors(self, cases, participants, per_case):
+        """Курсоры чтения: завершенные прочитаны целиком, активные - до случайного сообщения."""
+        cursors = []
+        for case, case_doctors, case_messages in zip(cases, participants, per_case):
+            for doctor in case_doctors:
+                if case.status == 'stable' or not case_messages:
+                    read_upto = len(case_messages)
+                else:
+                    read_upto = self.rng.randint(0, len(case_messages))
+                unread = sum(1 for message in case_messages[read_upto:] if message.author_id != doctor.pk)
+                cursors.append(CaseReadCursor(
+                    case_id=case.pk,
+                    user_id=doctor.pk,
+                    last_read_at=case_messages[read_upto - 1].created_at if read_upto else None,
+                    unread_count=unread,
+                ))
+        CaseReadCursor.objects.bulk_create(cursors, batch_size=self.batch_size)
+
+    def create_knowledge_entries(self, cases, participants, per_case):
+        entries = []
+        for case, case_doctors, case_messages in zip(cases, participants, per_case):
+            if case.status != 'stable':
+                continue
+            entries.append(KnowledgeBaseEntry(
+                case_id=case.pk,
+                admission_date=case.admission_date,
+                completed_at=case_messages[-1].created_at if case_messages else case.created_at,
+                first_message_at=case_messages[0].created_at if case_messages else None,
+                last_message_at=case_messages[-1].created_at if case_messages else None,
+                decision=KnowledgeBaseEntry.format_decision(case_messages[-1].content if case_messages else None),
+                comorbidities=self.rng.sample(CHRONIC_DISEASES, self.rng.randint(0, KnowledgeBaseEntry.COMORBIDITIES_LIMIT)),
+                specialties=sorted({doctor.specialty for doctor in case_doctors if doctor.specialty}),
+                doctors_count=len(case_doctors),
+                messages_count=len(case_messages),
+            ))
+        KnowledgeBaseEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+
+    def track_summary(self, cases):
+        for case in cases:
+            active, latest = self.summary.get(case.patient_id, (None, None))
+            key = (case.created_at, case.diagnosis)
+            if latest is None or key > latest:
+                latest = key
+            if case.status in Case.ACTIVE_STATUSES and (active is None or key > active):
+                active = key
+            self.summary[case.patient_id] = (active, latest)
+
+    def update_patient_summaries(self):
+        """Основной диагноз и флаг активного консилиума пациентов с консилиумами (как Patient.compute_summary)."""
+        if not self.summary:
+            return
+        patients = []
+        for patient_id, (active, latest) in self.summary.items():
+            source = active or latest
+            patients.append(Patient(
+                pk=patient_id,
+                summary_diagnosis=Patient.shorten_diagnosis(source[1]),
+                has_active_case=active is not None,
+            ))
+        Patient.objects.bulk_update(patients, ['summary_diagnosis', 'has_active_case'], batch_size=self.batch_size)
+        self.log(f'Обновлены сводки пациентов: {len(patients)}')
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_read_cursors(apps, schema_editor):
+    """Создать курсоры для текущих участников, перенеся счетчики из CaseMessage.is_read."""
+    Case = apps.get_model('patients', 'Case')
+    CaseMessage = apps.get_model('patients', 'CaseMessage')
+    CaseReadCursor = apps.get_model('patients', 'CaseReadCursor')
+    
+    unread_by_author = {}
+    for row in CaseMessage.objects.filter(is_read=False).values('case_id', 'author_id').annotate(n=models.Count('id')):
+        unread_by_author[(row['case_id'], row['author_id'])] = row['n']
+    unread_totals = {}
+    for (case_id, _), n in unread_by_author.items():
+        unread_totals[case_id] = unread_totals.get(case_id, 0) + n
+    
+    cursors = []
+    for case_id, user_id in Case.doctors.through.objects.values_list('case_id', 'user_id').iterator():
+        cursors.append(CaseReadCursor(
+            case_id=case_id,
+            user_id=user_id,
+            unread_count=unread_totals.get(case_id, 0) - unread_by_author.get((case_id, user_id), 0),
+        ))
+        if len(cursors) >= 1000:
+            CaseReadCursor.objects.bulk_create(cursors, ignore_conflicts=True)
+            cursors = []
+    CaseReadCursor.objects.bulk_create(cursors, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('patients', '0005_patient_emias_lab_results_patient_emias_last_synced_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField(blank=True, null=True, verbose_name='Прочитано до')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='Непрочитанных сообщений')),
+                ('case', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='patients.case', verbose_name='Консилиум')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='case_read_cursors', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Курсор чтения консилиума',
+                'verbose_name_plural': 'Курсоры чтения консилиумов',
+                'indexes': [models.Index(fields=['user', 'case'], name='patients_cursor_user_case')],
+                'unique_together': {('case', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_read_cursors, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='casemessage',
+            name='is_read',
+        ),
+    ]
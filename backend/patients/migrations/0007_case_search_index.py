@@ -0,0 +1,90 @@
+import re
+
+import snowballstemmer
+from django.db import migrations
+
+# DDL и заполнение индекса зафиксированы здесь, а не импортируются из
+# patients.search: миграция не должна меняться вместе с рабочим кодом
+
+SEARCH_TABLE = 'patients_case_search'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text, stemmer):
+    tokens = []
+    for word in WORD_RE.findall((text or '').lower()):
+        if any('а' <= char <= 'я' or char == 'ё' for char in word):
+            word = stemmer.stemWord(word.replace('ё', 'е'))
+        if word:
+            tokens.append(word)
+    return ' '.join(tokens)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            ' case_id bigint PRIMARY KEY REFERENCES patients_case(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,'
+            ' document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_gin ON {SEARCH_TABLE} USING GIN (document)'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (case_id, document) '
+            "SELECT c.id, setweight(to_tsvector('russian', coalesce(c.diagnosis, '')), 'A')"
+            " || setweight(to_tsvector('russian', concat_ws(' ', p.last_name, p.first_name, p.middle_name)), 'B')"
+            " || setweight(to_tsvector('russian', coalesce(c.description, '')), 'C') "
+            'FROM patients_case c JOIN patients_patient p ON p.id = c.patient_id '
+            'ON CONFLICT (case_id) DO NOTHING'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            " diagnosis, patient_name, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        Case = apps.get_model('patients', 'Case')
+        stemmer = snowballstemmer.stemmer('russian')
+        rows = Case.objects.order_by('id').values_list(
+            'id', 'diagnosis', 'description',
+            'patient__last_name', 'patient__first_name', 'patient__middle_name',
+        )
+        batch = []
+        with schema_editor.connection.cursor() as cursor:
+            for case_id, diagnosis, description, *names in rows.iterator(chunk_size=1000):
+                batch.append((
+                    case_id,
+                    tokenize(diagnosis, stemmer),
+                    tokenize(' '.join(name for name in names if name), stemmer),
+                    tokenize(description, stemmer),
+                ))
+                if len(batch) >= 1000:
+                    cursor.executemany(
+                        f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, diagnosis, patient_name, description) '
+                        'VALUES (%s, %s, %s, %s)',
+                        batch,
+                    )
+                    batch = []
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, diagnosis, patient_name, description) '
+                'VALUES (%s, %s, %s, %s)',
+                batch,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_casereadcursor'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
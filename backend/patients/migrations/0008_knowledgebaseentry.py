@@ -0,0 +1,78 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def backfill_knowledge_base(apps, schema_editor):
+    """Построить записи базы знаний для уже завершенных консилиумов."""
+    Case = apps.get_model('patients', 'Case')
+    KnowledgeBaseEntry = apps.get_model('patients', 'KnowledgeBaseEntry')
+    
+    entries = []
+    for case in Case.objects.filter(status='stable').select_related('patient').iterator(chunk_size=500):
+        stats = case.messages.aggregate(
+            count=models.Count('id'), first=models.Min('created_at'), last=models.Max('created_at')
+        )
+        last_content = case.messages.order_by('-created_at', '-id').values_list('content', flat=True).first()
+        if not last_content:
+            decision = "Решение принято"
+        elif len(last_content) > 100:
+            decision = last_content[:100] + "..."
+        else:
+            decision = last_content
+        chronic_diseases = case.patient.medical_records.order_by('-visit_date').values_list(
+            'chronic_diseases', flat=True
+        ).first()
+        comorbidities = [d.strip() for d in (chronic_diseases or '').split(',') if d.strip()][:3]
+        specialties = list(case.doctors.values_list('specialty', flat=True))
+        entries.append(KnowledgeBaseEntry(
+            case_id=case.id,
+            admission_date=case.admission_date,
+            completed_at=case.updated_at or timezone.now(),
+            first_message_at=stats['first'],
+            last_message_at=stats['last'],
+            decision=decision,
+            comorbidities=comorbidities,
+            specialties=sorted({s for s in specialties if s}),
+            doctors_count=len(specialties),
+            messages_count=stats['count'],
+        ))
+        if len(entries) >= 500:
+            KnowledgeBaseEntry.objects.bulk_create(entries)
+            entries = []
+    KnowledgeBaseEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_case_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeBaseEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('admission_date', models.DateField(verbose_name='Дата поступления')),
+                ('completed_at', models.DateTimeField(verbose_name='Завершен')),
+                ('first_message_at', models.DateTimeField(blank=True, null=True, verbose_name='Первое сообщение')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее сообщение')),
+                ('decision', models.TextField(verbose_name='Итоговое решение')),
+                ('comorbidities', models.JSONField(blank=True, default=list, verbose_name='Коморбидности')),
+                ('specialties', models.JSONField(blank=True, default=list, verbose_name='Специальности участников')),
+                ('doctors_count', models.PositiveIntegerField(default=0, verbose_name='Количество врачей')),
+                ('messages_count', models.PositiveIntegerField(default=0, verbose_name='Количество сообщений')),
+                ('case', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='knowledge_entry', to='patients.case', verbose_name='Консилиум')),
+            ],
+            options={
+                'verbose_name': 'Запись базы знаний',
+                'verbose_name_plural': 'Записи базы знаний',
+                'ordering': ['-admission_date', '-case_id'],
+                'indexes': [models.Index(fields=['-admission_date', '-case'], name='patients_kb_admission')],
+            },
+        ),
+        migrations.RunPython(backfill_knowledge_base, migrations.RunPython.noop),
+    ]
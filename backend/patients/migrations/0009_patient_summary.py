@@ -0,0 +1,60 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:35
+
+from django.db import migrations, models
+
+
+ACTIVE_STATUSES = ('urgent', 'monitoring')
+
+
+def shorten(diagnosis):
+    if not diagnosis:
+        return None
+    words = diagnosis.split(',')[0].split('(')[0].strip().split()[:3]
+    return ' '.join(words) if words else None
+
+
+def backfill_patient_summary(apps, schema_editor):
+    """Заполнить основной диагноз и флаг активного консилиума у существующих пациентов."""
+    Patient = apps.get_model('patients', 'Patient')
+    
+    batch = []
+    for patient in Patient.objects.only('id').iterator(chunk_size=500):
+        active = list(
+            patient.cases.filter(status__in=ACTIVE_STATUSES).order_by('-created_at').values_list('diagnosis', flat=True)[:1]
+        )
+        patient.has_active_case = bool(active)
+        patient.summary_diagnosis = None
+        for source in (
+            active,
+            patient.cases.order_by('-created_at').values_list('diagnosis', flat=True)[:1],
+            patient.medical_records.order_by('-visit_date').values_list('diagnosis', flat=True)[:1],
+        ):
+            patient.summary_diagnosis = shorten(next(iter(source), None))
+            if patient.summary_diagnosis:
+                break
+        batch.append(patient)
+        if len(batch) >= 500:
+            Patient.objects.bulk_update(batch, ['summary_diagnosis', 'has_active_case'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['summary_diagnosis', 'has_active_case'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_knowledgebaseentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='has_active_case',
+            field=models.BooleanField(default=False, verbose_name='Есть активный консилиум'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='summary_diagnosis',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Основной диагноз'),
+        ),
+        migrations.RunPython(backfill_patient_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import datetime
+
+
+def move_lab_results(apps, schema_editor):
+    """Перенести результаты из Patient.emias_lab_results в таблицу LabResult."""
+    Patient = apps.get_model('patients', 'Patient')
+    LabResult = apps.get_model('patients', 'LabResult')
+    
+    batch = []
+    patients = Patient.objects.exclude(emias_lab_results={}).exclude(emias_lab_results__isnull=True)
+    for patient in patients.only('id', 'emias_lab_results', 'emias_last_synced', 'updated_at').iterator(chunk_size=500):
+        if not isinstance(patient.emias_lab_results, dict):
+            continue
+        default_taken_at = patient.emias_last_synced or patient.updated_at
+        seen = set()
+        for analyte, data in patient.emias_lab_results.items():
+            if not isinstance(data, dict):
+                data = {'value': data}
+            raw = data.get('value')
+            try:
+                value = float(str(raw).replace(',', '.')) if raw is not None and not isinstance(raw, bool) else None
+            except ValueError:
+                value = None
+            taken_at = parse_datetime(str(data['taken_at'])) if data.get('taken_at') else None
+            if taken_at is not None and timezone.is_naive(taken_at):
+                taken_at = timezone.make_aware(taken_at, datetime.timezone.utc)
+            taken_at = taken_at or default_taken_at
+            key = (str(analyte)[:100], taken_at)
+            if key in seen:
+                continue
+            seen.add(key)
+            batch.append(LabResult(
+                patient_id=patient.id,
+                analyte=key[0],
+                value=value,
+                value_text='' if value is not None or raw is None else str(raw)[:100],
+                unit=str(data.get('unit') or '')[:50],
+                reference=str(data.get('reference') or '')[:100],
+                taken_at=taken_at,
+            ))
+        if len(batch) >= 1000:
+            LabResult.objects.bulk_create(batch)
+            batch = []
+    LabResult.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analyte', models.CharField(max_length=100, verbose_name='Показатель')),
+                ('value', models.FloatField(blank=True, null=True, verbose_name='Значение')),
+                ('value_text', models.CharField(blank=True, default='', max_length=100, verbose_name='Значение (текст)')),
+                ('unit', models.CharField(blank=True, default='', max_length=50, verbose_name='Единицы')),
+                ('reference', models.CharField(blank=True, default='', max_length=100, verbose_name='Референс')),
+                ('taken_at', models.DateTimeField(verbose_name='Дата взятия')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lab_results', to='patients.patient', verbose_name='Пациент')),
+            ],
+            options={
+                'verbose_name': 'Лабораторный результат',
+                'verbose_name_plural': 'Лабораторные результаты',
+                'ordering': ['patient', 'analyte', 'taken_at'],
+                'indexes': [models.Index(fields=['analyte', 'taken_at'], name='patients_lab_analyte_taken')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='labresult',
+            constraint=models.UniqueConstraint(fields=('patient', 'analyte', 'taken_at'), name='patients_lab_patient_analyte_taken'),
+        ),
+        migrations.RunPython(move_lab_results, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='patient',
+            name='emias_lab_results',
+        ),
+    ]
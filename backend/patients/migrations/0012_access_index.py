@@ -0,0 +1,17 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0011_labresult'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientdoctorrelation',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['doctor', 'patient'], name='patients_rel_doctor_active'),
+        ),
+    ]
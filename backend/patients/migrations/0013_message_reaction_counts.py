@@ -0,0 +1,46 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:54
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+REACTION_COUNTERS = {
+    '👍': 'likes_count',
+    '👎': 'dislikes_count',
+}
+
+
+def backfill_reaction_counts(apps, schema_editor):
+    """Посчитать реакции существующих сообщений."""
+    CaseMessage = apps.get_model('patients', 'CaseMessage')
+    MessageReaction = apps.get_model('patients', 'MessageReaction')
+    
+    fields = list(REACTION_COUNTERS.values())
+    counts = {}
+    for row in MessageReaction.objects.values('message_id', 'reaction').annotate(n=Count('id')).order_by():
+        field = REACTION_COUNTERS.get(row['reaction'])
+        if field:
+            counts.setdefault(row['message_id'], {})[field] = row['n']
+    batch = [CaseMessage(pk=message_id, **{field: values.get(field, 0) for field in fields}) for message_id, values in counts.items()]
+    CaseMessage.objects.bulk_update(batch, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0012_access_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casemessage',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Реакций 👎'),
+        ),
+        migrations.AddField(
+            model_name='casemessage',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Реакций 👍'),
+        ),
+        migrations.RunPython(backfill_reaction_counts, migrations.RunPython.noop),
+    ]
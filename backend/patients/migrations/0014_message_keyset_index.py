@@ -0,0 +1,17 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0013_message_reaction_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='casemessage',
+            index=models.Index(fields=['case', 'created_at', 'id'], name='patients_msg_case_created'),
+        ),
+    ]
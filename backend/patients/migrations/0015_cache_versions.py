@@ -0,0 +1,23 @@
+# Generated by Django 4.2.18 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0014_message_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='case',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия кэша'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия кэша'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.18 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+COUNTED_MODELS = {
+    'hospitals': ('hospitals', 'Hospital'),
+    'patients': ('patients', 'Patient'),
+}
+
+
+def create_counters(apps, schema_editor):
+    """Начальные значения счетчиков - точный COUNT существующих строк."""
+    GlobalCounter = apps.get_model('patients', 'GlobalCounter')
+    for name, (app_label, model_name) in COUNTED_MODELS.items():
+        model = apps.get_model(app_label, model_name)
+        GlobalCounter.objects.create(name=name, value=model.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0001_initial'),
+        ('patients', '0015_cache_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlobalCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Счетчик')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Глобальный счетчик',
+                'verbose_name_plural': 'Глобальные счетчики',
+            },
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
@@ -32,9 +32,15 @@ class Patient(models.Model):
     
     # Данные из ЕМИАС
     emias_last_synced = models.DateTimeField(blank=True, null=True, verbose_name="Последняя синхронизация с ЕМИАС")
-    emias_lab_results = models.JSONField(default=dict, blank=True, verbose_name="Лабораторные результаты (ЕМИАС)")
     last_hospitalization = models.TextField(blank=True, null=True, verbose_name="Последняя госпитализация")
     
+    # Денормализованные поля для списков пациентов, поддерживаются сигналами Case и MedicalRecord
+    summary_diagnosis = models.CharField(max_length=255, blank=True, null=True, verbose_name="Основной диагноз")
+    has_active_case = models.BooleanField(default=False, verbose_name="Есть активный консилиум")
+    
+    # Версия кэша фрагментов шаблонов (строки пациента); увеличивается сигналами при изменениях
+    cache_version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Версия кэша")
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
     
@@ -42,6 +48,9 @@ class Patient(models.Model):
         verbose_name = "Пациент"
         verbose_name_plural = "Пациенты"
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['last_name', 'first_name', 'id'], name='patients_patient_name_key'),
+        ]
     
     def __str__(self):
         return f"{self.last_name} {self.first_name} {self.middle_name or ''}".strip()
@@ -69,36 +78,51 @@ class Patient(models.Model):
     @property
     def main_diagnosis(self):
         """Основной диагноз из последнего активного консилиума или медицинской карты."""
-        # Сначала проверяем активные консилиумы
-        active_case = self.cases.filter(status__in=['urgent', 'monitoring']).order_by('-created_at').first()
-        if active_case and active_case.diagnosis:
-            # Берем первые слова диагноза (до запятой или скобки, максимум 3 слова)
-            diagnosis = active_case.diagnosis.split(',')[0].split('(')[0].strip()
-            words = diagnosis.split()[:3]
-            return ' '.join(words) if words else None
-        
-        # Если нет активных консилиумов, берем из последнего консилиума
-        last_case = self.cases.order_by('-created_at').first()
-        if last_case and last_case.diagnosis:
-            diagnosis = last_case.diagnosis.split(',')[0].split('(')[0].strip()
-            words = diagnosis.split()[:3]
-            return ' '.join(words) if words else None
-        
-        # Если нет консилиумов, берем из последней медицинской карты
-        last_record = self.medical_records.order_by('-visit_date').first()
-        if last_record and last_record.diagnosis:
-            diagnosis = last_record.diagnosis.split(',')[0].split('(')[0].strip()
-            words = diagnosis.split()[:3]
-            return ' '.join(words) if words else None
-        
-        return None
+        return self.summary_diagnosis
     
     def has_active_consilium(self, doctor=None):
         """Проверить, есть ли у пациента активный консилиум."""
-        qs = self.cases.filter(status__in=['urgent', 'monitoring'])
-        if doctor:
-            qs = qs.filter(doctors=doctor)
-        return qs.exists()
+        if doctor is None:
+            return self.has_active_case
+        return self.cases.filter(status__in=Case.ACTIVE_STATUSES, doctors=doctor).exists()
+    
+    @staticmethod
+    def shorten_diagnosis(diagnosis):
+        """Первые слова диагноза (до запятой или скобки, максимум 3 слова)."""
+        if not diagnosis:
+            return None
+        words = diagnosis.split(',')[0].split('(')[0].strip().split()[:3]
+        return ' '.join(words) if words else None
+    
+    def compute_summary(self):
+        """Вычислить основной диагноз и флаг активного консилиума по консилиумам и картам (один запрос)."""
+        cases = Case.objects.filter(patient=models.OuterRef('pk')).order_by('-created_at')
+        active_cases = cases.filter(status__in=Case.ACTIVE_STATUSES)
+        records = MedicalRecord.objects.filter(patient=models.OuterRef('pk')).order_by('-visit_date')
+        row = Patient.objects.filter(pk=self.pk).values(
+            has_active=models.Exists(active_cases),
+            active_diagnosis=models.Subquery(active_cases.values('diagnosis')[:1]),
+            case_diagnosis=models.Subquery(cases.values('diagnosis')[:1]),
+            record_diagnosis=models.Subquery(records.values('diagnosis')[:1]),
+        ).first()
+        if row is None:
+            return None, False
+        
+        # Сначала активный консилиум, затем последний консилиум, затем последняя медицинская карта
+        for source in ('active_diagnosis', 'case_diagnosis', 'record_diagnosis'):
+            diagnosis = self.shorten_diagnosis(row[source])
+            if diagnosis:
+                return diagnosis, row['has_active']
+        return None, row['has_active']
+    
+    def refresh_summary(self):
+        """Пересчитать денормализованные поля (без сигналов post_save пациента)."""
+        self.summary_diagnosis, self.has_active_case = self.compute_summary()
+        Patient.objects.filter(pk=self.pk).update(
+            summary_diagnosis=self.summary_diagnosis,
+            has_active_case=self.has_active_case,
+            cache_version=models.F('cache_version') + 1,
+        )
     
     def get_gender_display_short(self):
         """Короткое отображение пола."""
@@ -108,9 +132,10 @@ class Patient(models.Model):
             return 'Жен'
         return '—'
     
-    def get_allergies_list(self):
-        """Получить список аллергий из последней медицинской карты."""
-        last_record = self.medical_records.order_by('-visit_date').first()
+    def get_allergies_list(self, last_record=None):
+        """Получить список аллергий из последней медицинской карты (если не передана - загружается)."""
+        if last_record is None:
+            last_record = self.medical_records.order_by('-visit_date').first()
         if last_record and last_record.allergies:
             # Парсим аллергии (предполагаем формат: "Аллерген1 (комментарий1), Аллерген2 (комментарий2)")
             allergies = []
@@ -126,10 +151,68 @@ class Patient(models.Model):
         return []
     
     def get_last_lab_results(self):
-        """Получить последние лабораторные результаты."""
-        if self.emias_lab_results:
-            return self.emias_lab_results
-        return {}
+        """Получить последние лабораторные результаты (по одному на показатель)."""
+        return LabResult.latest_for_patient(self.pk)
+
+
+class LabResult(models.Model):
+    """Лабораторный результат: одно значение показателя на момент взятия анализа."""
+    
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.CASCADE,
+        related_name='lab_results',
+        verbose_name="Пациент"
+    )
+    
+    analyte = models.CharField(max_length=100, verbose_name="Показатель")
+    value = models.FloatField(null=True, blank=True, verbose_name="Значение")
+    # Исходное значение, если оно не число (например, "отр." или "< 5")
+    value_text = models.CharField(max_length=100, blank=True, default='', verbose_name="Значение (текст)")
+    unit = models.CharField(max_length=50, blank=True, default='', verbose_name="Единицы")
+    reference = models.CharField(max_length=100, blank=True, default='', verbose_name="Референс")
+    taken_at = models.DateTimeField(verbose_name="Дата взятия")
+    
+    class Meta:
+        verbose_name = "Лабораторный результат"
+        verbose_name_plural = "Лабораторные результаты"
+        ordering = ['patient', 'analyte', 'taken_at']
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'analyte', 'taken_at'], name='patients_lab_patient_analyte_taken'),
+        ]
+        indexes = [
+            # Запросы по показателю среди всех пациентов (тренды)
+            models.Index(fields=['analyte', 'taken_at'], name='patients_lab_analyte_taken'),
+        ]
+    
+    def __str__(self):
+        return f"{self.analyte} = {self.display_value} ({self.taken_at:%d.%m.%Y})"
+    
+    @property
+    def display_value(self):
+        if self.value_text:
+            return self.value_text
+        if self.value is None:
+            return None
+        return int(self.value) if self.value.is_integer() else self.value
+    
+    @classmethod
+    def latest_for_patient(cls, patient_id):
+        """Последнее значение каждого показателя в формате {показатель: {value, unit, reference, taken_at}}."""
+        from django.db.models import OuterRef, Subquery
+        latest = cls.objects.filter(
+            patient_id=OuterRef('patient_id'), analyte=OuterRef('analyte')
+        ).order_by('-taken_at').values('taken_at')[:1]
+        results = cls.objects.filter(patient_id=patient_id, taken_at=Subquery(latest)).order_by('analyte')
+        return {
+            result.analyte: {
+                'value': result.display_value,
+                'unit': result.unit,
+                'reference': result.reference,
+                'taken_at': result.taken_at,
+            }
+            for result in results
+        }
 
 
 class MedicalRecord(models.Model):
@@ -169,6 +252,9 @@ class MedicalRecord(models.Model):
         verbose_name = "Медицинская карточка"
         verbose_name_plural = "Медицинские карточки"
         ordering = ['-visit_date', '-created_at']
+        indexes = [
+            models.Index(fields=['visit_date', 'id'], name='patients_record_visit_key'),
+        ]
     
     def __str__(self):
         return f"Карточка {self.patient.full_name} от {self.visit_date}"
@@ -204,6 +290,10 @@ class PatientDoctorRelation(models.Model):
         verbose_name_plural = "Связи врач-пациент"
         unique_together = ['patient', 'doctor']
         ordering = ['-assigned_date']
+        indexes = [
+            # Покрывающий индекс для проверки доступа врача (см. patients.access)
+            models.Index(fields=['doctor', 'patient'], name='patients_rel_doctor_active', condition=models.Q(is_active=True)),
+        ]
     
     def __str__(self):
         return f"{self.doctor.email} лечит {self.patient.full_name}"
@@ -218,6 +308,8 @@ class Case(models.Model):
         ('stable', 'Стабильный'),
     ]
     
+    ACTIVE_STATUSES = ('urgent', 'monitoring')
+    
     patient = models.ForeignKey(
         Patient,
         on_delete=models.CASCADE,
@@ -258,6 +350,10 @@ class Case(models.Model):
     # Дата поступления/создания консилиума
     admission_date = models.DateField(verbose_name="Дата поступления")
     
+    # Версия кэша фрагментов шаблонов (карточка, чат); увеличивается сигналами при
+    # изменении консилиума, его участников, сообщений и реакций
+    cache_version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Версия кэша")
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
     
@@ -269,13 +365,48 @@ class Case(models.Model):
     def __str__(self):
         return f"Консилиум: {self.patient.full_name} - {self.diagnosis}"
     
+    def user_has_access(self, user):
+        """Может ли пользователь просматривать консилиум.
+        
+        Завершенные консилиумы доступны всем врачам, активные - участникам,
+        создателю, администратору больницы и суперадмину.
+        """
+        from .access import case_permissions
+        return case_permissions(user, self.pk).can_view
+    
     def get_unread_count(self, user):
         """Получить количество непрочитанных сообщений для пользователя."""
-        return self.messages.filter(is_read=False).exclude(author=user).count()
+        unread = self.read_cursors.filter(user=user).values_list('unread_count', flat=True).first()
+        return unread or 0
+    
+    def mark_read(self, user):
+        """Сдвинуть курсор чтения пользователя на текущий момент (одна запись в БД)."""
+        from django.utils import timezone
+        now = timezone.now()
+        updated = self.read_cursors.filter(user=user).update(unread_count=0, last_read_at=now)
+        if not updated:
+            CaseReadCursor.objects.get_or_create(
+                case=self,
+                user=user,
+                defaults={'unread_count': 0, 'last_read_at': now}
+            )
+        # Непрочитанные входят в статистику кабинета пользователя
+        from .dashboard import invalidate
+        invalidate([user.pk])
 
 
 class CaseMessage(models.Model):
-    """Сообщение в консилиуме."""
+    """Сообщение в консилиуме.
+    
+    Количество реакций хранится в самом сообщении и поддерживается сигналами
+    MessageReaction, поэтому для показа счетчиков реакции не загружаются.
+    """
+    
+    # Реакция -> поле счетчика
+    REACTION_COUNTERS = {
+        '👍': 'likes_count',
+        '👎': 'dislikes_count',
+    }
     
     case = models.ForeignKey(
         Case,
@@ -293,7 +424,8 @@ class CaseMessage(models.Model):
     
     content = models.TextField(verbose_name="Содержание")
     
-    is_read = models.BooleanField(default=False, verbose_name="Прочитано")
+    likes_count = models.PositiveIntegerField(default=0, verbose_name="Реакций 👍")
+    dislikes_count = models.PositiveIntegerField(default=0, verbose_name="Реакций 👎")
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
@@ -302,9 +434,157 @@ class CaseMessage(models.Model):
         verbose_name = "Сообщение консилиума"
         verbose_name_plural = "Сообщения консилиумов"
         ordering = ['created_at']
+        indexes = [
+            # Keyset пагинация чата консилиума по (created_at, id)
+            models.Index(fields=['case', 'created_at', 'id'], name='patients_msg_case_created'),
+        ]
     
     def __str__(self):
         return f"Сообщение от {self.author.email} в консилиуме {self.case.id}"
+    
+    def reaction_counts(self):
+        """Ненулевые счетчики реакций: {реакция: количество}."""
+        counts = {}
+        for reaction, field in self.REACTION_COUNTERS.items():
+            if getattr(self, field):
+                counts[reaction] = getattr(self, field)
+        return counts
+
+
+class KnowledgeBaseEntry(models.Model):
+    """Запись базы знаний: сводка завершенного консилиума, вычисленная один раз при завершении.
+    
+    Счетчики и итоговое решение поддерживаются сигналом при новых сообщениях,
+    поэтому страница базы знаний читает только эту таблицу.
+    """
+    
+    DECISION_LENGTH = 100
+    COMORBIDITIES_LIMIT = 3
+    
+    case = models.OneToOneField(
+        Case,
+        on_delete=models.CASCADE,
+        related_name='knowledge_entry',
+        verbose_name="Консилиум"
+    )
+    
+    admission_date = models.DateField(verbose_name="Дата поступления")
+    completed_at = models.DateTimeField(verbose_name="Завершен")
+    first_message_at = models.DateTimeField(null=True, blank=True, verbose_name="Первое сообщение")
+    last_message_at = models.DateTimeField(null=True, blank=True, verbose_name="Последнее сообщение")
+    decision = models.TextField(verbose_name="Итоговое решение")
+    comorbidities = models.JSONField(default=list, blank=True, verbose_name="Коморбидности")
+    specialties = models.JSONField(default=list, blank=True, verbose_name="Специальности участников")
+    doctors_count = models.PositiveIntegerField(default=0, verbose_name="Количество врачей")
+    messages_count = models.PositiveIntegerField(default=0, verbose_name="Количество сообщений")
+    
+    class Meta:
+        verbose_name = "Запись базы знаний"
+        verbose_name_plural = "Записи базы знаний"
+        ordering = ['-admission_date', '-case_id']
+        indexes = [
+            models.Index(fields=['-admission_date', '-case'], name='patients_kb_admission'),
+        ]
+    
+    def __str__(self):
+        return f"База знаний: консилиум {self.case_id}"
+    
+    @property
+    def duration_minutes(self):
+        """Длительность обсуждения от первого до последнего сообщения."""
+        if not self.first_message_at or not self.last_message_at:
+            return 0
+        return int((self.last_message_at - self.first_message_at).total_seconds() / 60)
+    
+    @classmethod
+    def format_decision(cls, content):
+        """Итоговое решение - начало последнего сообщения."""
+        if not content:
+            return "Решение принято"
+        if len(content) > cls.DECISION_LENGTH:
+            return content[:cls.DECISION_LENGTH] + "..."
+        return content
+    
+    @classmethod
+    def build(cls, case):
+        """Вычислить и сохранить запись базы знаний для консилиума."""
+        from django.db.models import Count, Max, Min
+        from django.utils import timezone
+        
+        stats = case.messages.aggregate(count=Count('id'), first=Min('created_at'), last=Max('created_at'))
+        last_content = case.messages.order_by('-created_at', '-id').values_list('content', flat=True).first()
+        
+        comorbidities = []
+        chronic_diseases = case.patient.medical_records.order_by('-visit_date').values_list(
+            'chronic_diseases', flat=True
+        ).first()
+        if chronic_diseases:
+            comorbidities = [d.strip() for d in chronic_diseases.split(',') if d.strip()][:cls.COMORBIDITIES_LIMIT]
+        
+        doctor_specialties = list(case.doctors.values_list('specialty', flat=True))
+        
+        values = {
+            'admission_date': case.admission_date,
+            'first_message_at': stats['first'],
+            'last_message_at': stats['last'],
+            'decision': cls.format_decision(last_content),
+            'comorbidities': comorbidities,
+            'specialties': sorted({s for s in doctor_specialties if s}),
+            'doctors_count': len(doctor_specialties),
+            'messages_count': stats['count'],
+        }
+        # Время завершения фиксируется при создании записи: пересборка (смена
+        # участников, повторный расчет) его не меняет
+        entry, created = cls.objects.get_or_create(case=case, defaults={**values, 'completed_at': timezone.now()})
+        if not created:
+            for field, value in values.items():
+                setattr(entry, field, value)
+            entry.save(update_fields=list(values))
+        return entry
+
+
+class CaseReadCursor(models.Model):
+    """Курсор чтения консилиума: до какого момента участник прочитал сообщения.
+    
+    Счетчик непрочитанных поддерживается сигналами при создании и удалении
+    сообщений, поэтому его чтение не требует COUNT по сообщениям.
+    """
+    
+    case = models.ForeignKey(
+        Case,
+        on_delete=models.CASCADE,
+        related_name='read_cursors',
+        verbose_name="Консилиум"
+    )
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='case_read_cursors',
+        verbose_name="Пользователь"
+    )
+    
+    last_read_at = models.DateTimeField(null=True, blank=True, verbose_name="Прочитано до")
+    unread_count = models.PositiveIntegerField(default=0, verbose_name="Непрочитанных сообщений")
+    
+    class Meta:
+        verbose_name = "Курсор чтения консилиума"
+        verbose_name_plural = "Курсоры чтения консилиумов"
+        unique_together = ['case', 'user']
+        indexes = [
+            models.Index(fields=['user', 'case'], name='patients_cursor_user_case'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} в консилиуме {self.case_id}: {self.unread_count} непрочитанных"
+    
+    @staticmethod
+    def unread_subquery(user):
+        """Выражение для annotate(): число непрочитанных сообщений консилиума для пользователя."""
+        from django.db.models import OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        cursor = CaseReadCursor.objects.filter(case=OuterRef('pk'), user=user).values('unread_count')[:1]
+        return Coalesce(Subquery(cursor), 0, output_field=models.IntegerField())
 
 
 class MessageReaction(models.Model):
@@ -345,3 +625,21 @@ class MessageReaction(models.Model):
     
     def __str__(self):
         return f"{self.user.email} - {self.reaction} на сообщение {self.message.id}"
+
+
+class GlobalCounter(models.Model):
+    """Число строк таблицы для публичной статистики (см. patients.counters).
+    
+    Поддерживается сигналами при создании и удалении строк, поэтому главная
+    страница не выполняет COUNT по большим таблицам.
+    """
+    
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="Счетчик")
+    value = models.BigIntegerField(default=0, verbose_name="Значение")
+    
+    class Meta:
+        verbose_name = "Глобальный счетчик"
+        verbose_name_plural = "Глобальные счетчики"
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -0,0 +1,184 @@
+"""
+Keyset (cursor) пагинация по стабильной сортировке.
+
+Вместо OFFSET страница начинается с условия «строго после последней строки
+предыдущей страницы» по полям сортировки, поэтому глубокие страницы читаются
+так же быстро, как первая. Последним полем сортировки должен быть уникальный
+ключ (id), иначе строки с одинаковыми значениями могут потеряться.
+"""
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 50
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder без округления времени до миллисекунд: курсор должен точно совпадать со значением в БД."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, backward=False):
+    payload = json.dumps({'v': values, 'b': backward}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, ordering):
+    """Разобрать курсор. ValueError, если курсор поврежден или от другой сортировки."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        values, backward = payload['v'], bool(payload['b'])
+    except (TypeError, KeyError, ValueError, UnicodeError):
+        raise ValueError('Некорректный курсор')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError('Некорректный курсор')
+    return values, backward
+
+
+def _after(ordering, values, backward):
+    """Условие «строго после values» в лексикографическом порядке ordering."""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending != backward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _invert(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPage:
+    """Страница выборки и курсоры соседних страниц (None, если страницы нет)."""
+
+    def __init__(self, items, next_cursor, previous_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.next_cursor or self.previous_cursor)
+
+
+def seek(queryset, ordering, cursor=None):
+    """(queryset строк после курсора в порядке чтения, backward).
+
+    Назад читается в обратной сортировке. Поднимает ValueError для
+    некорректного курсора.
+    """
+    ordering = list(ordering)
+    backward = False
+    if cursor:
+        values, backward = decode_cursor(cursor, ordering)
+        try:
+            queryset = queryset.filter(_after(ordering, values, backward))
+        except (ValidationError, TypeError):
+            raise ValueError('Некорректный курсор')
+    return queryset.order_by(*(_invert(ordering) if backward else ordering)), backward
+
+
+def paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Страница queryset в порядке ordering, начиная с курсора.
+
+    Поднимает ValueError для некорректного курсора.
+    """
+    ordering = list(ordering)
+    queryset, backward = seek(queryset, ordering, cursor)
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+
+    def position(obj):
+        return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backward:
+            next_cursor = encode_cursor(position(rows[-1]))
+        if (has_more and backward) or (cursor and not backward):
+            previous_cursor = encode_cursor(position(rows[0]), backward=True)
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class KeysetPagination(BasePagination):
+    """Keyset пагинация для DRF.
+
+    Представление задает допустимые сортировки атрибутом keyset_orderings
+    (значение параметра ordering -> поля сортировки) и сортировку по умолчанию
+    keyset_default_ordering.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+
+    def get_page_size(self):
+        return getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE') or DEFAULT_PAGE_SIZE
+
+    def get_ordering(self, request, view):
+        orderings = view.keyset_orderings
+        requested = request.query_params.get(self.ordering_query_param)
+        return orderings.get(requested) or orderings[view.keyset_default_ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginate(
+                queryset,
+                self.get_ordering(request, view),
+                cursor=request.query_params.get(self.cursor_query_param),
+                page_size=self.get_page_size(),
+            )
+        except ValueError:
+            raise NotFound('Некорректный курсор.')
+        return self.page.items
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,329 @@
+"""
+Доставка событий консилиума в реальном времени поверх ASGI.
+
+InMemoryBroker хранит подписчиков в памяти процесса: события видят только
+клиенты того же процесса, поэтому без Redis сервер запускается с одним воркером
+(см. gunicorn.conf.py). RedisBroker пересылает события и присутствие через
+Redis pub/sub, и воркеров может быть несколько. Брокер выбирается настройкой
+REALTIME_BROKER.
+"""
+import asyncio
+import json
+import re
+import threading
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import dateformat, timezone
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis нужен только RedisBroker
+    redis = None
+
+CASE_SOCKET_PATH = re.compile(r'^/ws/cases/(?P<case_id>\d+)/$')
+
+# Максимум неотправленных событий на одно подключение; медленный клиент отключается
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def case_group(case_id):
+    """Имя группы подписчиков консилиума."""
+    return f'case-{case_id}'
+
+
+class Subscription:
+    """Очередь событий одного подключения, привязанная к его event loop."""
+
+    def __init__(self, group, loop):
+        self.group = group
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: закрываем подключение, он переподключится
+            self.overflowed = True
+
+
+class InMemoryBroker:
+    """Pub/sub в памяти процесса с учетом присутствия участников."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._presence = defaultdict(Counter)
+
+    def subscribe(self, group):
+        subscription = Subscription(group, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[group].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.group)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.group]
+
+    def publish(self, group, event):
+        """Отправить событие всем подписчикам группы. Можно вызывать из любого потока."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(group, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self.unsubscribe(subscription)
+
+    def has_subscribers(self, group=None):
+        """Есть ли подписчики у группы (или вообще у брокера, если группа не указана)."""
+        with self._lock:
+            if group is None:
+                return bool(self._subscribers)
+            return group in self._subscribers
+
+    def join(self, group, user_id):
+        """Отметить подключение пользователя. True, если это его первое подключение в группе."""
+        with self._lock:
+            self._presence[group][user_id] += 1
+            return self._presence[group][user_id] == 1
+
+    def leave(self, group, user_id):
+        """Снять подключение пользователя. True, если подключений больше не осталось."""
+        with self._lock:
+            presence = self._presence[group]
+            presence[user_id] -= 1
+            if presence[user_id] > 0:
+                return False
+            del presence[user_id]
+            if not presence:
+                del self._presence[group]
+            return True
+
+    def online(self, group):
+        with self._lock:
+            return sorted(self._presence.get(group, ()))
+
+
+class RedisBroker(InMemoryBroker):
+    """Pub/sub через Redis для нескольких воркеров.
+
+    Событие публикуется в канал группы, фоновый поток каждого процесса
+    получает его и раздает локальным подписчикам. Число подписчиков и
+    присутствие хранятся в хэшах Redis, общих для всех процессов.
+    """
+
+    CHANNEL_PREFIX = 'realtime:'
+    SUBSCRIBERS_KEY = 'realtime:subscribers'
+    PRESENCE_KEY = 'realtime:presence:{group}'
+
+    def __init__(self, url=None):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError('RedisBroker требует пакет redis')
+        self._redis = redis.Redis.from_url(url or settings.REDIS_URL)
+        self._listener = None
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{self.CHANNEL_PREFIX + '*': self._deliver})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _deliver(self, message):
+        group = message['channel'].decode()[len(self.CHANNEL_PREFIX):]
+        super().publish(group, json.loads(message['data']))
+
+    def subscribe(self, group):
+        self._ensure_listener()
+        subscription = super().subscribe(group)
+        self._redis.hincrby(self.SUBSCRIBERS_KEY, group, 1)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        super().unsubscribe(subscription)
+        self._decrement(self.SUBSCRIBERS_KEY, subscription.group)
+
+    def publish(self, group, event):
+        self._redis.publish(self.CHANNEL_PREFIX + group, json.dumps(event, ensure_ascii=False))
+
+    def has_subscribers(self, group=None):
+        if group is None:
+            return bool(self._redis.hlen(self.SUBSCRIBERS_KEY))
+        return bool(self._redis.hexists(self.SUBSCRIBERS_KEY, group))
+
+    def join(self, group, user_id):
+        return self._redis.hincrby(self.PRESENCE_KEY.format(group=group), user_id, 1) == 1
+
+    def leave(self, group, user_id):
+        return self._decrement(self.PRESENCE_KEY.format(group=group), user_id)
+
+    def online(self, group):
+        presence = self._redis.hgetall(self.PRESENCE_KEY.format(group=group))
+        return sorted(int(user_id) for user_id, count in presence.items() if int(count) > 0)
+
+    def _decrement(self, key, field):
+        """Уменьшить счетчик в хэше; обнулившееся поле удаляется. True, если обнулилось."""
+        if self._redis.hincrby(key, field, -1) > 0:
+            return False
+        self._redis.hdel(key, field)
+        return True
+
+
+broker = import_string(settings.REALTIME_BROKER)()
+
+
+def publish_case_event(case_id, event):
+    """Опубликовать событие консилиума."""
+    broker.publish(case_group(case_id), event)
+
+
+def message_payload(message, case_status):
+    """Данные сообщения для клиента (с учетом анонимизации завершенных консилиумов)."""
+    author = message.author
+    if case_status == 'stable':
+        author_name = author.specialty or 'Врач'
+    else:
+        author_name = author.get_full_name()
+    return {
+        'id': message.id,
+        'author_id': author.id,
+        'author_name': author_name,
+        'author_initials': author.get_initials(),
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+        'created_at_display': dateformat.format(timezone.localtime(message.created_at), 'd.m.Y H:i'),
+    }
+
+
+def _origin_allowed(headers):
+    """Защита от cross-site подключений: Origin должен совпадать с Host."""
+    origin = headers.get(b'origin')
+    if not origin:
+        return True
+    origin = origin.decode('latin1')
+    if origin in settings.CSRF_TRUSTED_ORIGINS:
+        return True
+    host = headers.get(b'host', b'').decode('latin1')
+    return urlsplit(origin).netloc == host
+
+
+def _authenticate(headers):
+    """Пользователь по сессионной cookie (как AuthenticationMiddleware)."""
+    from django.contrib.auth import get_user
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpRequest
+    from importlib import import_module
+
+    cookie = SimpleCookie()
+    cookie.load(headers.get(b'cookie', b'').decode('latin1'))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return AnonymousUser()
+
+    engine = import_module(settings.SESSION_ENGINE)
+    request = HttpRequest()
+    request.session = engine.SessionStore(morsel.value)
+    return get_user(request)
+
+
+def _can_subscribe(user, case_id):
+    from .access import case_permissions
+
+    if not user.is_authenticated:
+        return False
+    return case_permissions(user, case_id).can_view
+
+
+async def _close(send, code):
+    await send({'type': 'websocket.close', 'code': code})
+
+
+async def _pump(subscription, send):
+    while True:
+        event = await subscription.queue.get()
+        if subscription.overflowed:
+            await _close(send, 4008)
+            return
+        await send({'type': 'websocket.send', 'text': json.dumps(event, ensure_ascii=False)})
+
+
+def _mark_read(case_id, user):
+    from .models import Case
+
+    Case(pk=case_id).mark_read(user)
+
+
+def _client_frame(event):
+    """Тип входящего кадра клиента ({"type": "read"}) или None."""
+    try:
+        frame = json.loads(event.get('text') or '')
+    except ValueError:
+        return None
+    return frame.get('type') if isinstance(frame, dict) else None
+
+
+async def case_socket(scope, receive, send):
+    """ASGI-приложение WebSocket канала консилиума: /ws/cases/<id>/."""
+    match = CASE_SOCKET_PATH.match(scope['path'])
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if match is None:
+        await _close(send, 4404)
+        return
+
+    headers = dict(scope.get('headers', []))
+    case_id = int(match.group('case_id'))
+    if not _origin_allowed(headers):
+        await _close(send, 4403)
+        return
+    user = await sync_to_async(_authenticate)(headers)
+    if not await sync_to_async(_can_subscribe)(user, case_id):
+        await _close(send, 4403)
+        return
+
+    await send({'type': 'websocket.accept'})
+    group = case_group(case_id)
+    if broker.join(group, user.pk):
+        broker.publish(group, {'type': 'presence', 'user_id': user.pk, 'status': 'online'})
+    subscription = broker.subscribe(group)
+    await send({
+        'type': 'websocket.send',
+        'text': json.dumps({'type': 'presence.snapshot', 'online': broker.online(group)}),
+    })
+
+    pump = asyncio.ensure_future(_pump(subscription, send))
+    try:
+        while True:
+            receive_task = asyncio.ensure_future(receive())
+            done, _ = await asyncio.wait({receive_task, pump}, return_when=asyncio.FIRST_COMPLETED)
+            if pump in done:
+                receive_task.cancel()
+                break
+            event = receive_task.result()
+            if event['type'] == 'websocket.disconnect':
+                break
+            # Клиент подтверждает прочтение доставленных сообщений; ping без ответа
+            if event['type'] == 'websocket.receive' and _client_frame(event) == 'read':
+                await sync_to_async(_mark_read)(case_id, user)
+    finally:
+        pump.cancel()
+        broker.unsubscribe(subscription)
+        if broker.leave(group, user.pk):
+            broker.publish(group, {'type': 'presence', 'user_id': user.pk, 'status': 'offline'})
@@ -0,0 +1,92 @@
+"""
+Кэш справочных данных в памяти процесса.
+
+Шаблоны консилиумов перечитываются только при изменении mtime файла,
+списки больниц и специальностей сбрасываются сигналами моделей
+(см. patients.signals). Вместе со списками хранится готовый JSON,
+чтобы страницы не сериализовали их заново.
+"""
+import json
+import threading
+from pathlib import Path
+
+TEMPLATES_PATH = Path(__file__).parent / 'consilium_templates.json'
+
+_lock = threading.Lock()
+_entries = {}
+_generation = 0
+
+
+class ReferenceData:
+    """Справочный список и его JSON-представление."""
+
+    def __init__(self, items, version=None):
+        self.items = items
+        self.json = json.dumps(items, ensure_ascii=False)
+        self.version = version
+
+
+def _get(name, loader, version=None):
+    with _lock:
+        entry = _entries.get(name)
+        generation = _generation
+    if entry is not None and entry.version == version:
+        return entry
+    entry = ReferenceData(loader(), version)
+    with _lock:
+        # Не сохраняем значение, если его сбросили, пока оно загружалось
+        if generation == _generation:
+            _entries[name] = entry
+    return entry
+
+
+def invalidate(*names):
+    """Сбросить закэшированные справочники (все, если имена не указаны)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if names:
+            for name in names:
+                _entries.pop(name, None)
+        else:
+            _entries.clear()
+
+
+def _load_templates():
+    try:
+        with open(TEMPLATES_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def consilium_templates():
+    """Шаблоны консилиумов из JSON файла."""
+    try:
+        mtime = TEMPLATES_PATH.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    return _get('consilium_templates', _load_templates, mtime)
+
+
+def _load_hospitals():
+    from hospitals.models import Hospital
+    return list(Hospital.objects.values('id', 'name', 'city'))
+
+
+def hospitals():
+    """Список больниц для форм."""
+    return _get('hospitals', _load_hospitals)
+
+
+def _load_specialties():
+    from django.contrib.auth import get_user_model
+    return list(
+        get_user_model().objects.filter(cases__status='stable', specialty__isnull=False)
+        .values_list('specialty', flat=True).distinct().order_by('specialty')
+    )
+
+
+def stable_case_specialties():
+    """Специальности врачей, участвовавших в завершенных консилиумах (фильтр базы знаний)."""
+    return _get('stable_case_specialties', _load_specialties)
@@ -0,0 +1,175 @@
+"""
+Полнотекстовый поиск по консилиумам для базы знаний.
+
+PostgreSQL: таблица patients_case_search с колонкой tsvector (словарь russian)
+и GIN-индексом. SQLite: виртуальная таблица FTS5, в которую пишутся основы
+слов, полученные русским стеммером Snowball из пакета snowballstemmer (FTS5
+не умеет русскую морфологию; при установленном PyStemmer он используется
+автоматически).
+Для остальных СУБД поиск недоступен и вызывающий код использует icontains.
+
+Индекс обновляется сигналами при сохранении консилиума или пациента.
+"""
+import re
+import threading
+
+import snowballstemmer
+from django.db import connection
+
+SEARCH_TABLE = 'patients_case_search'
+
+# Веса полей: диагноз важнее ФИО пациента, ФИО важнее описания
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# --- Русский стеммер (Snowball) ---
+
+# Стеммер хранит состояние разбора, поэтому у каждого потока свой
+_stemmers = threading.local()
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball."""
+    stemmer = getattr(_stemmers, 'russian', None)
+    if stemmer is None:
+        stemmer = _stemmers.russian = snowballstemmer.stemmer('russian')
+    return stemmer.stemWord(word.lower().replace('ё', 'е'))
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре; кириллические слова приводятся к основе."""
+    tokens = []
+    for word in _WORD_RE.findall((text or '').lower()):
+        if any('а' <= char <= 'я' or char == 'ё' for char in word):
+            word = stem(word)
+        if word:
+            tokens.append(word)
+    return tokens
+
+
+# --- Индекс ---
+
+def _case_model():
+    from .models import Case
+    return Case
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor in ('postgresql', 'sqlite')
+
+
+def _sqlite_rows(case_ids):
+    rows = _case_model().objects.filter(id__in=case_ids).values_list(
+        'id', 'diagnosis', 'description',
+        'patient__last_name', 'patient__first_name', 'patient__middle_name',
+    )
+    for case_id, diagnosis, description, *names in rows.iterator(chunk_size=500):
+        yield (
+            case_id,
+            ' '.join(tokenize(diagnosis)),
+            ' '.join(tokenize(' '.join(name for name in names if name))),
+            ' '.join(tokenize(description)),
+        )
+
+
+def index_cases(case_ids):
+    """Добавить или обновить консилиумы в индексе."""
+    case_ids = list(case_ids)
+    if not case_ids or not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (case_id, document) '
+                "SELECT c.id, setweight(to_tsvector('russian', coalesce(c.diagnosis, '')), 'A')"
+                " || setweight(to_tsvector('russian', concat_ws(' ', p.last_name, p.first_name, p.middle_name)), 'B')"
+                " || setweight(to_tsvector('russian', coalesce(c.description, '')), 'C') "
+                'FROM patients_case c JOIN patients_patient p ON p.id = c.patient_id '
+                'WHERE c.id = ANY(%s) '
+                'ON CONFLICT (case_id) DO UPDATE SET document = EXCLUDED.document',
+                [case_ids],
+            )
+        else:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, diagnosis, patient_name, description) '
+                'VALUES (%s, %s, %s, %s)',
+                list(_sqlite_rows(case_ids)),
+            )
+
+
+def remove_cases(case_ids):
+    """Удалить консилиумы из индекса."""
+    case_ids = list(case_ids)
+    if not case_ids or not is_supported():
+        return
+    placeholders = ', '.join(['%s'] * len(case_ids))
+    key = 'case_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({placeholders})', case_ids)
+
+
+def rebuild_index(batch_size=1000):
+    """Переиндексировать все консилиумы. Возвращает количество проиндексированных."""
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    total = 0
+    batch = []
+    for case_id in _case_model().objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size):
+        batch.append(case_id)
+        if len(batch) >= batch_size:
+            index_cases(batch)
+            total += len(batch)
+            batch = []
+    index_cases(batch)
+    return total + len(batch)
+
+
+def search_cases(query, status=None, limit=None):
+    """ID консилиумов, подходящих под запрос, в порядке убывания релевантности.
+
+    Каждое слово запроса ищется по префиксу основы, слова объединяются по И.
+    Возвращает None, если СУБД не поддерживает полнотекстовый поиск.
+    """
+    if not is_supported():
+        return None
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    params = []
+    status_sql = ''
+    if status:
+        status_sql = ' AND c.status = %s'
+    limit_sql = ''
+    if limit:
+        limit_sql = ' LIMIT %s'
+
+    if connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT s.case_id FROM {SEARCH_TABLE} s JOIN patients_case c ON c.id = s.case_id, "
+            "to_tsquery('russian', %s) q "
+            f"WHERE s.document @@ q{status_sql} "
+            f"ORDER BY ts_rank(s.document, q) DESC, s.case_id DESC{limit_sql}"
+        )
+        # Слова запроса стеммит сам PostgreSQL, передаем их без изменений
+        params.append(' & '.join(f'{word}:*' for word in _WORD_RE.findall(query.lower())))
+    else:
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        sql = (
+            f"SELECT {SEARCH_TABLE}.rowid FROM {SEARCH_TABLE} JOIN patients_case c ON c.id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH %s{status_sql} "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}), {SEARCH_TABLE}.rowid DESC{limit_sql}"
+        )
+        params.append(' AND '.join(f'"{term}"*' for term in terms))
+
+    if status:
+        params.append(status)
+    if limit:
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -1,15 +1,31 @@
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 from .models import Patient, MedicalRecord, PatientDoctorRelation
+from .pagination import encode_cursor, seek
+from .sparse import SparseFieldsMixin
 from accounts.serializers import UserSerializer
 from hospitals.serializers import HospitalSerializer
 
+# Колонки, из которых собирается Patient.full_name
+FULL_NAME_FIELDS = ('last_name', 'first_name', 'middle_name')
 
-class PatientSerializer(serializers.ModelSerializer):
+# Сколько карточек встраивается в ответ о пациенте; следующие страницы -
+# по ссылке medical_records_next (параметр records_cursor)
+EMBEDDED_RECORDS_LIMIT = 20
+EMBEDDED_RECORDS_ORDERING = ('-visit_date', '-id')
+EMBEDDED_RECORDS_CURSOR_PARAM = 'records_cursor'
+
+
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для пациента."""
     
     full_name = serializers.CharField(read_only=True)
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     
+    expandable_fields = {'hospital': lambda: HospitalSerializer(read_only=True)}
+    field_requirements = {'full_name': FULL_NAME_FIELDS}
+    
     class Meta:
         model = Patient
         fields = ['id', 'first_name', 'last_name', 'middle_name', 'full_name', 
@@ -18,12 +34,18 @@ class PatientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class MedicalRecordSerializer(serializers.ModelSerializer):
+class MedicalRecordSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для медицинской карточки."""
     
     patient_name = serializers.CharField(source='patient.full_name', read_only=True)
     doctor_email = serializers.CharField(source='doctor.email', read_only=True)
     
+    expandable_fields = {
+        'patient': lambda: PatientSerializer(read_only=True),
+        'doctor': lambda: UserSerializer(read_only=True),
+    }
+    field_requirements = {'patient_name': tuple(f'patient__{name}' for name in FULL_NAME_FIELDS)}
+    
     class Meta:
         model = MedicalRecord
         fields = ['id', 'patient', 'patient_name', 'doctor', 'doctor_email',
@@ -33,7 +55,7 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'doctor', 'created_at', 'updated_at']
 
 
-class MedicalRecordDetailSerializer(serializers.ModelSerializer):
+class MedicalRecordDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Детальный сериализатор для медицинской карточки."""
     
     patient = PatientSerializer(read_only=True)
@@ -47,17 +69,67 @@ class MedicalRecordDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class PatientWithRecordsSerializer(serializers.ModelSerializer):
-    """Сериализатор для пациента со всеми его карточками."""
+class EmbeddedRecordsSerializer(serializers.ListSerializer):
+    """Страница карточек пациента: EMBEDDED_RECORDS_LIMIT штук после records_cursor.
+
+    shape_queryset загружает ее prefetch в атрибут prefetch_to_attr с запросом
+    из prefetch_queryset (строк на одну больше - признак следующей страницы).
+    """
+    
+    limit = EMBEDDED_RECORDS_LIMIT
+    prefetch_to_attr = 'embedded_records'
+    
+    def prefetch_queryset(self, queryset):
+        request = self.context.get('request')
+        cursor = request.query_params.get(EMBEDDED_RECORDS_CURSOR_PARAM) if request is not None else None
+        try:
+            queryset, backward = seek(queryset, EMBEDDED_RECORDS_ORDERING, cursor)
+        except ValueError:
+            raise NotFound('Некорректный курсор.')
+        if backward:
+            # medical_records_next ведет только вперед
+            raise NotFound('Некорректный курсор.')
+        return queryset[:self.limit + 1]
+    
+    def page(self, patient):
+        """Карточки страницы и признак следующей страницы."""
+        records = getattr(patient, self.prefetch_to_attr, None)
+        if records is None:
+            records = list(self.prefetch_queryset(patient.medical_records.all()))
+        return records[:self.limit], len(records) > self.limit
+    
+    def to_representation(self, data):
+        records, _ = self.page(data.instance)
+        return super().to_representation(records)
+
+
+class PatientWithRecordsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Сериализатор для пациента со страницей его карточек."""
     
     full_name = serializers.CharField(read_only=True)
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
-    medical_records = MedicalRecordSerializer(many=True, read_only=True)
+    medical_records = EmbeddedRecordsSerializer(child=MedicalRecordSerializer(read_only=True), read_only=True)
+    medical_records_next = serializers.SerializerMethodField()
+    
+    expandable_fields = {'hospital': lambda: HospitalSerializer(read_only=True)}
+    field_requirements = {'full_name': FULL_NAME_FIELDS, 'medical_records_next': ()}
     
     class Meta:
         model = Patient
         fields = ['id', 'first_name', 'last_name', 'middle_name', 'full_name',
                   'date_of_birth', 'gender', 'phone', 'email', 'address',
-                  'hospital', 'hospital_name', 'medical_records', 'created_at', 'updated_at']
+                  'hospital', 'hospital_name', 'medical_records', 'medical_records_next',
+                  'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
-
+    
+    def get_medical_records_next(self, patient):
+        """Ссылка на следующую страницу карточек или None."""
+        request = self.context.get('request')
+        if request is None or 'medical_records' not in self.fields:
+            return None
+        records, has_more = self.fields['medical_records'].page(patient)
+        if not has_more:
+            return None
+        last = records[-1]
+        cursor = encode_cursor([last.visit_date, last.pk])
+        return replace_query_param(request.build_absolute_uri(), EMBEDDED_RECORDS_CURSOR_PARAM, cursor)
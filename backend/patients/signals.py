@@ -0,0 +1,545 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, QuerySet
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, dashboard, reference_data, search
+from .models import (
+    Case, CaseMessage, CaseReadCursor, KnowledgeBaseEntry, MedicalRecord, MessageReaction, Patient, PatientDoctorRelation
+)
+from .realtime import broker, case_group, message_payload, publish_case_event
+
+
+@receiver(post_save, sender=CaseMessage)
+def increment_unread_on_message(sender, instance, created, **kwargs):
+    """Новое сообщение увеличивает счетчик непрочитанных у всех, кроме автора."""
+    if not created:
+        return
+    CaseReadCursor.objects.filter(case_id=instance.case_id).exclude(user_id=instance.author_id).update(
+        unread_count=F('unread_count') + 1
+    )
+
+
+@receiver(post_delete, sender=CaseMessage)
+def decrement_unread_on_message_delete(sender, instance, **kwargs):
+    """Удаленное непрочитанное сообщение уменьшает счетчик у тех, кто его не видел."""
+    CaseReadCursor.objects.filter(
+        Q(last_read_at__isnull=True) | Q(last_read_at__lt=instance.created_at),
+        case_id=instance.case_id,
+        unread_count__gt=0,
+    ).exclude(user_id=instance.author_id).update(unread_count=F('unread_count') - 1)
+
+
+@receiver(m2m_changed, sender=Case.doctors.through)
+def delete_read_cursors_for_doctors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Выбывшие участники консилиума теряют курсоры чтения."""
+    if action == 'post_remove' and pk_set:
+        if reverse:
+            CaseReadCursor.objects.filter(user_id=instance.pk, case_id__in=pk_set).delete()
+        else:
+            CaseReadCursor.objects.filter(case_id=instance.pk, user_id__in=pk_set).delete()
+    elif action == 'pre_clear':
+        # После очистки связей участников уже не узнать, поэтому удаляем до нее
+        if reverse:
+            cases = sender.objects.filter(user_id=instance.pk).values('case_id')
+            CaseReadCursor.objects.filter(user_id=instance.pk, case_id__in=cases).delete()
+        else:
+            doctors = sender.objects.filter(case_id=instance.pk).values('user_id')
+            CaseReadCursor.objects.filter(case_id=instance.pk, user_id__in=doctors).delete()
+
+
+@receiver(m2m_changed, sender=Case.doctors.through)
+def create_read_cursors_for_doctors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Заводим курсоры чтения для новых участников консилиума."""
+    if action != 'post_add' or not pk_set:
+        return
+    
+    if reverse:
+        pairs = [(case_id, instance.pk) for case_id in pk_set]
+    else:
+        pairs = [(instance.pk, user_id) for user_id in pk_set]
+    
+    # Для нового участника непрочитанными считаются все чужие сообщения консилиума
+    per_author = {}
+    case_ids = {case_id for case_id, _ in pairs}
+    for row in CaseMessage.objects.filter(case_id__in=case_ids).values('case_id', 'author_id').annotate(n=Count('id')):
+        per_author[(row['case_id'], row['author_id'])] = row['n']
+    totals = {}
+    for (case_id, _), n in per_author.items():
+        totals[case_id] = totals.get(case_id, 0) + n
+    
+    CaseReadCursor.objects.bulk_create(
+        [
+            CaseReadCursor(
+                case_id=case_id,
+                user_id=user_id,
+                unread_count=totals.get(case_id, 0) - per_author.get((case_id, user_id), 0),
+            )
+            for case_id, user_id in pairs
+        ],
+        ignore_conflicts=True,
+    )
+
+
+@receiver(post_save, sender=CaseMessage)
+def publish_new_message(sender, instance, created, **kwargs):
+    """Разослать новое сообщение подключенным участникам после коммита."""
+    if not created or not broker.has_subscribers(case_group(instance.case_id)):
+        return
+    event = {'type': 'message', 'message': message_payload(instance, instance.case.status)}
+    transaction.on_commit(lambda: publish_case_event(instance.case_id, event))
+
+
+def _publish_reaction(instance, action):
+    # Дешевая проверка до обращения к instance.message (каскадные удаления без подписчиков)
+    if not broker.has_subscribers():
+        return
+    case_id = instance.message.case_id
+    if not broker.has_subscribers(case_group(case_id)):
+        return
+    event = {
+        'type': 'reaction',
+        'message_id': instance.message_id,
+        'reaction': instance.reaction,
+        'action': action,
+        'user_id': instance.user_id,
+    }
+    transaction.on_commit(lambda: publish_case_event(case_id, event))
+
+
+@receiver(pre_save, sender=MessageReaction)
+def remember_reaction(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._previous_reaction = sender.objects.filter(pk=instance.pk).values_list('reaction', flat=True).first()
+
+
+@receiver(post_save, sender=MessageReaction)
+def increment_reaction_count(sender, instance, created, **kwargs):
+    """Новая реакция увеличивает счетчик сообщения (атомарно, F-выражением)."""
+    previous = instance.__dict__.pop('_previous_reaction', None)
+    if not created and previous in (None, instance.reaction):
+        return
+    updates = {}
+    field = CaseMessage.REACTION_COUNTERS.get(instance.reaction)
+    if field:
+        updates[field] = F(field) + 1
+    # Смена типа существующей реакции переносит ее между счетчиками
+    previous_field = CaseMessage.REACTION_COUNTERS.get(previous)
+    if previous_field:
+        updates[previous_field] = Greatest(F(previous_field) - 1, 0)
+    if updates:
+        CaseMessage.objects.filter(pk=instance.message_id).update(**updates)
+
+
+def _deleted_with(origin, *models):
+    """Удаление каскадом вместе с объектом одной из моделей models (origin сигнала post_delete)."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model in models
+
+
+def _delete_batch(instance, origin):
+    """Общее состояние сигналов одного удаления queryset'ом или каскадом, иначе None.
+
+    Такое удаление шлет сигнал на каждую строку; состояние хранится на origin.
+    """
+    if origin is None or origin is instance:
+        return None
+    if '_delete_batch' not in origin.__dict__:
+        origin._delete_batch = {}
+        # Повторное удаление тем же queryset'ом - новое удаление
+        transaction.on_commit(lambda: origin.__dict__.pop('_delete_batch', None))
+    return origin._delete_batch
+
+
+def _first_deleted(instance, origin, key):
+    """Первая строка удаления с ключом key (при удалении одного объекта - всегда)."""
+    batch = _delete_batch(instance, origin)
+    if batch is None:
+        return True
+    seen = batch.setdefault('seen', set())
+    if key in seen:
+        return False
+    seen.add(key)
+    return True
+
+
+# Поле консилиума, через которое его удаляет каскадом удаление объекта модели
+CASE_DELETE_ORIGINS = {Case: 'pk', Patient: 'patient'}
+
+
+def _deleted_cases(instance, origin):
+    """Все консилиумы удаления queryset'ом или вместе с пациентом (pre_delete), иначе None.
+
+    Collector шлет pre_delete до удаления первой строки, поэтому queryset
+    еще находит все удаляемые консилиумы.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    field = CASE_DELETE_ORIGINS.get(origin_model)
+    if field is None or _delete_batch(instance, origin) is None:
+        return None
+    lookup = f'{field}__in' if isinstance(origin, QuerySet) else field
+    return Case.objects.filter(**{lookup: origin})
+
+
+def _count_deleted(instance, origin, name):
+    """Уменьшить счетчик name: одним UPDATE на все строки удаления, после коммита."""
+    batch = _delete_batch(instance, origin)
+    if batch is None:
+        counters.adjust(name, -1)
+        return
+    deleted = batch.setdefault('counters', {})
+    if name not in deleted:
+        deleted[name] = 0
+        transaction.on_commit(lambda: counters.adjust(name, -deleted.pop(name)))
+    deleted[name] += 1
+
+
+@receiver(post_delete, sender=MessageReaction)
+def decrement_reaction_count(sender, instance, origin=None, **kwargs):
+    """Удаленная реакция уменьшает счетчик сообщения."""
+    # При каскадном удалении сообщений (вместе с консилиумом или пациентом) счетчик не нужен
+    if _deleted_with(origin, CaseMessage, Case, Patient):
+        return
+    field = CaseMessage.REACTION_COUNTERS.get(instance.reaction)
+    if field:
+        CaseMessage.objects.filter(pk=instance.message_id, **{f'{field}__gt': 0}).update(**{field: F(field) - 1})
+
+
+@receiver(post_save, sender=MessageReaction)
+def publish_reaction_added(sender, instance, created, **kwargs):
+    if created:
+        _publish_reaction(instance, 'added')
+
+
+@receiver(post_delete, sender=MessageReaction)
+def publish_reaction_removed(sender, instance, **kwargs):
+    _publish_reaction(instance, 'removed')
+
+
+@receiver(post_save, sender=Case)
+def index_case(sender, instance, **kwargs):
+    """Обновить консилиум в полнотекстовом индексе базы знаний."""
+    search.index_cases([instance.pk])
+
+
+@receiver(pre_delete, sender=Case)
+def unindex_case(sender, instance, origin=None, **kwargs):
+    cases = _deleted_cases(instance, origin)
+    if cases is None:
+        search.remove_cases([instance.pk])
+    elif _first_deleted(instance, origin, 'unindex_cases'):
+        search.remove_cases(cases.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Patient)
+def reindex_patient_cases(sender, instance, created, **kwargs):
+    """ФИО пациента входит в индекс его консилиумов."""
+    if not created:
+        search.index_cases(instance.cases.values_list('id', flat=True))
+
+
+def rebuild_knowledge_entries(**filters):
+    """Пересобрать существующие записи базы знаний консилиумов, отобранных filters."""
+    for entry in KnowledgeBaseEntry.objects.filter(**filters).select_related('case__patient'):
+        KnowledgeBaseEntry.build(entry.case)
+
+
+@receiver(post_save, sender=Case)
+def sync_knowledge_entry(sender, instance, created, **kwargs):
+    """Завершенный консилиум попадает в базу знаний, возобновленный - удаляется из нее.
+
+    Любое сохранение завершенного консилиума пересобирает запись: могли
+    измениться дата поступления или пациент (а с ним и коморбидности).
+    """
+    if instance.status == 'stable':
+        KnowledgeBaseEntry.build(instance)
+    elif not created:
+        KnowledgeBaseEntry.objects.filter(case_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=CaseMessage)
+def update_knowledge_entry_on_message(sender, instance, created, **kwargs):
+    """Сообщение в завершенном консилиуме обновляет счетчики записи базы знаний."""
+    if not created:
+        # Правка сообщения может изменить итоговое решение
+        rebuild_knowledge_entries(case_id=instance.case_id)
+        return
+    KnowledgeBaseEntry.objects.filter(case_id=instance.case_id).update(
+        messages_count=F('messages_count') + 1,
+        first_message_at=Coalesce(F('first_message_at'), instance.created_at),
+        last_message_at=instance.created_at,
+        decision=KnowledgeBaseEntry.format_decision(instance.content),
+    )
+
+
+@receiver(post_delete, sender=CaseMessage)
+def update_knowledge_entry_on_message_delete(sender, instance, origin=None, **kwargs):
+    # Вместе с консилиумом удаляется и запись; queryset'ом - одна пересборка на консилиум
+    if _deleted_with(origin, Case, Patient):
+        return
+    if _first_deleted(instance, origin, ('knowledge_entry_case', instance.case_id)):
+        rebuild_knowledge_entries(case_id=instance.case_id)
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def refresh_knowledge_entry_comorbidities(sender, instance, origin=None, **kwargs):
+    """Коморбидности записи базы знаний берутся из последней медкарты пациента."""
+    if _deleted_with(origin, Patient):
+        return
+    if _first_deleted(instance, origin, ('knowledge_entry_patient', instance.patient_id)):
+        rebuild_knowledge_entries(case__patient_id=instance.patient_id)
+
+
+@receiver(m2m_changed, sender=Case.doctors.through)
+def refresh_knowledge_entry_doctors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Изменение состава участников завершенного консилиума пересчитывает запись базы знаний."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        case_ids = pk_set or ()
+    else:
+        case_ids = [instance.pk]
+    rebuild_knowledge_entries(case_id__in=case_ids)
+
+
+# Поля консилиума и карточки, от которых зависит сводка пациента
+SUMMARY_FIELDS = {
+    Case: {'patient', 'diagnosis', 'status', 'created_at'},
+    MedicalRecord: {'patient', 'diagnosis', 'visit_date'},
+}
+
+
+@receiver(pre_save, sender=Case)
+@receiver(pre_save, sender=MedicalRecord)
+def remember_summary_patient(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Запомнить прежнего пациента: при переносе пересчитывается и его сводка."""
+    if raw or instance._state.adding or (update_fields is not None and 'patient' not in update_fields):
+        return
+    instance._previous_patient_id = sender.objects.filter(pk=instance.pk).values_list('patient_id', flat=True).first()
+
+
+@receiver(post_save, sender=Case)
+@receiver(post_delete, sender=Case)
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def refresh_patient_summary(sender, instance, origin=None, update_fields=None, **kwargs):
+    """Пересчитываем основной диагноз и флаг активного консилиума пациента."""
+    # Каскадное удаление вместе с пациентом: пересчитывать некого
+    if _deleted_with(origin, Patient):
+        return
+    previous = instance.__dict__.pop('_previous_patient_id', None)
+    if update_fields is not None and not SUMMARY_FIELDS[sender] & set(update_fields):
+        return
+    for patient_id in {instance.patient_id, previous} - {None}:
+        Patient(pk=patient_id).refresh_summary()
+
+
+@receiver(post_save, sender='hospitals.Hospital')
+@receiver(post_delete, sender='hospitals.Hospital')
+def invalidate_hospitals(sender, **kwargs):
+    reference_data.invalidate('hospitals')
+
+
+@receiver(post_save, sender=Case)
+@receiver(post_delete, sender=Case)
+@receiver(m2m_changed, sender=Case.doctors.through)
+@receiver(post_save, sender='accounts.User')
+@receiver(post_delete, sender='accounts.User')
+def invalidate_specialties(sender, **kwargs):
+    reference_data.invalidate('stable_case_specialties')
+
+
+
+# Версии кэша фрагментов шаблонов: ключ фрагмента содержит версию, поэтому
+# после увеличения версии старый фрагмент больше не читается и вытесняется по таймауту
+
+def bump_case_versions(**filters):
+    Case.objects.filter(**filters).update(cache_version=F('cache_version') + 1)
+
+
+def bump_patient_versions(**filters):
+    Patient.objects.filter(**filters).update(cache_version=F('cache_version') + 1)
+
+
+@receiver(pre_save, sender=Case)
+@receiver(pre_save, sender=Patient)
+def bump_cache_version_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Версия увеличивается в том же UPDATE: экземпляр, загруженный до другого
+    # увеличения, иначе записал бы старую версию и вернул к жизни старый фрагмент
+    if not raw and not instance._state.adding and update_fields is None:
+        instance.cache_version = F('cache_version') + 1
+
+
+@receiver(post_save, sender=Case)
+@receiver(post_save, sender=Patient)
+def reload_cache_version(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None:
+        # save(update_fields=...) не записывает cache_version
+        sender.objects.filter(pk=instance.pk).update(cache_version=F('cache_version') + 1)
+    # Значение из БД загрузится при первом обращении
+    instance.__dict__.pop('cache_version', None)
+
+
+@receiver(post_save, sender=CaseMessage)
+@receiver(post_delete, sender=CaseMessage)
+def bump_case_version_on_message(sender, instance, origin=None, **kwargs):
+    if not _deleted_with(origin, Case, Patient):
+        bump_case_versions(pk=instance.case_id)
+
+
+@receiver(post_save, sender=MessageReaction)
+@receiver(post_delete, sender=MessageReaction)
+def bump_case_version_on_reaction(sender, instance, origin=None, **kwargs):
+    if not _deleted_with(origin, CaseMessage, Case, Patient):
+        bump_case_versions(messages=instance.message_id)
+
+
+@receiver(m2m_changed, sender=Case.doctors.through)
+def bump_case_version_on_doctors(sender, instance, action, reverse, pk_set, **kwargs):
+    """Участники показываются в карточке и определяют права в чате."""
+    if reverse and action == 'pre_clear':
+        # После очистки консилиумы врача уже не найти
+        instance._cleared_case_ids = list(Case.objects.filter(doctors=instance).values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_case_versions(pk=instance.pk)
+    elif action == 'post_clear':
+        bump_case_versions(pk__in=instance.__dict__.pop('_cleared_case_ids', []))
+    elif pk_set:
+        bump_case_versions(pk__in=pk_set)
+
+
+@receiver(post_save, sender=Patient)
+def bump_case_versions_on_patient(sender, instance, created, **kwargs):
+    """ФИО пациента показывается в карточках его консилиумов."""
+    if not created:
+        bump_case_versions(patient=instance.pk)
+
+
+@receiver(post_save, sender='hospitals.Hospital')
+def bump_patient_versions_on_hospital(sender, instance, created, **kwargs):
+    """Название больницы показывается в строках пациентов."""
+    if not created:
+        bump_patient_versions(hospital=instance.pk)
+
+
+# Поля врача, которые выводятся в карточках и чате консилиумов
+USER_DISPLAY_FIELDS = {'first_name', 'last_name', 'patronymic', 'email', 'specialty'}
+
+
+@receiver(post_save, sender='accounts.User')
+def bump_case_versions_on_user(sender, instance, created, update_fields=None, **kwargs):
+    # Вход (last_login) и другие служебные сохранения фрагменты не меняют
+    if created or (update_fields is not None and not USER_DISPLAY_FIELDS & set(update_fields)):
+        return
+    bump_case_versions(pk__in=Case.objects.filter(Q(doctors=instance) | Q(created_by=instance)).values('pk'))
+
+
+# Снимки статистики кабинета (см. patients.dashboard)
+
+@receiver(post_save, sender=Case)
+def invalidate_dashboard_on_case(sender, instance, **kwargs):
+    dashboard.invalidate_case(instance.pk)
+
+
+@receiver(pre_delete, sender=Case)
+def invalidate_dashboard_on_case_delete(sender, instance, origin=None, **kwargs):
+    # До удаления: после него участников консилиума уже не найти
+    cases = _deleted_cases(instance, origin)
+    if cases is None:
+        dashboard.invalidate_case(instance.pk)
+    elif _first_deleted(instance, origin, 'dashboard_cases'):
+        dashboard.invalidate_cases(cases)
+
+
+@receiver(m2m_changed, sender=Case.doctors.through)
+def invalidate_dashboard_on_doctors(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            dashboard.invalidate([instance.pk])
+    elif action == 'pre_clear':
+        dashboard.invalidate_case(instance.pk)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        dashboard.invalidate(pk_set)
+
+
+@receiver(post_save, sender=CaseMessage)
+@receiver(post_delete, sender=CaseMessage)
+def invalidate_dashboard_on_message(sender, instance, origin=None, created=True, **kwargs):
+    """Сообщение меняет число непрочитанных у участников."""
+    if created and not _deleted_with(origin, Case, Patient) and _first_deleted(instance, origin, ('case', instance.case_id)):
+        dashboard.invalidate_case(instance.case_id)
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+@receiver(post_save, sender=PatientDoctorRelation)
+@receiver(post_delete, sender=PatientDoctorRelation)
+def invalidate_dashboard_on_doctor_data(sender, instance, origin=None, **kwargs):
+    # Массовое удаление: снимок каждого врача сбрасывается один раз
+    if _first_deleted(instance, origin, ('doctor', instance.doctor_id)):
+        dashboard.invalidate([instance.doctor_id])
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def invalidate_dashboard_on_record(sender, instance, created=True, origin=None, **kwargs):
+    """Число карточек больницы меняется при создании и удалении карточки."""
+    # Вместе с пациентом сбрасывает сигнал пациента
+    if not created or _deleted_with(origin, Patient):
+        return
+    if _first_deleted(instance, origin, ('record_hospital', instance.patient_id)):
+        dashboard.invalidate(hospital_ids=[instance.patient.hospital_id])
+
+
+@receiver(pre_save, sender=Patient)
+def remember_patient_hospital(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or (update_fields is not None and 'hospital' not in update_fields):
+        return
+    instance._previous_hospital_id = (
+        Patient.objects.filter(pk=instance.pk).values_list('hospital_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_dashboard_on_patient(sender, instance, created=True, origin=None, **kwargs):
+    # Пациенты врача определяются связями (см. выше), поэтому только администраторы
+    # больниц: при создании, удалении и переводе пациента в другую больницу
+    if created:
+        if _first_deleted(instance, origin, ('hospital', instance.hospital_id)):
+            dashboard.invalidate(hospital_ids=[instance.hospital_id])
+        return
+    previous = instance.__dict__.pop('_previous_hospital_id', instance.hospital_id)
+    if previous != instance.hospital_id:
+        dashboard.invalidate(hospital_ids=[previous, instance.hospital_id])
+
+
+# Глобальные счетчики для главной страницы (см. patients.counters)
+
+@receiver(post_save, sender=Patient)
+def count_created_patient(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust('patients', 1)
+
+
+@receiver(post_delete, sender=Patient)
+def count_deleted_patient(sender, instance, origin=None, **kwargs):
+    _count_deleted(instance, origin, 'patients')
+
+
+@receiver(post_save, sender='hospitals.Hospital')
+def count_created_hospital(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust('hospitals', 1)
+
+
+@receiver(post_delete, sender='hospitals.Hospital')
+def count_deleted_hospital(sender, instance, origin=None, **kwargs):
+    _count_deleted(instance, origin, 'hospitals')
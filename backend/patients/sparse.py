@@ -0,0 +1,243 @@
+"""
+Выборочные поля (?fields=) и разворачиваемые связи (?expand=) API пациентов.
+
+fields=id,full_name,medical_records.diagnosis - в ответе только перечисленные
+поля; через точку задаются поля вложенного сериализатора. expand=hospital -
+вместо id связи вложенный объект (expandable_fields сериализатора), через
+точку - связи вложенных объектов. Параметры действуют только на чтение
+(GET/HEAD), неизвестное поле - ошибка 400.
+
+shape_queryset строит по итоговому набору полей сериализатора select_related,
+prefetch_related и only(): из БД читаются только выводимые колонки, а связи
+загружаются теми же запросами. Поле, которое не удается сопоставить с
+колонками модели (свойство, метод), объявляется в field_requirements
+сериализатора, иначе only() не применяется.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse(value):
+    """'id,records.diagnosis' -> {'id': {}, 'records': {'diagnosis': {}}}."""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def _requested(context):
+    """Деревья (fields, expand) запроса; fields None - все поля."""
+    if '_sparse' not in context:
+        request = context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            context['_sparse'] = (None, {})
+        else:
+            fields = parse(request.query_params.get(FIELDS_PARAM))
+            context['_sparse'] = (fields or None, parse(request.query_params.get(EXPAND_PARAM)))
+    return context['_sparse']
+
+
+class SparseFieldsMixin:
+    """Поля сериализатора по параметрам fields и expand запроса (см. модуль)."""
+
+    # Разворачиваемые связи: имя поля -> фабрика вложенного сериализатора
+    expandable_fields = {}
+    # Колонки модели (lookup'ы), нужные полю, которое не сопоставляется с ними само
+    field_requirements = {}
+
+    def _sparse_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            # Дочерний сериализатор ListSerializer привязан с пустым именем
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return reversed(path)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected, expand = _requested(self.context)
+        for name in self._sparse_path():
+            # Пустое поддерево - поле выбрано целиком
+            selected = (selected.get(name) or None) if selected is not None else None
+            expand = expand.get(name, {})
+
+        for name in expand:
+            if name in self.expandable_fields:
+                fields[name] = self.expandable_fields[name]()
+        # Остальные имена - путь к связям вложенного сериализатора
+        unknown = {
+            name for name, subtree in expand.items()
+            if name not in self.expandable_fields
+            and not (subtree and isinstance(fields.get(name), serializers.BaseSerializer))
+        }
+        if unknown:
+            raise serializers.ValidationError({EXPAND_PARAM: [f'Неизвестные поля: {", ".join(sorted(unknown))}']})
+
+        if selected is not None:
+            unknown = set(selected) - set(fields)
+            if unknown:
+                raise serializers.ValidationError({FIELDS_PARAM: [f'Неизвестные поля: {", ".join(sorted(unknown))}']})
+            fields = {name: field for name, field in fields.items() if name in selected}
+        return fields
+
+
+class Requirements:
+    """Колонки (only), связи select_related и prefetch_related для набора полей."""
+
+    def __init__(self):
+        self.only = set()
+        self.exact = True
+        self.related = set()
+        self.prefetch = []
+
+    def add_path(self, model, path, prefix):
+        """Колонка по lookup'у path от model; связи по пути добавляются в select_related."""
+        names = path.split('__')
+        for i, name in enumerate(names):
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                self.exact = False
+                return
+            lookup = prefix + '__'.join(names[:i + 1])
+            self.only.add(lookup)
+            if i < len(names) - 1:
+                if not (model_field.many_to_one or model_field.one_to_one):
+                    self.exact = False
+                    return
+                self.related.add(lookup)
+                model = model_field.related_model
+
+
+def _source_path(model, source_attrs):
+    """source_attrs поля ('hospital', 'name') -> lookup 'hospital__name' или None."""
+    names = []
+    for i, attr in enumerate(source_attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if attr.startswith('get_') and attr.endswith('_display'):
+                names.append(attr[len('get_'):-len('_display')])
+                return '__'.join(names)
+            return None
+        names.append(attr)
+        if i < len(source_attrs) - 1:
+            if not (model_field.many_to_one or model_field.one_to_one):
+                return None
+            model = model_field.related_model
+    return '__'.join(names)
+
+
+def requirements(serializer, model, prefix='', result=None):
+    """Requirements полей serializer для модели model (lookup'ы с префиксом prefix)."""
+    result = result if result is not None else Requirements()
+    result.only.add(prefix + model._meta.pk.name)
+    extra = getattr(serializer, 'field_requirements', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in extra:
+            for path in extra[name]:
+                result.add_path(model, path, prefix)
+            continue
+        if field.source == '*':
+            result.exact = False
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            _prefetch(field, model, prefix, result)
+            continue
+        path = _source_path(model, field.source_attrs)
+        if path is None:
+            result.exact = False
+            continue
+        if isinstance(field, serializers.BaseSerializer):
+            # Вложенный объект по прямой связи - тем же запросом
+            result.add_path(model, path, prefix)
+            result.related.add(prefix + path)
+            related_model = model
+            for name in path.split('__'):
+                related_model = related_model._meta.get_field(name).related_model
+            requirements(field, related_model, f'{prefix}{path}__', result)
+        else:
+            result.add_path(model, path, prefix)
+    return result
+
+
+def _prefetch(field, model, prefix, result):
+    """Prefetch обратной связи для ListSerializer (queryset уточняет prefetch_queryset поля, если он есть)."""
+    try:
+        relation = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        result.exact = False
+        return
+    if not (relation.one_to_many or relation.many_to_many):
+        result.exact = False
+        return
+    queryset = relation.related_model._default_manager.all()
+    if relation.one_to_many:
+        # Без колонки связи prefetch не разложит строки по объектам
+        remote = relation.field.name
+        child = requirements(field.child, relation.related_model)
+        child.only.add(remote)
+        # Родитель уже загружен, prefetch сам проставит его строкам: нужные
+        # строкам колонки родителя читаются вместе с ним
+        parent = f'{remote}__'
+        child.related = {lookup for lookup in child.related if lookup != remote and not lookup.startswith(parent)}
+        result.only.update(prefix + lookup[len(parent):] for lookup in child.only if lookup.startswith(parent))
+        child.only = {lookup for lookup in child.only if not lookup.startswith(parent)}
+        queryset = apply(queryset, child)
+    if hasattr(field, 'prefetch_queryset'):
+        # Сортировка, ограничение и т.п. задаются самим полем
+        queryset = field.prefetch_queryset(queryset)
+    result.only.add(prefix + model._meta.pk.name)
+    # Срез queryset нельзя положить в кэш менеджера, только в атрибут (prefetch_to_attr)
+    to_attr = getattr(field, 'prefetch_to_attr', None)
+    result.prefetch.append(Prefetch(prefix + field.source, queryset=queryset, to_attr=to_attr))
+
+
+def apply(queryset, result, defer=True):
+    """queryset с select_related, prefetch_related и (если defer и поля известны) only()."""
+    if result.related:
+        queryset = queryset.select_related(*sorted(result.related))
+    if result.prefetch:
+        queryset = queryset.prefetch_related(*result.prefetch)
+    if defer and result.exact:
+        queryset = queryset.only(*sorted(result.only))
+    return queryset
+
+
+def shape_queryset(queryset, serializer, defer=True, extra_fields=()):
+    """queryset под поля serializer; extra_fields - колонки, нужные помимо сериализатора."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    result = requirements(serializer, queryset.model)
+    result.only.update(extra_fields)
+    return apply(queryset, result, defer)
+
+
+class SparseQuerysetMixin:
+    """shape_queryset для generic-представления DRF.
+
+    only() применяется только на чтение: сохранение объекта с отложенными
+    полями записало бы лишь загруженные колонки. Поля сортировок keyset
+    пагинации загружаются всегда - по ним строится курсор.
+    """
+
+    def shape_queryset(self, queryset):
+        orderings = getattr(self, 'keyset_orderings', {})
+        extra_fields = {field.lstrip('-') for ordering in orderings.values() for field in ordering}
+        return shape_queryset(
+            queryset,
+            self.get_serializer(),
+            defer=self.request.method in SAFE_METHODS,
+            extra_fields=extra_fields,
+        )
@@ -1,3 +1,1071 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import threading
+from unittest import mock
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import User
+from hospitals.models import Hospital
+from . import counters, dashboard, emias, emias_stub, importer, realtime, search
+from .benchmark import QueryBudgetMixin
+from .models import (
+    Case, CaseMessage, CaseReadCursor, KnowledgeBaseEntry, LabResult, MedicalRecord, MessageReaction, Patient,
+    PatientDoctorRelation,
+)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Бюджет SQL-запросов API пациентов (не зависит от объема данных)."""
+
+    budgets = {
+        'api_cabinet': 7,
+        'api_patients': 4,
+        'api_patients_admin': 4,
+        'api_patient_detail': 5,
+        'api_patient_labs': 4,
+        'api_records': 4,
+        'api_record_detail': 4,
+    }
+
+
+def create_patient(doctor, records=0, **fields):
+    fields.setdefault('first_name', 'Иван')
+    fields.setdefault('last_name', 'Иванов')
+    patient = Patient.objects.create(date_of_birth=date(1980, 1, 1), gender='M', **fields)
+    for i in range(records):
+        MedicalRecord.objects.create(
+            patient=patient, doctor=doctor, chief_complaint='Жалобы', diagnosis=f'Диагноз {i}',
+            visit_date=date(2025, 1, 1 + i),
+        )
+    return patient
+
+
+class PatientSummaryTests(TestCase):
+    """Денормализованный диагноз пациента (сигналы MedicalRecord и Case)."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+
+    def test_record_delete_refreshes_summary(self):
+        patient = create_patient(self.doctor, records=2)
+        patient.refresh_from_db()
+        self.assertEqual(patient.summary_diagnosis, 'Диагноз 1')
+
+        patient.medical_records.get(diagnosis='Диагноз 1').delete()
+
+        patient.refresh_from_db()
+        self.assertEqual(patient.summary_diagnosis, 'Диагноз 0')
+
+    def test_compute_summary_single_query(self):
+        patient = create_patient(self.doctor, records=2)
+        Case.objects.create(
+            patient=patient, created_by=self.doctor, diagnosis='Пневмония нижней доли, справа',
+            description='Описание', admission_date=date(2025, 1, 1), status='stable',
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(patient.compute_summary(), ('Пневмония нижней доли', False))
+
+    def test_case_moved_refreshes_both_patients(self):
+        first = create_patient(self.doctor, records=1)
+        second = create_patient(self.doctor)
+        case = Case.objects.create(
+            patient=first, created_by=self.doctor, diagnosis='Инфаркт', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        first.refresh_from_db()
+        self.assertEqual((first.summary_diagnosis, first.has_active_case), ('Инфаркт', True))
+
+        case.patient = second
+        case.save()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.summary_diagnosis, first.has_active_case), ('Диагноз 0', False))
+        self.assertEqual((second.summary_diagnosis, second.has_active_case), ('Инфаркт', True))
+
+    def test_unrelated_update_fields_skip_refresh(self):
+        patient = create_patient(self.doctor, records=1)
+        record = patient.medical_records.get()
+        record.notes = 'Заметка'
+        with CaptureQueriesContext(connection) as queries:
+            record.save(update_fields=['notes'])
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "patients_patient"')])
+
+    def test_cascade_delete_skips_summary(self):
+        for _ in range(3):
+            create_patient(self.doctor, records=3)
+
+        with CaptureQueriesContext(connection) as queries:
+            Patient.objects.all().delete()
+
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "patients_patient"')])
+
+
+class DashboardInvalidationTests(TestCase):
+    """Снимки статистики кабинета сбрасываются только у затронутых пользователей."""
+
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(name='Городская больница')
+        self.other_hospital = Hospital.objects.create(name='Областная больница')
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='hospital_admin', hospital=self.hospital
+        )
+        self.other_admin = User.objects.create_user(
+            username='other', email='other@example.com', password='x', role='hospital_admin',
+            hospital=self.other_hospital,
+        )
+        self.superadmin = User.objects.create_user(
+            username='super', email='super@example.com', password='x', role='superadmin'
+        )
+        self.patient = create_patient(self.doctor, hospital=self.hospital)
+        self.case = Case.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        self.case.doctors.add(self.doctor)
+        self.users = [self.doctor, self.admin, self.other_admin, self.superadmin]
+        for user in self.users:
+            dashboard.statistics(user)
+
+    def recomputed(self):
+        """Пользователи, чей снимок пересчитывается при следующей загрузке кабинета."""
+        stale = []
+        for user in self.users:
+            with CaptureQueriesContext(connection) as queries:
+                dashboard.statistics(user)
+            if queries:
+                stale.append(user.username)
+        return stale
+
+    def test_message_does_not_touch_admins(self):
+        CaseMessage.objects.create(case=self.case, author=self.doctor, content='Привет')
+        self.assertEqual(self.recomputed(), ['doctor'])
+
+    def test_patient_scoped_to_hospital(self):
+        create_patient(self.doctor, hospital=self.hospital)
+        self.assertEqual(self.recomputed(), ['admin', 'super'])
+        self.assertEqual(dashboard.statistics(self.admin)['total_patients'], 2)
+
+    def test_patient_moved_between_hospitals(self):
+        self.patient.hospital = self.other_hospital
+        self.patient.save()
+        self.assertEqual(self.recomputed(), ['admin', 'other', 'super'])
+
+        # Сохранение без смены больницы статистику администраторов не меняет
+        self.patient.first_name = 'Петр'
+        self.patient.save()
+        self.assertEqual(self.recomputed(), [])
+
+    def test_record_scoped_to_hospital(self):
+        MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, chief_complaint='Жалобы', diagnosis='I10',
+            visit_date=date(2025, 1, 1),
+        )
+        self.assertEqual(self.recomputed(), ['doctor', 'admin', 'super'])
+
+
+class BulkDeleteSignalTests(TestCase):
+    """Удаление queryset'ом: счетчики и снимки кабинета - не на каждую строку."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+
+    def create_patients(self, count):
+        for _ in range(count):
+            patient = create_patient(self.doctor, records=3)
+            PatientDoctorRelation.objects.create(patient=patient, doctor=self.doctor)
+            case = Case.objects.create(
+                patient=patient, created_by=self.doctor, diagnosis='J18', description='Описание',
+                admission_date=date(2025, 1, 1),
+            )
+            case.doctors.add(self.doctor)
+        counters.recount('patients')
+
+    def delete_queries(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.all().delete()
+        return len(queries)
+
+    def test_queries_do_not_depend_on_rows(self):
+        self.create_patients(2)
+        few = self.delete_queries()
+        self.create_patients(6)
+        self.assertEqual(self.delete_queries(), few)
+
+    def test_counter_adjusted_once(self):
+        self.create_patients(4)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.all().delete()
+
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "patients_globalcounter"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(counters.totals('patients'), {'patients': 0})
+        # Удаление одного объекта по-прежнему уменьшает счетчик сразу
+        create_patient(self.doctor).delete()
+        self.assertEqual(counters.totals('patients'), {'patients': 0})
+
+
+class ReadCursorTests(TestCase):
+    """Счетчики непрочитанных сообщений в курсорах чтения."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='x', role='doctor')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='x', role='doctor')
+        self.case = Case.objects.create(
+            patient=create_patient(self.author), created_by=self.author, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        self.case.doctors.add(self.author, self.reader)
+
+    def unread(self, user):
+        return CaseReadCursor.objects.get(case=self.case, user=user).unread_count
+
+    def post(self, count=1, author=None):
+        return [
+            CaseMessage.objects.create(case=self.case, author=author or self.author, content=f'Сообщение {i}')
+            for i in range(count)
+        ]
+
+    def test_new_message_increments_others(self):
+        self.post(2)
+        self.assertEqual(self.unread(self.reader), 2)
+        self.assertEqual(self.unread(self.author), 0)
+
+    def test_delete_decrements(self):
+        messages = self.post(3)
+        messages[0].delete()
+        self.assertEqual(self.unread(self.reader), 2)
+
+        CaseMessage.objects.filter(case=self.case).delete()
+        self.assertEqual(self.unread(self.reader), 0)
+
+    def test_cascade_delete_decrements(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x', role='doctor')
+        self.case.doctors.add(other)
+        self.post(2)
+        self.post(1, author=other)
+        self.assertEqual(self.unread(self.reader), 3)
+
+        # Сообщения удаляются каскадом вместе с автором
+        other.delete()
+        self.assertEqual(self.unread(self.reader), 2)
+
+    def test_delete_read_message_keeps_zero(self):
+        message, = self.post()
+        self.case.mark_read(self.reader)
+        message.delete()
+        self.assertEqual(self.unread(self.reader), 0)
+
+    def test_mark_read(self):
+        self.post(2)
+        self.case.mark_read(self.reader)
+        cursor = CaseReadCursor.objects.get(case=self.case, user=self.reader)
+        self.assertEqual(cursor.unread_count, 0)
+        self.assertIsNotNone(cursor.last_read_at)
+
+        self.post()
+        self.assertEqual(self.unread(self.reader), 1)
+
+    def test_added_doctor_gets_cursor(self):
+        self.post(2)
+        self.post(1, author=self.reader)
+        newcomer = User.objects.create_user(username='new', email='new@example.com', password='x', role='doctor')
+        self.case.doctors.add(newcomer)
+        self.assertEqual(self.unread(newcomer), 3)
+
+        # Добавление с обратной стороны связи
+        other = User.objects.create_user(username='other', email='other@example.com', password='x', role='doctor')
+        other.cases.add(self.case)
+        self.assertEqual(self.unread(other), 3)
+
+    def test_removed_doctor_loses_cursor(self):
+        self.case.doctors.remove(self.reader)
+        self.assertFalse(CaseReadCursor.objects.filter(user=self.reader).exists())
+
+        self.case.doctors.add(self.reader)
+        self.author.cases.remove(self.case)
+        self.assertEqual(list(CaseReadCursor.objects.filter(case=self.case).values_list('user', flat=True)), [self.reader.pk])
+
+    def test_clear_deletes_cursors(self):
+        self.reader.cases.clear()
+        self.assertEqual(list(CaseReadCursor.objects.filter(case=self.case).values_list('user', flat=True)), [self.author.pk])
+
+        self.case.doctors.clear()
+        self.assertFalse(CaseReadCursor.objects.filter(case=self.case).exists())
+
+
+class ReadCursorBackfillTests(TransactionTestCase):
+    """Миграция 0006 переносит флаги is_read в курсоры чтения."""
+
+    migrate_from = [('patients', '0005_patient_emias_lab_results_patient_emias_last_synced_and_more')]
+    migrate_to = [('patients', '0006_casereadcursor')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_backfill(self):
+        # Таблица пользователей миграциями patients не меняется: создаем текущей моделью
+        author = User.objects.create_user(username='author', email='author@example.com', password='x', role='doctor')
+        reader = User.objects.create_user(username='reader', email='reader@example.com', password='x', role='doctor')
+        apps = self.migrate(self.migrate_from)
+        Patient = apps.get_model('patients', 'Patient')
+        Case = apps.get_model('patients', 'Case')
+        CaseMessage = apps.get_model('patients', 'CaseMessage')
+
+        patient = Patient.objects.create(first_name='Иван', last_name='Иванов', date_of_birth=date(1980, 1, 1), gender='M')
+        case = Case.objects.create(
+            patient=patient, created_by_id=author.pk, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        case.doctors.add(author.pk, reader.pk)
+        CaseMessage.objects.create(case=case, author_id=author.pk, content='1', is_read=False)
+        CaseMessage.objects.create(case=case, author_id=author.pk, content='2', is_read=True)
+        CaseMessage.objects.create(case=case, author_id=reader.pk, content='3', is_read=False)
+
+        apps = self.migrate(self.migrate_to)
+        CaseReadCursor = apps.get_model('patients', 'CaseReadCursor')
+        self.assertEqual(
+            dict(CaseReadCursor.objects.values_list('user_id', 'unread_count')),
+            {author.pk: 1, reader.pk: 1},
+        )
+
+
+class PatientImporterTests(TestCase):
+    """Потоковый импорт пациентов из CSV и JSONL."""
+
+    CSV_HEADER = 'first_name,last_name,date_of_birth,gender,hospital_id,doctor_email,record_visit_date,record_chief_complaint,record_diagnosis\n'
+
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Городская больница')
+        self.other_hospital = Hospital.objects.create(name='Областная больница')
+        self.doctor = User.objects.create_user(
+            username='doctor', email='doctor@example.com', password='x', role='doctor', hospital=self.hospital
+        )
+
+    def run_import(self, text, fmt='csv', **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            return importer.import_patients(io.StringIO(text), fmt, **options)
+
+    def test_csv(self):
+        stats = self.run_import(
+            self.CSV_HEADER
+            + f'Иван,Иванов,1980-01-01,M,{self.hospital.pk},Doctor@Example.com,2025-01-01,Кашель,Пневмония\n'
+            + 'Анна,Петрова,1990-05-05,F,,,,,\n'
+        )
+        self.assertEqual((stats.rows, stats.patients, stats.records, stats.relations, stats.rejected), (2, 2, 1, 1, 0))
+        patient = Patient.objects.get(last_name='Иванов')
+        self.assertEqual(patient.hospital, self.hospital)
+        self.assertEqual(patient.summary_diagnosis, 'Пневмония')
+        self.assertTrue(PatientDoctorRelation.objects.filter(patient=patient, doctor=self.doctor, is_active=True).exists())
+        self.assertEqual(patient.medical_records.get().doctor, self.doctor)
+        self.assertFalse(Patient.objects.get(last_name='Петрова').medical_records.exists())
+
+    def test_jsonl(self):
+        rows = [
+            {
+                'first_name': 'Иван', 'last_name': 'Иванов', 'date_of_birth': '1980-01-01', 'gender': 'M',
+                'doctor_email': 'doctor@example.com',
+                'records': [
+                    {'visit_date': '2025-01-01', 'chief_complaint': 'Кашель', 'diagnosis': 'Бронхит'},
+                    {'visit_date': '2025-02-01', 'chief_complaint': 'Кашель', 'diagnosis': 'Пневмония'},
+                ],
+            },
+        ]
+        text = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows) + '\n\n{oops\n[1]\n'
+        stats = self.run_import(text, 'jsonl')
+        self.assertEqual((stats.rows, stats.patients, stats.records, stats.rejected), (3, 1, 2, 2))
+        self.assertEqual([line for line, _ in stats.rejects], [3, 4])
+        self.assertIn('Некорректный JSON', stats.rejects[0][1])
+        self.assertEqual(Patient.objects.get().summary_diagnosis, 'Пневмония')
+
+    def test_rejected_rows(self):
+        rows = [
+            'Иван,Иванов,не дата,M,,,,,',
+            'Иван,Иванов,1980-01-01,M,999,,,,',
+            'Иван,Иванов,1980-01-01,M,,nobody@example.com,,,',
+            'Иван,Иванов,1980-01-01,M,,,2025-01-01,,',
+        ]
+        stats = self.run_import(self.CSV_HEADER + '\n'.join(rows) + '\n')
+        self.assertEqual((stats.rows, stats.patients, stats.rejected), (4, 0, 4))
+        self.assertEqual([line for line, _ in stats.rejects], [2, 3, 4, 5])
+        self.assertIn('hospital_id', stats.rejects[1][1])
+        self.assertIn('doctor_email', stats.rejects[2][1])
+        self.assertIn('Карточка', stats.rejects[3][1])
+
+    def test_doctor_email_requires_doctor(self):
+        admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='x', role='hospital_admin', hospital=self.hospital
+        )
+        stats = self.run_import(self.CSV_HEADER + f'Иван,Иванов,1980-01-01,M,,{admin.email},,,\n')
+        self.assertEqual((stats.patients, stats.rejected), (0, 1))
+        self.assertIn('doctor_email', stats.rejects[0][1])
+
+    def test_hospital_restricts_rows_and_doctors(self):
+        User.objects.create_user(
+            username='far', email='far@example.com', password='x', role='doctor', hospital=self.other_hospital
+        )
+        rows = [
+            'Иван,Иванов,1980-01-01,M,,doctor@example.com,,,',
+            f'Иван,Иванов,1980-01-01,M,{self.other_hospital.pk},,,,',
+            'Иван,Иванов,1980-01-01,M,,far@example.com,,,',
+        ]
+        stats = self.run_import(self.CSV_HEADER + '\n'.join(rows) + '\n', hospital=self.hospital)
+        self.assertEqual((stats.patients, stats.rejected), (1, 2))
+        self.assertIn('своей больницы', stats.rejects[0][1])
+        self.assertIn('far@example.com', stats.rejects[1][1])
+        self.assertEqual(Patient.objects.get().hospital, self.hospital)
+
+    def test_batches(self):
+        rows = [f'Иван,Иванов{i},1980-01-01,M,,,,,' for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            stats = self.run_import(self.CSV_HEADER + '\n'.join(rows) + '\n', batch_size=2)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "patients_patient"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(stats.patients, 5)
+
+    def test_side_effects(self):
+        counters.recount('patients')
+        cache.clear()
+        dashboard.statistics(self.doctor)
+        stats = self.run_import(
+            self.CSV_HEADER + 'Иван,Иванов,1980-01-01,M,,doctor@example.com,2025-01-01,Кашель,Пневмония\n'
+        )
+        self.assertEqual(counters.totals('patients'), {'patients': 1})
+        self.assertEqual(dashboard.statistics(self.doctor)['total_patients'], 1)
+        self.assertTrue(stats.summary().startswith('Строк: 1, пациентов: 1, карточек: 1, связей с врачами: 1, отклонено: 0'))
+
+
+class ReactionCountTests(TestCase):
+    """Счетчики реакций сообщения поддерживаются сигналами MessageReaction."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='x', role='doctor')
+        case = Case.objects.create(
+            patient=create_patient(self.doctor), created_by=self.doctor, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        self.message = CaseMessage.objects.create(case=case, author=self.doctor, content='Привет')
+
+    def counts(self):
+        self.message.refresh_from_db()
+        return self.message.likes_count, self.message.dislikes_count
+
+    def test_add_and_delete(self):
+        like = MessageReaction.objects.create(message=self.message, user=self.doctor, reaction='👍')
+        MessageReaction.objects.create(message=self.message, user=self.other, reaction='👍')
+        MessageReaction.objects.create(message=self.message, user=self.other, reaction='👎')
+        self.assertEqual(self.counts(), (2, 1))
+
+        like.delete()
+        self.assertEqual(self.counts(), (1, 1))
+
+        MessageReaction.objects.filter(user=self.other).delete()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_switch(self):
+        reaction = MessageReaction.objects.create(message=self.message, user=self.doctor, reaction='👍')
+        reaction.reaction = '👎'
+        reaction.save()
+        self.assertEqual(self.counts(), (0, 1))
+
+        # Повторное сохранение без смены типа счетчики не меняет
+        reaction.save()
+        self.assertEqual(self.counts(), (0, 1))
+
+    def test_user_delete_cascade(self):
+        MessageReaction.objects.create(message=self.message, user=self.doctor, reaction='👍')
+        MessageReaction.objects.create(message=self.message, user=self.other, reaction='👍')
+        self.other.delete()
+        self.assertEqual(self.counts(), (1, 0))
+
+
+class ConditionalGetTests(TestCase):
+    """ETag / Last-Modified API пациентов и карточек."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.hospital = Hospital.objects.create(name='Городская больница')
+        self.patient = create_patient(self.doctor, records=3, hospital=self.hospital)
+        PatientDoctorRelation.objects.create(patient=self.patient, doctor=self.doctor)
+        self.client.force_login(self.doctor)
+        self.list_url = reverse('patients:patient-list-create')
+        self.detail_url = reverse('patients:patient-detail', args=[self.patient.pk])
+
+    def etag(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_unchanged_returns_304(self):
+        for url in (self.list_url, self.detail_url):
+            self.assertNotModified(url, self.etag(url))
+
+        record_url = reverse('patients:record-detail', args=[self.patient.medical_records.first().pk])
+        response = self.client.get(record_url)
+        response = self.client.get(record_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_child_update_returns_200(self):
+        etag = self.etag(self.detail_url)
+        record = self.patient.medical_records.order_by('visit_date').first()
+        record.diagnosis = 'Пневмония'
+        record.save()
+
+        response = self.assertModified(self.detail_url, etag)
+        self.assertIn('Пневмония', [item['diagnosis'] for item in response.json()['medical_records']])
+
+    def test_child_delete_returns_200(self):
+        etag = self.etag(self.detail_url)
+        # Не самая новая карточка: максимальный updated_at не меняется
+        self.patient.medical_records.order_by('updated_at').first().delete()
+
+        response = self.assertModified(self.detail_url, etag)
+        self.assertEqual(len(response.json()['medical_records']), 2)
+
+    def test_related_row_change_returns_200(self):
+        etags = {url: self.etag(url) for url in (self.list_url, self.detail_url)}
+        self.hospital.name = 'Областная больница'
+        self.hospital.save()
+
+        for url, etag in etags.items():
+            response = self.assertModified(url, etag)
+            self.assertIn('Областная больница', response.content.decode())
+
+    def test_etag_depends_on_representation_params(self):
+        etag = self.etag(self.detail_url)
+        self.assertNotEqual(self.etag(self.detail_url, fields='id,full_name'), etag)
+        # Следующая страница вложенных карточек - другое тело при тех же строках
+        MedicalRecord.objects.bulk_create([
+            MedicalRecord(patient=self.patient, doctor=self.doctor, chief_complaint='Жалобы', visit_date=date(2024, 1, 1))
+            for _ in range(20)
+        ])
+        response = self.client.get(self.detail_url)
+        next_response = self.client.get(response.json()['medical_records_next'])
+        self.assertEqual(next_response.status_code, 200)
+        self.assertNotEqual(next_response['ETag'], response['ETag'])
+        self.assertNotEqual(self.etag(self.list_url, ordering='-created_at'), self.etag(self.list_url))
+        # Порядок и пробелы в fields не меняют представление
+        self.assertEqual(self.etag(self.list_url, fields='id,full_name'), self.etag(self.list_url, fields='full_name, id'))
+
+    def test_doctor_change_invalidates(self):
+        record = self.patient.medical_records.first()
+        for url in (self.detail_url, reverse('patients:record-list-create'), reverse('patients:record-detail', args=[record.pk])):
+            etag = self.etag(url)
+            self.doctor.email = f'doctor{self.doctor.updated_at.timestamp()}@example.com'
+            self.doctor.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn(self.doctor.email, response.content.decode())
+
+
+class SparseFieldsTests(TestCase):
+    """Параметры fields/expand API пациентов и карточек."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.hospital = Hospital.objects.create(name='Городская больница')
+        self.patient = self.create_treated(records=25, phone='+7 900 000-00-00')
+        self.client.force_login(self.doctor)
+        self.list_url = reverse('patients:patient-list-create')
+        self.detail_url = reverse('patients:patient-detail', args=[self.patient.pk])
+
+    def create_treated(self, records=0, **fields):
+        patient = create_patient(self.doctor, records=records, hospital=self.hospital, **fields)
+        PatientDoctorRelation.objects.create(patient=patient, doctor=self.doctor)
+        return patient
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_unknown_field_returns_400(self):
+        for url, params in (
+            (self.list_url, {'fields': 'id,nope'}),
+            (self.detail_url, {'fields': 'medical_records.nope'}),
+            (self.list_url, {'expand': 'nope'}),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.json())
+
+    def test_nested_selection(self):
+        data = self.get(self.detail_url, fields='id,full_name,medical_records.diagnosis')
+        self.assertEqual(set(data), {'id', 'full_name', 'medical_records'})
+        self.assertEqual(data['full_name'], self.patient.full_name)
+        self.assertEqual({frozenset(item) for item in data['medical_records']}, {frozenset({'diagnosis'})})
+
+        data = self.get(self.detail_url, fields='id,medical_records.doctor', expand='hospital,medical_records.doctor')
+        self.assertEqual(data['medical_records'][0]['doctor']['email'], self.doctor.email)
+
+    def test_embedded_records_pages(self):
+        data = self.get(self.detail_url)
+        self.assertEqual(len(data['medical_records']), 20)
+        dates = [item['visit_date'] for item in data['medical_records']]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertIn('records_cursor=', data['medical_records_next'])
+
+        rest = self.get(data['medical_records_next'])
+        self.assertEqual(len(rest['medical_records']), 5)
+        self.assertIsNone(rest['medical_records_next'])
+        ids = [item['id'] for item in data['medical_records'] + rest['medical_records']]
+        self.assertCountEqual(ids, self.patient.medical_records.values_list('id', flat=True))
+
+        response = self.client.get(self.detail_url, {'records_cursor': 'bad'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_query_shaping(self):
+        def queries(url, **params):
+            with CaptureQueriesContext(connection) as captured:
+                self.get(url, **params)
+            return captured.captured_queries
+
+        selected = queries(self.list_url, fields='id,full_name')
+        patient_select = [q['sql'] for q in selected if q['sql'].startswith('SELECT "patients_patient"."id"')][-1]
+        self.assertNotIn('"phone"', patient_select)
+
+        # Связи - тем же запросом, число запросов не зависит от числа строк
+        records_url = reverse('patients:record-list-create')
+        few = len(queries(records_url, expand='patient,doctor'))
+        for _ in range(3):
+            self.create_treated(records=2)
+        self.assertEqual(len(queries(records_url, expand='patient,doctor')), few)
+        self.assertEqual(len(queries(self.list_url, expand='hospital')), len(queries(self.list_url)))
+
+    def test_write_ignores_fields(self):
+        response = self.client.patch(
+            f'{self.detail_url}?fields=id', {'first_name': 'Петр'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['phone'], '+7 900 000-00-00')
+
+        payload = {'first_name': 'Петр', 'last_name': 'Петров', 'date_of_birth': '1980-01-01', 'gender': 'M'}
+        response = self.client.put(f'{self.detail_url}?fields=id', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['last_name'], 'Петров')
+
+        self.patient.refresh_from_db()
+        self.assertEqual((self.patient.first_name, self.patient.last_name), ('Петр', 'Петров'))
+        self.assertEqual(self.patient.phone, '+7 900 000-00-00')
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск базы знаний: стеммер и обновление индекса сигналами."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.patient = create_patient(self.doctor, last_name='Смирнов')
+
+    def create_case(self, diagnosis):
+        return Case.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis=diagnosis, description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+
+    def test_stem_inflections(self):
+        for words in (('пневмония', 'пневмонии', 'пневмонией', 'пневмонию'), ('инфаркт', 'инфаркта', 'инфарктом')):
+            self.assertEqual({search.stem(word) for word in words}, {search.stem(words[0])}, words)
+        self.assertEqual(search.tokenize('Пневмония, J18.9'), ['пневмон', 'j18', '9'])
+
+    def test_known_stems(self):
+        # Основы из эталонного словаря алгоритма Snowball для русского языка
+        stems = {
+            'пневмонией': 'пневмон',
+            'миокарда': 'миокард',
+            'хронического': 'хроническ',
+            'обострением': 'обострен',
+            'кровообращения': 'кровообращен',
+            'недостаточностью': 'недостаточн',
+            'госпитализированного': 'госпитализирова',
+            'сердечной': 'сердечн',
+            'Ёлкин': 'елкин',
+        }
+        self.assertEqual({word: search.stem(word) for word in stems}, stems)
+
+    def test_found_after_create_and_edit(self):
+        case = self.create_case('Внебольничная пневмония')
+        self.assertEqual(search.search_cases('пневмонией'), [case.pk])
+
+        case.diagnosis = 'Инфаркт миокарда'
+        case.save()
+        self.assertEqual(search.search_cases('пневмония'), [])
+        self.assertEqual(search.search_cases('инфарктом'), [case.pk])
+
+        # ФИО пациента входит в индекс его консилиумов
+        self.patient.last_name = 'Кузнецов'
+        self.patient.save()
+        self.assertEqual(search.search_cases('Кузнецов'), [case.pk])
+        self.assertEqual(search.search_cases('смирнов'), [])
+
+    def test_not_found_after_delete(self):
+        case = self.create_case('Пневмония')
+        other = self.create_case('Пневмония')
+        case.delete()
+        self.assertEqual(search.search_cases('пневмония'), [other.pk])
+
+        Patient.objects.all().delete()
+        self.assertEqual(search.search_cases('пневмония'), [])
+
+
+class SearchIndexMigrationTests(TransactionTestCase):
+    """Миграция 0007 создает индекс и заполняет его существующими консилиумами."""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_backfill(self):
+        doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        apps = self.migrate([('patients', '0006_casereadcursor')])
+        Patient = apps.get_model('patients', 'Patient')
+        Case = apps.get_model('patients', 'Case')
+        patient = Patient.objects.create(first_name='Иван', last_name='Смирнов', date_of_birth=date(1980, 1, 1), gender='M')
+        case = Case.objects.create(
+            patient=patient, created_by_id=doctor.pk, diagnosis='Внебольничная пневмония', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+
+        self.migrate([('patients', '0007_case_search_index')])
+
+        self.assertEqual(search.search_cases('пневмонией'), [case.pk])
+        self.assertEqual(search.search_cases('Смирнов'), [case.pk])
+
+
+class FakeEmiasClient:
+    """Клиент ЕМИАС с ответами из payloads: {id пациента: данные, NOT_MODIFIED или None}."""
+
+    payloads = {}
+    # Если задано, запросы ждут его (проверка повторного запуска schedule_sync)
+    gate = None
+
+    async def fetch_patient(self, patient_id, since=None):
+        if self.gate is not None:
+            await asyncio.to_thread(self.gate.wait, 5)
+        return self.payloads.get(patient_id)
+
+
+class EmiasSyncTests(TestCase):
+    """sync_patients через HttpEmiasClient и заглушку ЕМИАС."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.patients = [create_patient(self.doctor) for _ in range(5)]
+        # Пациенты с id, кратным 3, неизвестны ЕМИАС
+        self.server = emias_stub.make_server(port=0, missing_every=3)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.emias_client = emias.HttpEmiasClient(f'http://{host}:{port}', timeout=5)
+
+    def sync(self, **kwargs):
+        kwargs.setdefault('batch_size', 2)
+        return emias.sync_patients(client=self.emias_client, concurrency=2, **kwargs)
+
+    def test_sync_and_not_modified(self):
+        missing = [patient.pk for patient in self.patients if patient.pk % 3 == 0]
+        with CaptureQueriesContext(connection) as queries:
+            stats = self.sync()
+        self.assertEqual((stats.updated, stats.missing, stats.failed), (5 - len(missing), len(missing), 0))
+        # Пачки по 2 пациента: на пачку не больше двух UPDATE (bulk_update по наборам полей)
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "patients_patient"')]
+        self.assertLessEqual(len(updates), 2 * 3)
+
+        for patient in Patient.objects.all():
+            self.assertIsNotNone(patient.emias_last_synced)
+            found = patient.pk not in missing
+            self.assertEqual(set(patient.get_last_lab_results()), set(emias_stub.ANALYTES) if found else set())
+
+        # Недавно синхронизированные пропускаются, принудительно - 304 по since
+        self.assertEqual(self.sync().total, 0)
+        stats = self.sync(stale_after=timedelta(0))
+        self.assertEqual((stats.unchanged, stats.missing, stats.updated), (5 - len(missing), len(missing), 0))
+
+    def test_batches_cover_all_patients(self):
+        stats = self.sync(queryset=Patient.objects.filter(pk__in=[p.pk for p in self.patients[1:]]), batch_size=1)
+        self.assertEqual(stats.total, 4)
+        self.assertEqual(Patient.objects.filter(emias_last_synced__isnull=True).get(), self.patients[0])
+
+    def test_lab_results_upserted(self):
+        patient = self.patients[0]
+        taken_at = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+        def payload(value):
+            return {
+                'lab_results': {'Глюкоза': {'value': value, 'unit': 'ммоль/л', 'taken_at': taken_at.isoformat()}},
+                'last_hospitalization': 'Терапевтическое отделение',
+            }
+
+        client = FakeEmiasClient()
+        client.payloads = {patient.pk: payload(5.5)}
+        queryset = Patient.objects.filter(pk=patient.pk)
+        emias.sync_patients(queryset, client=client)
+        client.payloads = {patient.pk: payload('6,1')}
+        emias.sync_patients(queryset, client=client, stale_after=timedelta(0))
+
+        result = LabResult.objects.get(patient=patient)
+        self.assertEqual((result.analyte, result.value, result.taken_at), ('Глюкоза', 6.1, taken_at))
+        patient.refresh_from_db()
+        self.assertEqual(patient.last_hospitalization, 'Терапевтическое отделение')
+
+
+@override_settings(EMIAS_CLIENT='patients.tests.FakeEmiasClient')
+class EmiasScheduleTests(TransactionTestCase):
+    """schedule_sync: фоновый поток и защита от повторного запуска."""
+
+    def test_schedule_once(self):
+        patient = Patient.objects.create(first_name='Иван', last_name='Иванов', date_of_birth=date(1980, 1, 1), gender='M')
+        FakeEmiasClient.payloads = {patient.pk: {'last_hospitalization': 'Хирургия'}}
+        FakeEmiasClient.gate = threading.Event()
+        self.addCleanup(setattr, FakeEmiasClient, 'payloads', {})
+        self.addCleanup(setattr, FakeEmiasClient, 'gate', None)
+
+        future = emias.schedule_sync([patient.pk])
+        self.assertIsNone(emias.schedule_sync([patient.pk]))
+        FakeEmiasClient.gate.set()
+        self.assertEqual(future.result(timeout=10).updated, 1)
+
+        patient.refresh_from_db()
+        self.assertEqual(patient.last_hospitalization, 'Хирургия')
+        # Завершенная синхронизация снова может быть запланирована
+        self.assertIsNotNone(emias.schedule_sync([patient.pk]).result(timeout=10))
+
+
+class KnowledgeBaseEntryTests(TestCase):
+    """Запись базы знаний завершенного консилиума."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        self.case = Case.objects.create(
+            patient=create_patient(self.doctor), created_by=self.doctor, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1), status='stable',
+        )
+        self.completed_at = datetime(2025, 1, 10, tzinfo=dt_timezone.utc)
+        KnowledgeBaseEntry.objects.filter(case=self.case).update(completed_at=self.completed_at)
+
+    def entry(self):
+        return KnowledgeBaseEntry.objects.get(case=self.case)
+
+    def test_completion_creates_entry(self):
+        case = Case.objects.create(
+            patient=self.case.patient, created_by=self.doctor, diagnosis='I21', description='Описание',
+            admission_date=date(2025, 3, 1),
+        )
+        self.assertFalse(KnowledgeBaseEntry.objects.filter(case=case).exists())
+
+        case.status = 'stable'
+        case.save()
+        entry = KnowledgeBaseEntry.objects.get(case=case)
+        self.assertEqual(entry.admission_date, date(2025, 3, 1))
+        self.assertIsNotNone(entry.completed_at)
+
+    def test_new_message_updates_entry(self):
+        message = CaseMessage.objects.create(case=self.case, author=self.doctor, content='Выписка')
+
+        entry = self.entry()
+        self.assertEqual(entry.messages_count, 1)
+        self.assertEqual(entry.decision, 'Выписка')
+        self.assertEqual(entry.first_message_at, message.created_at)
+        self.assertEqual(entry.last_message_at, message.created_at)
+
+    def test_rebuild_keeps_completed_at(self):
+        other = User.objects.create_user(
+            username='other', email='other@example.com', password='x', role='doctor', specialty='Кардиолог'
+        )
+        # Смена участников пересобирает запись (сигнал m2m_changed)
+        self.case.doctors.add(other)
+        KnowledgeBaseEntry.build(self.case)
+
+        entry = self.entry()
+        self.assertEqual(entry.specialties, ['Кардиолог'])
+        self.assertEqual(entry.completed_at, self.completed_at)
+
+    def test_edit_after_completion(self):
+        patient = create_patient(self.doctor, last_name='Петров')
+        MedicalRecord.objects.create(
+            patient=patient, doctor=self.doctor, chief_complaint='Жалобы', diagnosis='I10',
+            chronic_diseases='Гипертония, Диабет', visit_date=date(2025, 1, 1),
+        )
+        self.case.patient = patient
+        self.case.admission_date = date(2025, 2, 1)
+        self.case.save()
+
+        entry = self.entry()
+        self.assertEqual(entry.admission_date, date(2025, 2, 1))
+        self.assertEqual(entry.comorbidities, ['Гипертония', 'Диабет'])
+        self.assertEqual(entry.completed_at, self.completed_at)
+
+    def test_medical_record_changes_comorbidities(self):
+        record = MedicalRecord.objects.create(
+            patient=self.case.patient, doctor=self.doctor, chief_complaint='Жалобы', diagnosis='I10',
+            chronic_diseases='Гипертония', visit_date=date(2025, 1, 1),
+        )
+        self.assertEqual(self.entry().comorbidities, ['Гипертония'])
+
+        record.chronic_diseases = 'Астма'
+        record.save()
+        self.assertEqual(self.entry().comorbidities, ['Астма'])
+
+        record.delete()
+        self.assertEqual(self.entry().comorbidities, [])
+
+    def test_message_edit_and_delete_change_decision(self):
+        first = CaseMessage.objects.create(case=self.case, author=self.doctor, content='Наблюдение')
+        last = CaseMessage.objects.create(case=self.case, author=self.doctor, content='Выписка')
+        self.assertEqual(self.entry().decision, 'Выписка')
+        self.assertEqual(self.entry().messages_count, 2)
+
+        last.content = 'Перевод в кардиологию'
+        last.save()
+        self.assertEqual(self.entry().decision, 'Перевод в кардиологию')
+
+        last.delete()
+        entry = self.entry()
+        self.assertEqual(entry.decision, 'Наблюдение')
+        self.assertEqual(entry.messages_count, 1)
+        self.assertEqual(entry.last_message_at, first.created_at)
+
+    def test_reopen_removes_entry(self):
+        self.case.status = 'active'
+        self.case.save()
+        self.assertFalse(KnowledgeBaseEntry.objects.filter(case=self.case).exists())
+
+
+class RealtimeTests(TestCase):
+    """WebSocket канал консилиума: доступ, публикация и подтверждение прочтения."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(
+            username='doctor', email='doctor@example.com', password='x', role='doctor',
+            first_name='Петр', last_name='Петров', specialty='Терапевт',
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='x', role='doctor')
+        self.case = Case.objects.create(
+            patient=create_patient(self.doctor), created_by=self.doctor, diagnosis='J18', description='Описание',
+            admission_date=date(2025, 1, 1),
+        )
+        self.case.doctors.add(self.doctor, self.other)
+
+    def headers(self, user=None, origin=None):
+        headers = [(b'host', b'testserver')]
+        if user is not None:
+            self.client.force_login(user)
+            headers.append((b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode()))
+        if origin is not None:
+            headers.append((b'origin', origin.encode()))
+        return headers
+
+    def connect(self, headers, frames=(), path=None):
+        """Прогнать подключение: connect, кадры клиента, disconnect. Возвращает отправленное сервером."""
+        incoming = [{'type': 'websocket.connect'}]
+        incoming += [{'type': 'websocket.receive', 'text': json.dumps(frame)} for frame in frames]
+        incoming.append({'type': 'websocket.disconnect', 'code': 1000})
+        sent = []
+
+        async def receive():
+            await asyncio.sleep(0)
+            return incoming.pop(0)
+
+        async def send(event):
+            sent.append(event)
+
+        scope = {'type': 'websocket', 'path': path or f'/ws/cases/{self.case.pk}/', 'headers': headers}
+        async_to_sync(realtime.case_socket)(scope, receive, send)
+        return sent
+
+    def test_message_payload(self):
+        message = CaseMessage.objects.create(case=self.case, author=self.doctor, content='Привет')
+        payload = realtime.message_payload(message, 'active')
+        self.assertEqual(payload['id'], message.id)
+        self.assertEqual(payload['author_id'], self.doctor.id)
+        self.assertEqual(payload['author_name'], self.doctor.get_full_name())
+        self.assertEqual(payload['content'], 'Привет')
+        self.assertEqual(payload['created_at'], message.created_at.isoformat())
+        # Завершенный консилиум анонимизирован: вместо имени - специальность
+        self.assertEqual(realtime.message_payload(message, 'stable')['author_name'], 'Терапевт')
+
+    def test_new_message_published_on_commit(self):
+        with mock.patch('patients.signals.publish_case_event') as publish, \
+                mock.patch.object(realtime.broker, 'has_subscribers', return_value=True):
+            with self.captureOnCommitCallbacks() as callbacks:
+                message = CaseMessage.objects.create(case=self.case, author=self.doctor, content='Привет')
+            # До коммита событие не уходит
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        publish.assert_called_once_with(
+            self.case.pk, {'type': 'message', 'message': realtime.message_payload(message, 'active')}
+        )
+
+    def test_no_subscribers_no_publish(self):
+        with mock.patch('patients.signals.publish_case_event') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            CaseMessage.objects.create(case=self.case, author=self.doctor, content='Привет')
+        publish.assert_not_called()
+
+    def test_accepts_participant(self):
+        sent = self.connect(self.headers(self.doctor, origin='http://testserver'))
+        self.assertEqual(sent[0], {'type': 'websocket.accept'})
+        self.assertEqual(json.loads(sent[1]['text']), {'type': 'presence.snapshot', 'online': [self.doctor.pk]})
+        self.assertFalse(realtime.broker.has_subscribers())
+
+    def test_rejects_foreign_origin(self):
+        sent = self.connect(self.headers(self.doctor, origin='http://evil.example'))
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_rejects_anonymous(self):
+        self.assertEqual(self.connect(self.headers()), [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_rejects_non_participant(self):
+        stranger = User.objects.create_user(username='stranger', email='s@example.com', password='x', role='doctor')
+        self.assertEqual(self.connect(self.headers(stranger)), [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_unknown_path(self):
+        sent = self.connect(self.headers(self.doctor), path='/ws/other/')
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4404}])
+
+    def test_read_ack_moves_cursor(self):
+        CaseMessage.objects.create(case=self.case, author=self.other, content='Привет')
+        cursor = CaseReadCursor.objects.get(case=self.case, user=self.doctor)
+        self.assertEqual(cursor.unread_count, 1)
+
+        self.connect(self.headers(self.doctor), frames=[{'type': 'ping'}, {'type': 'read'}])
+
+        cursor.refresh_from_db()
+        self.assertEqual(cursor.unread_count, 0)
+        self.assertIsNotNone(cursor.last_read_at)
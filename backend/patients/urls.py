@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
     cabinet_view,
+    patient_lab_trend_view, rising_lab_results_view,
     PatientListCreateView, PatientDetailView,
     MedicalRecordListCreateView, MedicalRecordDetailView
 )
@@ -11,6 +12,8 @@ urlpatterns = [
     path('cabinet/', cabinet_view, name='cabinet'),
     path('patients/', PatientListCreateView.as_view(), name='patient-list-create'),
     path('patients/<int:pk>/', PatientDetailView.as_view(), name='patient-detail'),
+    path('patients/<int:pk>/labs/', patient_lab_trend_view, name='patient-lab-trend'),
+    path('labs/rising/', rising_lab_results_view, name='lab-rising'),
     path('records/', MedicalRecordListCreateView.as_view(), name='record-list-create'),
     path('records/<int:pk>/', MedicalRecordDetailView.as_view(), name='record-detail'),
 ]
@@ -3,34 +3,17 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.db.models import Q
-from .models import Patient, MedicalRecord, PatientDoctorRelation
+from django.utils import timezone
+from datetime import timedelta
+from . import access, dashboard, labs
+from .conditional import ConditionalGetMixin
+from .models import PatientDoctorRelation
+from .pagination import KeysetPagination
 from .serializers import (
     PatientSerializer, PatientWithRecordsSerializer,
     MedicalRecordSerializer, MedicalRecordDetailSerializer
 )
-
-
-def get_patient_queryset(user):
-    """Получить queryset пациентов в зависимости от роли пользователя."""
-    if user.role == 'superadmin':
-        return Patient.objects.all()
-    elif user.role == 'hospital_admin':
-        return Patient.objects.filter(hospital=user.hospital)
-    else:  # doctor
-        return Patient.objects.filter(
-            treating_doctors__doctor=user,
-            treating_doctors__is_active=True
-        ).distinct()
-
-
-def get_medical_record_queryset(user):
-    """Получить queryset медицинских карточек в зависимости от роли пользователя."""
-    if user.role == 'superadmin':
-        return MedicalRecord.objects.all()
-    elif user.role == 'hospital_admin':
-        return MedicalRecord.objects.filter(patient__hospital=user.hospital)
-    else:  # doctor
-        return MedicalRecord.objects.filter(doctor=user)
+from .sparse import SparseQuerysetMixin
 
 
 @api_view(['GET'])
@@ -39,40 +22,90 @@ def cabinet_view(request):
     """Кабинет врача - статистика и последние записи."""
     user = request.user
     
-    patients_queryset = get_patient_queryset(user)
-    records_queryset = get_medical_record_queryset(user)
-    
-    # Статистика
-    total_patients = patients_queryset.count()
-    total_records = records_queryset.count()
+    patients_queryset = access.patients_for(user)
+    records_queryset = access.records_for(user)
     
     # Последние 5 пациентов
-    recent_patients = patients_queryset[:5]
+    recent_patients = patients_queryset.select_related('hospital')[:5]
     recent_patients_data = PatientSerializer(recent_patients, many=True).data
     
     # Последние 5 карточек
-    recent_records = records_queryset[:5]
+    recent_records = records_queryset.select_related('patient', 'doctor')[:5]
     recent_records_data = MedicalRecordSerializer(recent_records, many=True).data
     
     return Response({
-        'statistics': {
-            'total_patients': total_patients,
-            'total_records': total_records,
-        },
+        'statistics': dashboard.statistics(user),
         'recent_patients': recent_patients_data,
         'recent_records': recent_records_data,
     })
 
 
-class PatientListCreateView(generics.ListCreateAPIView):
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def patient_lab_trend_view(request, pk):
+    """Динамика лабораторного показателя пациента.
+    
+    Без параметра analyte возвращает список показателей пациента.
+    """
+    if not access.for_request(request).can_view_patient(pk):
+        return Response({'detail': 'Пациент не найден.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    analyte = request.query_params.get('analyte')
+    if not analyte:
+        return Response({'analytes': labs.analytes(pk)})
+    
+    since = None
+    days = request.query_params.get('days')
+    if days:
+        try:
+            since = timezone.now() - timedelta(days=int(days))
+        except ValueError:
+            return Response({'detail': 'days должен быть числом.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    points = [
+        {'taken_at': taken_at, 'value': value, 'value_text': value_text or None}
+        for taken_at, value, value_text in labs.trend(pk, analyte, since)
+    ]
+    return Response({'analyte': analyte, 'points': points})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def rising_lab_results_view(request):
+    """Пациенты, у которых показатель вырос за период (по умолчанию 90 дней)."""
+    analyte = request.query_params.get('analyte')
+    if not analyte:
+        return Response({'detail': 'Укажите analyte.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        days = int(request.query_params.get('days', 90))
+    except ValueError:
+        return Response({'detail': 'days должен быть числом.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rows = labs.rising(analyte, days=days, patients=access.patients_for(request.user))
+    return Response({'analyte': analyte, 'days': days, 'results': list(rows[:500])})
+
+
+class PatientListCreateView(ConditionalGetMixin, SparseQuerysetMixin, generics.ListCreateAPIView):
     """API endpoint for listing and creating patients."""
     
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    conditional_timestamps = ('updated_at', 'hospital__updated_at')
+    conditional_counts = ('pk',)
+    
+    # Допустимые сортировки (параметр ordering); id в конце делает порядок однозначным
+    keyset_orderings = {
+        'last_name': ('last_name', 'first_name', 'id'),
+        '-last_name': ('-last_name', '-first_name', '-id'),
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+    }
+    keyset_default_ordering = 'last_name'
     
     def get_queryset(self):
         user = self.request.user
-        queryset = get_patient_queryset(user)
+        queryset = access.patients_for(user)
         
         # Поиск
         search = self.request.query_params.get('search', None)
@@ -85,12 +118,8 @@ class PatientListCreateView(generics.ListCreateAPIView):
                 Q(email__icontains=search)
             )
         
-        # Сортировка
-        ordering = self.request.query_params.get('ordering', None)
-        if ordering:
-            queryset = queryset.order_by(ordering)
-        
-        return queryset
+        # Сортировку применяет KeysetPagination, связи и колонки - по полям ответа
+        return self.shape_queryset(queryset)
     
     def perform_create(self, serializer):
         patient = serializer.save()
@@ -102,48 +131,67 @@ class PatientListCreateView(generics.ListCreateAPIView):
         )
 
 
-class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PatientDetailView(ConditionalGetMixin, SparseQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint for patient detail, update and delete."""
     
     serializer_class = PatientWithRecordsSerializer
     permission_classes = [IsAuthenticated]
+    conditional_timestamps = (
+        'updated_at', 'hospital__updated_at', 'medical_records__updated_at',
+        'medical_records__doctor__updated_at', 'medical_records__doctor__hospital__updated_at',
+    )
+    # Врачи: удаление врача обнуляет doctor карточек без изменения их updated_at
+    conditional_counts = ('medical_records', 'medical_records__doctor')
     
     def get_queryset(self):
-        return get_patient_queryset(self.request.user)
+        return self.shape_queryset(access.patients_for(self.request.user))
 
 
-class MedicalRecordListCreateView(generics.ListCreateAPIView):
+class MedicalRecordListCreateView(ConditionalGetMixin, SparseQuerysetMixin, generics.ListCreateAPIView):
     """API endpoint for listing and creating medical records."""
     
     serializer_class = MedicalRecordSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    conditional_timestamps = (
+        'updated_at', 'patient__updated_at', 'patient__hospital__updated_at',
+        'doctor__updated_at', 'doctor__hospital__updated_at',
+    )
+    # Врачи: удаление врача обнуляет doctor карточек без изменения их updated_at
+    conditional_counts = ('pk', 'doctor')
+    
+    keyset_orderings = {
+        'visit_date': ('visit_date', 'id'),
+        '-visit_date': ('-visit_date', '-id'),
+    }
+    keyset_default_ordering = '-visit_date'
     
     def get_queryset(self):
         user = self.request.user
-        queryset = get_medical_record_queryset(user)
+        queryset = access.records_for(user)
         
         # Фильтр по пациенту
         patient_id = self.request.query_params.get('patient', None)
         if patient_id:
             queryset = queryset.filter(patient_id=patient_id)
         
-        # Сортировка
-        ordering = self.request.query_params.get('ordering', '-visit_date')
-        if ordering:
-            queryset = queryset.order_by(ordering)
-        
-        return queryset
+        # Сортировку применяет KeysetPagination, связи и колонки - по полям ответа
+        return self.shape_queryset(queryset)
     
     def perform_create(self, serializer):
         # Автоматически устанавливаем врача
         serializer.save(doctor=self.request.user)
 
 
-class MedicalRecordDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MedicalRecordDetailView(ConditionalGetMixin, SparseQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     """API endpoint for medical record detail, update and delete."""
     
     serializer_class = MedicalRecordDetailSerializer
     permission_classes = [IsAuthenticated]
+    conditional_timestamps = (
+        'updated_at', 'patient__updated_at', 'patient__hospital__updated_at',
+        'doctor__updated_at', 'doctor__hospital__updated_at',
+    )
     
     def get_queryset(self):
-        return get_medical_record_queryset(self.request.user)
+        return self.shape_queryset(access.records_for(self.request.user))